@@ -0,0 +1,179 @@
+# accounts/activity.py
+"""
+Activity event log.
+
+The model signals append an event when users and stations are created,
+changed or deleted. Admin actions (password resets, activation, primary
+contact changes) are recorded as one event describing the action, in
+place of the events of the saves they make. Each event stores its kind,
+the ids of the user and station it concerns and a one-line summary made
+when it is written, so showing the latest events needs no joins.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timesince import timesince
+
+DEFAULT_ACTIVITY_LOG = {
+    'RETENTION_DAYS': 180,
+    'PRUNE_BATCH_SIZE': 5000,
+    'DASHBOARD_EVENTS': 10,
+}
+
+# Fields that change on their own (logins, timestamps, derived columns)
+QUIET_FIELDS = {'last_login', 'updated_at', 'entitlement_mask'}
+
+# Set while an admin action is being recorded
+_current_action = ContextVar('activity_action', default=None)
+
+
+def activity_settings():
+    return {**DEFAULT_ACTIVITY_LOG, **getattr(settings, 'ACTIVITY_LOG', {})}
+
+
+def loaded(instance, attname, default=None):
+    """A field's value if it was loaded, without fetching deferred fields"""
+    return instance.__dict__.get(attname, default)
+
+
+def subject_ids(user=None, station=None):
+    station_id = station.pk if station is not None else loaded(user, 'radio_station_id')
+    return {'user_id': user.pk if user is not None else None, 'station_id': station_id}
+
+
+def record(kind, summary, user=None, station=None, actor=None):
+    """Append an event about a user and/or station"""
+    from .models import ActivityEvent
+
+    actor_id = actor.pk if actor is not None and actor.is_authenticated else None
+    return ActivityEvent.objects.create(
+        kind=kind, summary=summary[:255], actor_id=actor_id, **subject_ids(user, station),
+    )
+
+
+@contextmanager
+def admin_action(actor, kind, summary, user=None, station=None):
+    """
+    Record an admin action as a single event, written in the same
+    transaction as the action's changes and only if it succeeds.
+    """
+    with transaction.atomic():
+        token = _current_action.set(kind)
+        try:
+            yield
+        finally:
+            _current_action.reset(token)
+        record(kind, summary, user=user, station=station, actor=actor)
+
+
+def changed_fields(instance, update_fields=None):
+    """Names of the fields a save changed, leaving out the quiet ones"""
+    changes = set(instance.get_dirty_fields()) - QUIET_FIELDS
+    if update_fields is not None:
+        changes &= set(update_fields)
+    return sorted(changes)
+
+
+# --- Signal feeds ---
+
+def user_saved(user, created, update_fields=None):
+    from .models import ActivityEvent
+
+    if _current_action.get() is not None:
+        return
+    if created:
+        record(ActivityEvent.Kind.USER_CREATED, f'New user "{user.email}" was created', user=user)
+        return
+    changes = changed_fields(user, update_fields)
+    if changes:
+        record(
+            ActivityEvent.Kind.USER_UPDATED,
+            f'User "{user.email}" was updated ({", ".join(changes)})', user=user,
+        )
+
+
+def user_deleted(user):
+    from .models import ActivityEvent
+
+    if _current_action.get() is None:
+        # Rows deleted in a cascade may be loaded with only some fields
+        email = loaded(user, 'email', user.pk)
+        record(ActivityEvent.Kind.USER_DELETED, f'User "{email}" was deleted', user=user)
+
+
+def station_saved(station, created, update_fields=None):
+    from .models import ActivityEvent
+
+    if _current_action.get() is not None:
+        return
+    if created:
+        record(ActivityEvent.Kind.STATION_CREATED, f'Radio station "{station.name}" was created', station=station)
+        return
+    changes = changed_fields(station, update_fields)
+    if changes:
+        record(
+            ActivityEvent.Kind.STATION_UPDATED,
+            f'Radio station "{station.name}" was updated ({", ".join(changes)})', station=station,
+        )
+
+
+def station_deleted(station):
+    from .models import ActivityEvent
+
+    if _current_action.get() is None:
+        name = loaded(station, 'name', station.pk)
+        record(ActivityEvent.Kind.STATION_DELETED, f'Radio station "{name}" was deleted', station=station)
+
+
+# --- Reading ---
+
+def latest_events(limit=None, user_id=None, station_id=None):
+    """
+    The most recent events, optionally for one user or station. Reads at
+    most ``limit`` index entries whatever the size of the log.
+    """
+    from .models import ActivityEvent
+
+    if limit is None:
+        limit = activity_settings()['DASHBOARD_EVENTS']
+    events = ActivityEvent.objects.all()
+    if user_id is not None:
+        events = events.filter(user_id=user_id)
+    if station_id is not None:
+        events = events.filter(station_id=station_id)
+    return list(events.order_by('-id')[:limit])
+
+
+def dashboard_activity(events):
+    """The entries shown under "Recent Activity" on the dashboard"""
+    return [
+        {'type': event.category, 'text': event.summary, 'time': f'{timesince(event.created_at)} ago'}
+        for event in events
+    ]
+
+
+# --- Retention ---
+
+def prune_events(before, batch_size=None, sleep=0.0):
+    """
+    Delete events created before ``before``, oldest first, one short
+    transaction per batch. Yields the number deleted in each batch.
+    """
+    from .models import ActivityEvent
+
+    batch_size = batch_size or activity_settings()['PRUNE_BATCH_SIZE']
+    # The oldest events have the lowest ids, so this walks the primary key
+    # from the start and stops after one batch
+    expired = ActivityEvent.objects.filter(created_at__lt=before).order_by('id')
+    while True:
+        with transaction.atomic():
+            ids = list(expired.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            deleted = ActivityEvent.objects.filter(id__in=ids).delete()[0]
+        yield deleted
+        if sleep:
+            time.sleep(sleep)
@@ -1,9 +1,13 @@
 # accounts/admin_views.py
+import json
+
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes, throttle_classes
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.response import Response
 from django.contrib.auth import get_user_model
-from .models import RadioStation
+from django.http import Http404, StreamingHttpResponse
+from .models import ActivityEvent
 from .serializers import (
     UserSerializer, 
     StaffUserCreateSerializer,
@@ -12,29 +16,57 @@ from .serializers import (
     RadioUserUpdateSerializer
 )
 from .views import AdminPermission
+from .query_budget import query_budget
+from .counters import read_counters
+from .authentication import user_cache
+from .pagination import UserPageNumberPagination, UserKeysetPagination, is_cursor_request
+from .bulk_import import CSVParser, UserImport, import_settings, read_rows
+from .exports import USER_EXPORT_COLUMNS, export_response
+from .search import search
+from .activity import admin_action
+from .metrics import CONTENT_TYPE, PrometheusRenderer, collect, metrics_settings
 
 User = get_user_model()
 
+@query_budget(2)
 @api_view(['GET'])
 @permission_classes([AdminPermission])
 def system_stats(request):
     """Provide system statistics for admin dashboard"""
-    stats = {
-        'total_users': User.objects.count(),
-        'active_users': User.objects.filter(is_active=True).count(),
-        'staff_users': User.objects.filter(user_type=User.UserType.STAFF).count(),
-        'radio_users': User.objects.filter(user_type=User.UserType.RADIO).count(),
-        'active_stations': RadioStation.objects.filter(is_active=True).count(),
-        'total_stations': RadioStation.objects.count(),
-        # Add other relevant stats
-    }
+    # Read from the materialized counters instead of counting the tables
+    stats = read_counters()
+    stats['auth_cache'] = user_cache.stats()
     return Response(stats)
 
+
+@query_budget(2)
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+@renderer_classes([PrometheusRenderer])
+@throttle_classes([])  # Scraped every few seconds
+def metrics(request):
+    """Request metrics of all workers, in Prometheus text format (staff only)"""
+    if not metrics_settings()['ENABLED']:
+        raise Http404
+    return Response(collect(), content_type=CONTENT_TYPE)
+
 class AdminUserViewSet(viewsets.ModelViewSet):
     """ViewSet for managing all users via admin interface"""
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [AdminPermission]
+    pagination_class = UserPageNumberPagination
+    query_budget = {'list': 3, 'retrieve': 2, 'staff': 2, 'radio': 2, '*': 8}
+    
+    @property
+    def paginator(self):
+        """Use keyset pagination when the client asks for a cursor"""
+        if not hasattr(self, '_paginator'):
+            if self.request is not None and is_cursor_request(self.request):
+                self._paginator = UserKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
     
     def get_serializer_class(self):
         """Return appropriate serializer based on action and user type"""
@@ -58,7 +90,7 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter users based on query parameters"""
-        queryset = User.objects.all().order_by('-date_joined')
+        queryset = User.objects.select_related('radio_station').order_by('-date_joined')
         
         # Filter by user type
         user_type = self.request.query_params.get('user_type')
@@ -74,29 +106,34 @@ class AdminUserViewSet(viewsets.ModelViewSet):
         staff_role = self.request.query_params.get('staff_role')
         if staff_role:
             queryset = queryset.filter(staff_role=staff_role.upper())
+        
+        # Full-text search over names, email and mobile number
+        search_query = self.request.query_params.get('search')
+        if search_query:
+            queryset = search(queryset, search_query)
             
         return queryset
     
     def list(self, request, *args, **kwargs):
-        """Override list method to include pagination and total count info"""
-        queryset = self.filter_queryset(self.get_queryset())
+        """
+        List users with total count info.
         
-        # Get total count before pagination
-        total_count = queryset.count()
+        Pass ``?pagination=cursor`` (or a ``cursor``) to page by
+        ``(date_joined, id)`` instead of page number, and ``count=approximate``
+        or ``count=none`` to avoid an exact COUNT on large tables.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
         
-        # Use pagination
+        # The paginator reports total_count itself
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            response = self.get_paginated_response(serializer.data)
-            # Add total count to response
-            response.data['total_count'] = total_count
-            return response
+            return self.get_paginated_response(serializer.data)
 
         serializer = self.get_serializer(queryset, many=True)
         return Response({
             'results': serializer.data,
-            'total_count': total_count
+            'total_count': len(serializer.data)
         })
     
     @action(detail=True, methods=['post'])
@@ -111,8 +148,12 @@ class AdminUserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        user.set_password(password)
-        user.save()
+        with admin_action(
+            request.user, ActivityEvent.Kind.PASSWORD_RESET,
+            f'Password for "{user.email}" was reset', user=user,
+        ):
+            user.set_password(password)
+            user.save()
         
         return Response({"success": "Password has been reset"})
     
@@ -128,11 +169,49 @@ class AdminUserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        user.is_active = is_active
-        user.save()
+        if is_active:
+            kind, summary = ActivityEvent.Kind.USER_ACTIVATED, f'User "{user.email}" was activated'
+        else:
+            kind, summary = ActivityEvent.Kind.USER_DEACTIVATED, f'User "{user.email}" was deactivated'
+        with admin_action(request.user, kind, summary, user=user):
+            user.is_active = is_active
+            user.save()
         
         return Response({"success": "User status updated"})
     
+    @action(detail=False, methods=['post'], url_path='import',
+            parser_classes=[JSONParser, CSVParser, MultiPartParser])
+    def bulk_import(self, request):
+        """
+        Create users in bulk from a CSV or JSON upload (``file``), a text/csv
+        body or a JSON list. Streams one NDJSON line per rejected row, one per
+        inserted batch and a final summary. Pass ``?dry_run=true`` to only
+        validate.
+        """
+        rows = read_rows(request)
+        max_rows = import_settings()['MAX_ROWS']
+        if len(rows) > max_rows:
+            return Response(
+                {"error": f"Imports are limited to {max_rows} rows"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+        user_import = UserImport(rows, dry_run=dry_run)
+        return StreamingHttpResponse(
+            (json.dumps(line, default=str) + '\n' for line in user_import.run()),
+            content_type='application/x-ndjson',
+        )
+    
+    @action(detail=False, methods=['get'], url_path='export/(?P<export_format>csv|ndjson)')
+    def export(self, request, export_format=None):
+        """
+        Stream users as CSV or NDJSON, filtered like the list. Use this
+        instead of ``staff`` and ``radio`` for large exports.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(queryset, USER_EXPORT_COLUMNS, export_format, 'users')
+    
     @action(detail=False, methods=['get'])
     def staff(self, request):
         """Get all staff users"""
@@ -1,9 +1,12 @@
 # In accounts/apps.py
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class AccountsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'accounts'
     
     def ready(self):
-        import accounts.signals
\ No newline at end of file
+        import accounts.signals
+        from .search import ensure_indexes
+        post_migrate.connect(ensure_indexes, sender=self)
\ No newline at end of file
@@ -0,0 +1,314 @@
+# accounts/async_views.py
+"""
+Async views for use under newskoop/asgi.py.
+
+These run on the event loop and only hop to a thread for the parts that
+must be synchronous, so a slow operation in one request (like a password
+hash) doesn't hold up the others.
+
+The read-only API views answer GET requests for JSON themselves, using
+the async ORM and the same serializers as the DRF views. Anything else
+(writes, the browsable API) is handed to the DRF view they stand in for.
+"""
+import json
+import logging
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.http import HttpResponseBase, JsonResponse
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import APIException, NotAcceptable, NotFound
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import admin_views
+from .authentication import user_cache
+from .conditional import (
+    aread_station_version, detail_validators, list_validators, response_cache_timeout, with_validators,
+)
+from .counters import aread_counters
+from .hashing import HashPoolBusy, aauthenticate
+from .models import CustomUser, RadioStation
+from .pagination import apaginate_queryset
+from .query_budget import query_budget
+from .serializers import RadioStationSerializer, UserSerializer
+from .views import (
+    LoginView, LoginPageView, RadioStationViewSet, UserProfileView, finish_page_login, login_result,
+)
+
+logger = logging.getLogger('accounts')
+
+sync_login = LoginView.as_view()
+sync_login_page = LoginPageView.as_view()
+sync_profile = UserProfileView.as_view()
+sync_station_list = RadioStationViewSet.as_view(
+    {'get': 'list', 'post': 'create'}, basename='radiostation', detail=False,
+)
+sync_station_detail = RadioStationViewSet.as_view(
+    {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+    basename='radiostation', detail=True,
+)
+sync_station_users = RadioStationViewSet.as_view({'get': 'users'}, basename='radiostation', detail=True)
+
+
+def _drf_view(sync_view, request, *args, **kwargs):
+    """The DRF view behind sync_view, set up as its dispatch() would"""
+    view = sync_view.cls(**sync_view.initkwargs)
+    if hasattr(sync_view, 'actions'):
+        # A viewset picks its action from the method, as in ViewSetMixin.as_view
+        view.action_map = sync_view.actions
+    view.args, view.kwargs = args, kwargs
+    view.request = view.initialize_request(request, *args, **kwargs)
+    view.format_kwarg = view.get_format_suffix(**kwargs)
+    view.headers = view.default_response_headers
+    return view
+
+
+async def _initial(view):
+    """
+    Run the view's initial(): content negotiation, authentication,
+    permissions and throttles. Authenticators and the throttle store may
+    do I/O, so this goes to a thread.
+    """
+    await sync_to_async(view.initial)(view.request, *view.args, **view.kwargs)
+
+
+def _wants_json(view):
+    """Whether the view's content negotiation picks the JSON renderer"""
+    try:
+        renderer, _ = view.perform_content_negotiation(view.request)
+    except NotAcceptable:
+        return False
+    return renderer.format == 'json'
+
+
+def _error_response(view, exc):
+    """The response the DRF view gives for an APIException"""
+    response = view.finalize_response(view.request, view.handle_exception(exc), *view.args, **view.kwargs)
+    return response.render()
+
+
+def _busy_response():
+    logger.warning("Login rejected: password hashing queue is full")
+    return JsonResponse(
+        {'error': 'Too many logins in progress, please try again shortly'},
+        status=503,
+        headers={'Retry-After': '1'},
+    )
+
+
+@query_budget(6)
+@csrf_exempt
+@require_http_methods(["POST"])
+async def login_view(request):
+    """Async version of LoginView with password hashing on the hash pool"""
+    view = _drf_view(sync_login, request)
+    try:
+        await _initial(view)
+    except APIException as exc:
+        return await sync_to_async(_error_response)(view, exc)
+
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'detail': 'JSON parse error'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'detail': 'JSON parse error'}, status=400)
+    else:
+        data = request.POST
+
+    email = data.get('email')
+    password = data.get('password')
+
+    errors = {}
+    if not email:
+        errors['email'] = 'Email is required'
+    if not password:
+        errors['password'] = 'Password is required'
+
+    if errors:
+        logger.warning("API login attempt with missing credentials: %s", ', '.join(errors.keys()))
+        return JsonResponse({'errors': errors}, status=400)
+
+    try:
+        user = await aauthenticate(request, email, password)
+    except HashPoolBusy:
+        return _busy_response()
+
+    body, status_code = await sync_to_async(login_result)(user, email)
+    return JsonResponse(body, status=status_code)
+
+
+@query_budget(10)
+@require_http_methods(["GET", "POST"])
+async def login_page_view(request):
+    """Async version of LoginPageView with password hashing on the hash pool"""
+    if request.method == 'GET':
+        return await sync_to_async(sync_login_page)(request)
+
+    email = request.POST.get('email')
+    password = request.POST.get('password')
+
+    errors = {}
+    if not email:
+        errors['email'] = 'Email is required'
+    if not password:
+        errors['password'] = 'Password is required'
+
+    if errors:
+        for field, error in errors.items():
+            messages.error(request, error)
+        return await sync_to_async(render)(request, 'accounts/login.html')
+
+    try:
+        user = await aauthenticate(request, email, password)
+    except HashPoolBusy:
+        logger.warning("Login rejected: password hashing queue is full")
+        messages.error(request, 'The server is busy. Please try again in a moment.')
+        return await sync_to_async(render)(request, 'accounts/login.html', status=503)
+
+    return await sync_to_async(finish_page_login)(request, user, email)
+
+
+# --- Read-only API views ---
+
+def _json_response(data, status=200):
+    # Same output as DRF's JSONRenderer
+    return JsonResponse(
+        data, status=status, safe=False, encoder=JSONEncoder,
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')},
+    )
+
+
+def async_api_view(sync_view, budget):
+    """
+    Serve JSON GETs for a DRF view from an async function, after the DRF
+    view's own authentication, permission and throttle checks.
+    """
+    def decorator(handler):
+        @query_budget(budget)
+        @csrf_exempt
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            drf_view = _drf_view(sync_view, request, *args, **kwargs)
+            if request.method != 'GET' or not _wants_json(drf_view):
+                return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+            try:
+                await _initial(drf_view)
+                request.user = drf_view.request.user
+                response = await handler(request, *args, **kwargs)
+            except APIException as exc:
+                return await sync_to_async(_error_response)(drf_view, exc)
+
+            if not isinstance(response, HttpResponseBase):
+                response = _json_response(response)
+            return response
+        return view
+    return decorator
+
+
+async def _conditional_response(request, etag, last_modified, cache_key, render):
+    """Async version of ConditionalStationMixin.conditional_response"""
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified or None)
+    if not_modified is not None:
+        return with_validators(not_modified, etag, last_modified)
+
+    data = await cache.aget(cache_key)
+    if data is None:
+        data = await render()
+        await cache.aset(cache_key, data, response_cache_timeout())
+    return with_validators(_json_response(data), etag, last_modified)
+
+
+def _station_view(request, action, **kwargs):
+    """A RadioStationViewSet for its querysets, filters and paginator"""
+    drf_request = Request(request)
+    drf_request.user = request.user
+    return RadioStationViewSet(request=drf_request, action=action, args=(), kwargs=kwargs, format_kwarg=None)
+
+
+def _station_queryset(view, pk):
+    queryset = view.filter_queryset(view.get_queryset())
+    try:
+        return queryset.filter(pk=pk)
+    except (TypeError, ValueError, ValidationError):
+        raise NotFound(f"No {RadioStation._meta.object_name} matches the given query.")
+
+
+def _station_budget(action):
+    return {'get': RadioStationViewSet.query_budget[action], '*': RadioStationViewSet.query_budget['*']}
+
+
+@async_api_view(sync_profile, UserProfileView.query_budget)
+async def profile_view(request):
+    """Async version of UserProfileView.get"""
+    user = request.user
+    if user.radio_station_id and not CustomUser.radio_station.is_cached(user):
+        # Session users are loaded without their station
+        user.radio_station = await RadioStation.objects.aget(pk=user.radio_station_id)
+    logger.info("API user profile accessed: %s", user.email)
+    return UserSerializer(user).data
+
+
+@async_api_view(admin_views.system_stats, admin_views.system_stats.query_budget)
+async def system_stats_view(request):
+    """Async version of admin_views.system_stats"""
+    stats = await aread_counters()
+    stats['auth_cache'] = user_cache.stats()
+    return stats
+
+
+@async_api_view(sync_station_list, _station_budget('list'))
+async def station_list_view(request):
+    """Async version of RadioStationViewSet.list"""
+    view = _station_view(request, 'list')
+
+    async def render():
+        queryset = view.filter_queryset(view.get_queryset())
+        page = await apaginate_queryset(view.paginator, queryset, view.request)
+        if page is None:
+            return RadioStationSerializer([station async for station in queryset], many=True).data
+        data = RadioStationSerializer(page, many=True).data
+        return view.paginator.get_paginated_response(data).data
+
+    version, modified = await aread_station_version()
+    etag, cache_key = list_validators(request, version)
+    return await _conditional_response(request, etag, modified, cache_key, render)
+
+
+@async_api_view(sync_station_detail, _station_budget('retrieve'))
+async def station_detail_view(request, pk):
+    """Async version of RadioStationViewSet.retrieve"""
+    view = _station_view(request, 'retrieve', pk=pk)
+    queryset = _station_queryset(view, pk)
+    updated_at = await queryset.values_list('updated_at', flat=True).afirst()
+    if updated_at is None:
+        raise NotFound(f"No {RadioStation._meta.object_name} matches the given query.")
+
+    async def render():
+        station = await queryset.afirst()
+        if station is None:
+            raise NotFound(f"No {RadioStation._meta.object_name} matches the given query.")
+        return RadioStationSerializer(station).data
+
+    etag, cache_key = detail_validators(pk, updated_at)
+    return await _conditional_response(request, etag, int(updated_at.timestamp()), cache_key, render)
+
+
+@async_api_view(sync_station_users, _station_budget('users'))
+async def station_users_view(request, pk):
+    """Async version of RadioStationViewSet.users"""
+    view = _station_view(request, 'users', pk=pk)
+    station = await _station_queryset(view, pk).afirst()
+    if station is None:
+        raise NotFound(f"No {RadioStation._meta.object_name} matches the given query.")
+    users = [user async for user in station.users.select_related('radio_station')]
+    return UserSerializer(users, many=True).data
@@ -0,0 +1,155 @@
+# accounts/authentication.py
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+DEFAULT_USER_CACHE = {
+    'TTL': 30,
+    'MAX_ENTRIES': 10000,
+    # Alias of a Django cache shared between workers, or None
+    'SHARED_CACHE': None,
+}
+
+
+class UserCache:
+    """
+    Short-lived cache of authenticated users, keyed by primary key.
+
+    Entries live in a process-local LRU dict and, when SHARED_CACHE is set,
+    in a Django cache shared by all workers. Users are stored pickled so
+    every request gets its own instance. The model signals invalidate
+    entries in this process and in the shared cache; other processes see a
+    change once their local entry expires, so TTL bounds the staleness.
+    """
+
+    key_prefix = 'accounts:auth-user:'
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def config(self):
+        return {**DEFAULT_USER_CACHE, **getattr(settings, 'AUTH_USER_CACHE', {})}
+
+    @property
+    def shared(self):
+        alias = self.config['SHARED_CACHE']
+        return caches[alias] if alias else None
+
+    def get(self, user_id):
+        key = str(user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(entry[1])
+
+        shared = self.shared
+        if shared is not None:
+            data = shared.get(self.key_prefix + key)
+            if data is not None:
+                self._store_local(key, data)
+                with self._lock:
+                    self.shared_hits += 1
+                return pickle.loads(data)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, user):
+        key = str(user.pk)
+        data = pickle.dumps(user, pickle.HIGHEST_PROTOCOL)
+        self._store_local(key, data)
+        shared = self.shared
+        if shared is not None:
+            shared.set(self.key_prefix + key, data, self.config['TTL'])
+
+    def invalidate(self, *user_ids):
+        keys = [str(user_id) for user_id in user_ids]
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        shared = self.shared
+        if shared is not None and keys:
+            shared.delete_many([self.key_prefix + key for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+    def _store_local(self, key, data):
+        config = self.config
+        with self._lock:
+            self._entries[key] = (time.monotonic() + config['TTL'], data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > config['MAX_ENTRIES']:
+                self._entries.popitem(last=False)
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user from user_cache, so
+    steady-state authenticated requests run no authentication queries.
+    The user's radio station is cached with it.
+    """
+
+    def get_user(self, validated_token):
+        user_id = self.token_user_id(validated_token)
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = (
+                    self.user_model.objects.select_related('radio_station')
+                    .get(**{api_settings.USER_ID_FIELD: user_id})
+                )
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user)
+        return self.check_user(user, validated_token)
+
+    def token_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+    def check_user(self, user, validated_token):
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,230 @@
+# accounts/blacklist.py
+"""
+Fast refresh-token blacklist checks.
+
+simplejwt checks every refresh and logout token against the blacklist with
+a JOIN query. Almost every token presented is not blacklisted, so the check
+is fronted by a Bloom filter of blacklisted JTIs: a negative answer is
+certain and needs no query, a positive one falls through to the database.
+
+The filter is built from the database and gets tokens blacklisted in this
+process immediately through a post_save signal. Every
+TOKEN_BLACKLIST_FILTER['SYNC_INTERVAL'] seconds it adds the rows
+blacklisted since its last sync, looking SYNC_MARGIN seconds further back
+so rows whose transaction committed late aren't missed.
+
+Between syncs, a token blacklisted by another worker isn't in this
+worker's filter yet. Blacklisted JTIs are therefore also written to the
+SHARED_CACHE, which is checked whenever the filter says no, so a rotated
+or logged out token can't be replayed on another worker in the meantime.
+A local-memory cache isn't shared, so with one (the default when CACHES
+isn't configured) a miss is looked up in the database instead: still
+correct, but a query per check until a shared cache is set up.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils import timezone
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenRefreshView
+
+from .throttling import ScopedRateThrottle
+
+DEFAULT_FILTER = {
+    'ENABLED': True,
+    # Seconds between fetching JTIs blacklisted by other workers
+    'SYNC_INTERVAL': 2,
+    # Seconds each sync looks back past the last one, for late commits
+    'SYNC_MARGIN': 60,
+    # Alias of the Django cache shared between workers that newly
+    # blacklisted JTIs are written to. Without one (None, or a cache
+    # local to the process) misses are checked in the database.
+    'SHARED_CACHE': 'default',
+    # Seconds between full rebuilds, which drop pruned tokens
+    'REBUILD_INTERVAL': 3600,
+    'MIN_CAPACITY': 10000,
+    'FALSE_POSITIVE_RATE': 0.001,
+}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, false_positive_rate):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(false_positive_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing: derive k positions from two 64-bit hashes
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, value):
+        # Values seen again by an overlapping sync don't use up capacity
+        if value in self:
+            return
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class BlacklistFilter:
+    """Process-wide Bloom filter of blacklisted refresh token JTIs"""
+
+    key_prefix = 'accounts:blacklisted:'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bloom = None
+        # Database time the last sync or rebuild started at
+        self._synced_since = None
+        self._synced_at = 0.0
+        self._built_at = 0.0
+        self.negatives = 0
+        self.positives = 0
+
+    @property
+    def config(self):
+        return {**DEFAULT_FILTER, **getattr(settings, 'TOKEN_BLACKLIST_FILTER', {})}
+
+    @property
+    def shared(self):
+        """The cache shared by every worker, or None"""
+        alias = self.config['SHARED_CACHE']
+        if not alias:
+            return None
+        cache = caches[alias]
+        # Other workers can't see what these hold
+        if isinstance(cache, (LocMemCache, DummyCache)):
+            return None
+        return cache
+
+    def rebuild(self):
+        """Build a new filter from every blacklisted token in the database"""
+        config = self.config
+        started = timezone.now()
+        total = BlacklistedToken.objects.count()
+        bloom = BloomFilter(
+            max(config['MIN_CAPACITY'], total * 2), config['FALSE_POSITIVE_RATE']
+        )
+        rows = BlacklistedToken.objects.order_by('pk').values_list('token__jti', flat=True)
+        for jti in rows.iterator(chunk_size=2000):
+            bloom.add(jti)
+
+        now = time.monotonic()
+        with self._lock:
+            self._bloom = bloom
+            self._synced_since = started
+            self._synced_at = self._built_at = now
+
+    def sync(self):
+        """
+        Add tokens blacklisted since the last sync, e.g. by other workers.
+        Primary keys don't commit in order, so rows are found by time, with
+        a margin for transactions that committed after a later one.
+        """
+        margin = datetime.timedelta(seconds=self.config['SYNC_MARGIN'])
+        started = timezone.now()
+        with self._lock:
+            since = self._synced_since
+        jtis = list(
+            BlacklistedToken.objects.filter(blacklisted_at__gte=since - margin).values_list('token__jti', flat=True)
+        )
+        with self._lock:
+            for jti in jtis:
+                self._bloom.add(jti)
+            self._synced_since = started
+            self._synced_at = time.monotonic()
+
+    def add(self, jti):
+        """Record a token blacklisted by this process, here and in the shared cache"""
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+        shared = self.shared
+        if shared is not None:
+            # A blacklisted token is useless once it expires anyway
+            shared.set(self.key_prefix + jti, True, int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()))
+
+    def might_contain(self, jti):
+        """Return False only if the token is certainly not blacklisted"""
+        config = self.config
+        now = time.monotonic()
+        if (self._bloom is None
+                or now - self._built_at > config['REBUILD_INTERVAL']
+                or self._bloom.count > self._bloom.capacity):
+            self.rebuild()
+        elif now - self._synced_at > config['SYNC_INTERVAL']:
+            self.sync()
+
+        with self._lock:
+            found = jti in self._bloom
+        if not found:
+            # Blacklisted by another worker since this one's last sync?
+            shared = self.shared
+            if shared is not None:
+                found = bool(shared.get(self.key_prefix + jti))
+            else:
+                found = BlacklistedToken.objects.filter(token__jti=jti).exists()
+            if found:
+                with self._lock:
+                    self._bloom.add(jti)
+        with self._lock:
+            if found:
+                self.positives += 1
+            else:
+                self.negatives += 1
+        return found
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': self._bloom.count if self._bloom else 0,
+                'capacity': self._bloom.capacity if self._bloom else 0,
+                'negatives': self.negatives,
+                'positives': self.positives,
+            }
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check consults blacklist_filter first"""
+
+    def check_blacklist(self):
+        if blacklist_filter.config['ENABLED']:
+            jti = self.payload[api_settings.JTI_CLAIM]
+            if not blacklist_filter.might_contain(jti):
+                return
+        super().check_blacklist()
+
+
+class FilteredTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+
+class FilteredTokenRefreshView(TokenRefreshView):
+    """TokenRefreshView using the filtered blacklist check"""
+    serializer_class = FilteredTokenRefreshSerializer
+    query_budget = 12
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'token_refresh'
@@ -0,0 +1,255 @@
+# accounts/bulk_import.py
+"""
+Bulk user import, for onboarding a whole radio network at once.
+
+Rows are validated a batch at a time: each row with BulkUserRowSerializer,
+which runs no queries, then email uniqueness, stations and primary
+contacts for the whole batch with one query each. The errors of each
+batch are streamed back as soon as it has been validated. Passwords are
+then hashed on a process pool and users inserted with bulk_create, one
+batch at a time, streaming progress as the import runs.
+"""
+import csv
+import io
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, connection, transaction
+from django.db.models.functions import Lower
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .hashing import hash_password, process_executor
+from .models import RadioStation
+from .serializers import BulkUserRowSerializer
+
+logger = logging.getLogger('accounts')
+
+User = get_user_model()
+
+DEFAULT_BULK_IMPORT = {
+    'BATCH_SIZE': 500,
+    # Processes hashing passwords; 1 hashes in the request thread
+    'HASH_WORKERS': os.cpu_count() or 2,
+    'MAX_ROWS': 20000,
+}
+
+
+def import_settings():
+    return {**DEFAULT_BULK_IMPORT, **getattr(settings, 'BULK_USER_IMPORT', {})}
+
+
+class CSVParser(BaseParser):
+    """Parses a text/csv request body into a list of row dicts"""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return read_csv(stream.read())
+
+
+def read_csv(data):
+    if isinstance(data, bytes):
+        try:
+            data = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ParseError("CSV files must be UTF-8 encoded")
+    reader = csv.DictReader(io.StringIO(data))
+    if not reader.fieldnames or 'email' not in reader.fieldnames:
+        raise ParseError("CSV files need a header row with at least an 'email' column")
+    return [
+        {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        for row in reader
+    ]
+
+
+def read_rows(request):
+    """Return the rows of an import request as a list of dicts"""
+    upload = request.FILES.get('file')
+    if upload is not None:
+        data = upload.read()
+        if upload.name.lower().endswith('.json') or upload.content_type == 'application/json':
+            try:
+                rows = json.loads(data)
+            except ValueError:
+                raise ParseError("The uploaded file is not valid JSON")
+        else:
+            rows = read_csv(data)
+    else:
+        rows = request.data
+        if isinstance(rows, dict):
+            rows = rows.get('users')
+
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ParseError("Expected a CSV file or a JSON list of users")
+    return rows
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class UserImport:
+    """
+    Validates and imports rows of user data. Rows are numbered from 1 in
+    file order, and invalid rows are reported and skipped.
+    """
+
+    def __init__(self, rows, dry_run=False):
+        self.rows = rows
+        self.dry_run = dry_run
+        self.config = import_settings()
+        self.errors = {}
+        self.valid = []
+        self.created = 0
+        # Lowercased emails and the stations given a primary contact, in the rows validated so far
+        self.seen = set()
+        self.primary_taken = set()
+
+    def add_error(self, number, field, message):
+        self.errors.setdefault(number, {}).setdefault(field, []).append(message)
+
+    def run(self):
+        """
+        Generate the import's progress as dicts: one per invalid row, one
+        per inserted batch and a summary at the end.
+        """
+        for numbers in self.validate():
+            for number in numbers:
+                row = self.rows[number - 1]
+                yield {'row': number, 'email': row.get('email'), 'errors': self.errors[number]}
+
+        if not self.dry_run and self.valid:
+            yield from self.insert()
+
+        logger.info(
+            "Bulk user import: %d created, %d rejected%s",
+            self.created, len(self.errors), ' (dry run)' if self.dry_run else '',
+        )
+        yield {
+            'summary': {
+                'rows': len(self.rows),
+                'valid': len(self.valid),
+                'created': self.created,
+                'rejected': len(self.errors),
+                'dry_run': self.dry_run,
+            }
+        }
+
+    def validate(self):
+        """Validate the rows a batch at a time, generating the numbers of each batch's invalid rows"""
+        numbered = list(enumerate(self.rows, start=1))
+        for batch in chunks(numbered, self.config['BATCH_SIZE']):
+            yield self.validate_batch(batch)
+
+    def validate_batch(self, batch):
+        serializer = BulkUserRowSerializer()
+        candidates = []
+        for number, row in batch:
+            try:
+                candidates.append((number, serializer.run_validation(row)))
+            except serializers.ValidationError as exc:
+                detail = exc.detail if isinstance(exc.detail, dict) else {'non_field_errors': exc.detail}
+                for field, messages in detail.items():
+                    for message in messages:
+                        self.add_error(number, field, str(message))
+
+        taken = self.existing_emails({data['email'] for _, data in candidates})
+        station_ids = {data['radio_station'] for _, data in candidates if data['radio_station']}
+        stations = set(RadioStation.objects.filter(pk__in=station_ids).values_list('pk', flat=True))
+        self.primary_taken.update(
+            User.objects.filter(radio_station__in=stations, is_primary_contact=True)
+            .values_list('radio_station_id', flat=True)
+        )
+
+        for number, data in candidates:
+            email = data['email'].lower()
+            if email in taken:
+                self.add_error(number, 'email', "A user with this email already exists.")
+            elif email in self.seen:
+                self.add_error(number, 'email', "This email appears more than once in the file.")
+            self.seen.add(email)
+
+            station = data['radio_station']
+            if station and station not in stations:
+                self.add_error(number, 'radio_station', f'Invalid pk "{station}" - object does not exist.')
+            elif data['is_primary_contact'] and station in self.primary_taken:
+                self.add_error(number, 'is_primary_contact', "This station already has a primary contact.")
+
+            if number not in self.errors:
+                self.valid.append((number, data))
+                # Only rows that will be created take the station's primary contact
+                if data['is_primary_contact']:
+                    self.primary_taken.add(station)
+        return sorted(number for number, _ in batch if number in self.errors)
+
+    def existing_emails(self, emails):
+        """
+        Return which of the emails are taken, lowercased: emails differing
+        only in case are the same address. Uses user_email_lower_idx.
+        """
+        emails = list({email.lower() for email in emails})
+        size = connection.features.max_query_params or len(emails) or 1
+        taken = set()
+        for chunk in chunks(emails, size):
+            taken.update(
+                User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=chunk)
+                .values_list('email_lower', flat=True)
+            )
+        return taken
+
+    def insert(self):
+        workers = self.config['HASH_WORKERS']
+        executor = process_executor(workers) if workers > 1 else None
+        try:
+            for batch in chunks(self.valid, self.config['BATCH_SIZE']):
+                passwords = [data['password'] for _, data in batch]
+                if executor is not None:
+                    chunksize = max(1, len(passwords) // (workers * 4))
+                    hashes = list(executor.map(hash_password, passwords, chunksize=chunksize))
+                else:
+                    hashes = [make_password(password) for password in passwords]
+
+                users = []
+                for (number, data), encoded in zip(batch, hashes):
+                    fields = {key: value for key, value in data.items() if key != 'password'}
+                    fields['radio_station_id'] = fields.pop('radio_station')
+                    # bulk_create skips CustomUser.save(), which sets is_staff
+                    fields['is_staff'] = fields['user_type'] == User.UserType.STAFF
+                    users.append((number, User(password=encoded, **fields)))
+
+                errors = self.create_batch(users)
+                for number in errors:
+                    yield {'row': number, 'email': self.rows[number - 1].get('email'), 'errors': errors[number]}
+                yield {'created': self.created}
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def create_batch(self, users):
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, user in users])
+            self.created += len(users)
+            return {}
+        except IntegrityError:
+            pass
+
+        # Someone else created one of these users since validation; insert
+        # them one by one to find out which
+        errors = {}
+        for number, user in users:
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create([user])
+                self.created += 1
+            except IntegrityError:
+                errors[number] = {'non_field_errors': ["This user conflicts with one created during the import."]}
+        self.errors.update(errors)
+        self.valid = [(number, data) for number, data in self.valid if number not in errors]
+        return errors
@@ -0,0 +1,143 @@
+# accounts/conditional.py
+"""
+Conditional GET and response caching for radio stations.
+
+Every write to the stations table bumps a collection version stored in
+StatCounter, along with the time of the change. List responses are
+identified by that version and station responses by their updated_at, so
+a client revalidating an unchanged resource gets a 304 after one small
+query, and changed resources are served from a response cache keyed by
+the version, which the bump invalidates.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import BigIntegerField, Case, F, Value, When
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+STATION_VERSION = 'station_version'
+STATION_MODIFIED = 'station_modified'
+
+
+def bump_station_version():
+    """Mark the station collection as changed"""
+    from .models import StatCounter
+
+    now = int(time.time())
+    updated = StatCounter.objects.filter(name__in=[STATION_VERSION, STATION_MODIFIED]).update(
+        value=Case(
+            When(name=STATION_VERSION, then=F('value') + 1),
+            default=Value(now),
+            output_field=BigIntegerField(),
+        )
+    )
+    if updated < 2:
+        StatCounter.objects.get_or_create(name=STATION_VERSION, defaults={'value': 1})
+        StatCounter.objects.get_or_create(name=STATION_MODIFIED, defaults={'value': now})
+
+
+def read_station_version():
+    """Return the collection version and the Unix time it last changed"""
+    from .models import StatCounter
+
+    values = dict(
+        StatCounter.objects.filter(name__in=[STATION_VERSION, STATION_MODIFIED]).values_list('name', 'value')
+    )
+    return values.get(STATION_VERSION, 0), values.get(STATION_MODIFIED, 0)
+
+
+async def aread_station_version():
+    """read_station_version() for async views"""
+    from .models import StatCounter
+
+    values = {
+        name: value async for name, value in
+        StatCounter.objects.filter(name__in=[STATION_VERSION, STATION_MODIFIED]).values_list('name', 'value')
+    }
+    return values.get(STATION_VERSION, 0), values.get(STATION_MODIFIED, 0)
+
+
+def list_validators(request, version):
+    """Return the ETag and cache key of a station list response"""
+    # The same version renders differently per page, search and ordering
+    variant = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f'"stations-{version}-{variant[:16]}"', f'accounts:stations:{version}:{variant}'
+
+
+def detail_validators(pk, updated_at):
+    """Return the ETag and cache key of a station response"""
+    stamp = int(updated_at.timestamp() * 1000000)
+    return f'"station-{pk}-{stamp}"', f'accounts:station:{pk}:{stamp}'
+
+
+def response_cache_timeout():
+    return getattr(settings, 'STATION_RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def with_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    # Admin data: clients may keep it, but must revalidate before use
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Accept', 'Authorization', 'Cookie'])
+    return response
+
+
+class ConditionalStationMixin:
+    """
+    ETag/Last-Modified handling and a versioned response cache for the
+    list and retrieve actions of RadioStationViewSet. Only JSON responses
+    are cached; the browsable API is always rendered.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        version, modified = read_station_version()
+        etag, cache_key = list_validators(request, version)
+        render = super().list
+        return self.conditional_response(
+            request, etag, modified, cache_key, render=lambda: render(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().retrieve(request, *args, **kwargs)
+
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        try:
+            updated_at = self.get_queryset().filter(**lookup).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError, ValidationError):
+            updated_at = None
+        if updated_at is None:
+            # Let the normal path produce the 404
+            return super().retrieve(request, *args, **kwargs)
+
+        etag, cache_key = detail_validators(lookup[self.lookup_field], updated_at)
+        render = super().retrieve
+        return self.conditional_response(
+            request, etag, int(updated_at.timestamp()), cache_key,
+            render=lambda: render(request, *args, **kwargs),
+        )
+
+    def conditional_response(self, request, etag, last_modified, cache_key, render):
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified or None)
+        if not_modified is not None:
+            return with_validators(not_modified, etag, last_modified)
+
+        data = cache.get(cache_key)
+        if data is None:
+            response = render()
+            if response.status_code != 200:
+                return response
+            cache.set(cache_key, response.data, response_cache_timeout())
+        else:
+            response = Response(data)
+        return with_validators(response, etag, last_modified)
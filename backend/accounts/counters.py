@@ -0,0 +1,192 @@
+# accounts/counters.py
+"""
+Materialized statistics for the admin dashboards.
+
+Each counter is a row in StatCounter, defined as "rows of a model matching
+some field values". The signal receivers in accounts/signals.py adjust the
+counters as users and stations are saved or deleted, and CounterQuerySet
+covers bulk_create() and update(), which bypass the signals.
+"""
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+
+# model label -> {counter name: field values a row must match}
+COUNTERS = {
+    'accounts.CustomUser': {
+        'total_users': {},
+        'active_users': {'is_active': True},
+        'staff_users': {'user_type': 'STAFF'},
+        'radio_users': {'user_type': 'RADIO'},
+    },
+    'accounts.RadioStation': {
+        'total_stations': {},
+        'active_stations': {'is_active': True},
+    },
+}
+
+
+def counters_for(model):
+    return COUNTERS.get(model._meta.label, {})
+
+
+def counted_fields(model):
+    """Return the fields whose values decide which counters a row is in"""
+    return {field for conditions in counters_for(model).values() for field in conditions}
+
+
+def matching_counters(instance):
+    """Return the names of the counters an instance currently counts towards"""
+    return frozenset(
+        name for name, conditions in counters_for(type(instance)).items()
+        if all(getattr(instance, field) == value for field, value in conditions.items())
+    )
+
+
+def is_expression(value):
+    return hasattr(value, 'resolve_expression')
+
+
+def apply_deltas(deltas):
+    """Add the given deltas to the counters in a single UPDATE"""
+    from .models import StatCounter
+
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    StatCounter.objects.filter(name__in=deltas).update(
+        value=F('value') + Case(
+            *[When(name=name, then=Value(delta)) for name, delta in deltas.items()],
+            default=Value(0),
+            output_field=models.BigIntegerField(),
+        )
+    )
+
+
+def transition_deltas(before, after):
+    """Return the deltas for a row moving from one set of counters to another"""
+    deltas = {name: -1 for name in before - after}
+    deltas.update({name: 1 for name in after - before})
+    return deltas
+
+
+def read_counters():
+    """Return every counter in one query"""
+    from .models import StatCounter
+
+    return counter_values(dict(StatCounter.objects.values_list('name', 'value')))
+
+
+async def aread_counters():
+    """read_counters() for async views"""
+    from .models import StatCounter
+
+    return counter_values({name: value async for name, value in StatCounter.objects.values_list('name', 'value')})
+
+
+def counter_values(values):
+    return {
+        name: values.get(name, 0)
+        for counters in COUNTERS.values() for name in counters
+    }
+
+
+def count_queryset(queryset):
+    """Compute the exact value of every counter of a model over a queryset"""
+    counters = counters_for(queryset.model)
+    if not counters:
+        return {}
+    return queryset.order_by().aggregate(**{
+        name: Count('pk', filter=Q(**conditions)) if conditions else Count('pk')
+        for name, conditions in counters.items()
+    })
+
+
+def compute_counters():
+    """Compute the exact value of every counter from the source tables"""
+    from django.apps import apps
+
+    values = {}
+    for label in COUNTERS:
+        values.update(count_queryset(apps.get_model(label)._default_manager.all()))
+    return values
+
+
+def rebuild_counters(dry_run=False):
+    """
+    Recompute every counter and store the exact values.
+
+    Returns a dict of the counters that had drifted, mapping each name to
+    its (stored, actual) values.
+    """
+    from .models import StatCounter
+
+    with transaction.atomic():
+        stored = dict(StatCounter.objects.select_for_update().values_list('name', 'value'))
+        actual = compute_counters()
+        drift = {
+            name: (stored.get(name), value)
+            for name, value in actual.items()
+            if stored.get(name) != value
+        }
+        if not dry_run:
+            for name, (_, value) in drift.items():
+                StatCounter.objects.update_or_create(name=name, defaults={'value': value})
+    return drift
+
+
+class CounterQuerySet(models.QuerySet):
+    """QuerySet that keeps the materialized counters right for bulk writes"""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        deltas = {}
+        for obj in objs:
+            for name in matching_counters(obj):
+                deltas[name] = deltas.get(name, 0) + 1
+        apply_deltas(deltas)
+        return objs
+
+    def update(self, **kwargs):
+        touched = counted_fields(self.model) & set(kwargs)
+        if not touched:
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            if any(is_expression(kwargs[field]) for field in touched):
+                # New values are only known to the database (e.g. bulk_update's
+                # CASE expressions), so count the affected rows again afterwards
+                pks = list(self.values_list('pk', flat=True))
+                rows_by_pk = self.model._default_manager.filter(pk__in=pks)
+                before = count_queryset(rows_by_pk)
+                rows = super().update(**kwargs)
+                after = count_queryset(rows_by_pk)
+                deltas = {name: after[name] - before[name] for name in before}
+            else:
+                deltas = self._update_deltas(kwargs)
+                rows = super().update(**kwargs)
+            apply_deltas(deltas)
+        return rows
+
+    update.alters_data = True
+
+    def _update_deltas(self, values):
+        """
+        Work out how each counter changes when ``values`` are written to the
+        rows of this queryset, with one aggregate query run before the update.
+        """
+        aggregates = {}
+        for name, conditions in counters_for(self.model).items():
+            aggregates['before_' + name] = (
+                Count('pk', filter=Q(**conditions)) if conditions else Count('pk')
+            )
+            if any(values[field] != value for field, value in conditions.items() if field in values):
+                # The update moves every row out of this counter
+                continue
+            remaining = {field: value for field, value in conditions.items() if field not in values}
+            aggregates['after_' + name] = Count('pk', filter=Q(**remaining)) if remaining else Count('pk')
+
+        counts = self.order_by().aggregate(**aggregates)
+        return {
+            name: counts.get('after_' + name, 0) - counts['before_' + name]
+            for name in counters_for(self.model)
+        }
@@ -0,0 +1,178 @@
+# accounts/entitlements.py
+"""
+Compact representation of the content a radio station may receive.
+
+A station's religion, language and category access flags are folded into a
+single integer (RadioStation.entitlement_mask) with one bit per flag. A
+piece of content is described by its language, category and religion; the
+stations allowed to receive it are those whose mask contains every bit the
+content requires.
+"""
+from itertools import product
+
+from django.db import models
+from django.db.models import Case, IntegerField, Value, When
+from django.dispatch import Signal
+
+
+class Language(models.TextChoices):
+    ENGLISH = 'ENGLISH', 'English'
+    AFRIKAANS = 'AFRIKAANS', 'Afrikaans'
+    XHOSA = 'XHOSA', 'Xhosa'
+
+
+class Category(models.TextChoices):
+    NEWS_STORIES = 'NEWS_STORIES', 'News Stories'
+    NEWS_BULLETINS = 'NEWS_BULLETINS', 'News Bulletins'
+    SPORT = 'SPORT', 'Sport'
+    FINANCE = 'FINANCE', 'Finance'
+    SPECIALTY = 'SPECIALTY', 'Specialty'
+
+
+class Religion(models.TextChoices):
+    GENERAL = 'GENERAL', 'General'
+    CHRISTIAN = 'CHRISTIAN', 'Christian'
+    MUSLIM = 'MUSLIM', 'Muslim'
+
+
+# Station access field for each language and category
+LANGUAGE_FIELDS = {
+    Language.ENGLISH: 'access_english',
+    Language.AFRIKAANS: 'access_afrikaans',
+    Language.XHOSA: 'access_xhosa',
+}
+
+CATEGORY_FIELDS = {
+    Category.NEWS_STORIES: 'access_news_stories',
+    Category.NEWS_BULLETINS: 'access_news_bulletins',
+    Category.SPORT: 'access_sport',
+    Category.FINANCE: 'access_finance',
+    Category.SPECIALTY: 'access_specialty',
+}
+
+# Religious content each RadioStation.religion_access value receives
+RELIGION_ACCESS = {
+    'GENERAL_ONLY': (Religion.GENERAL,),
+    'GENERAL_PLUS_CHRISTIAN': (Religion.GENERAL, Religion.CHRISTIAN),
+    'GENERAL_PLUS_MUSLIM': (Religion.GENERAL, Religion.MUSLIM),
+}
+
+RELIGION_BITS = {
+    Religion.GENERAL: 1 << 0,
+    Religion.CHRISTIAN: 1 << 1,
+    Religion.MUSLIM: 1 << 2,
+}
+
+# Boolean access field -> bit
+FLAG_BITS = {
+    field: 1 << (3 + index)
+    for index, field in enumerate(list(LANGUAGE_FIELDS.values()) + list(CATEGORY_FIELDS.values()))
+}
+
+# Station fields the mask is derived from
+ENTITLEMENT_FIELDS = ('religion_access',) + tuple(FLAG_BITS)
+
+# Sent with ``station_ids`` after the entitlements or is_active of those
+# stations changed (or they were created), whether through save() or a
+# queryset update. save() also sends the saved instances as ``stations``.
+entitlements_changed = Signal()
+
+
+def religion_bits(religion_access):
+    bits = 0
+    for religion in RELIGION_ACCESS.get(religion_access, (Religion.GENERAL,)):
+        bits |= RELIGION_BITS[religion]
+    return bits
+
+
+def station_mask(station):
+    """Compute the entitlement mask of a station from its access fields"""
+    mask = religion_bits(station.religion_access)
+    for field, bit in FLAG_BITS.items():
+        if getattr(station, field):
+            mask |= bit
+    return mask
+
+
+def mask_expression(values=None):
+    """
+    Return a database expression that computes the entitlement mask from the
+    access columns, so it can be written in the same UPDATE as the flags.
+    Fields present in ``values`` use the given value instead of the column.
+    """
+    values = values or {}
+
+    if 'religion_access' in values:
+        expression = Value(religion_bits(values['religion_access']))
+    else:
+        expression = Case(
+            *[When(religion_access=access, then=Value(religion_bits(access))) for access in RELIGION_ACCESS],
+            default=Value(RELIGION_BITS[Religion.GENERAL]),
+            output_field=IntegerField(),
+        )
+
+    for field, bit in FLAG_BITS.items():
+        if field in values:
+            expression = expression + Value(bit if values[field] else 0)
+        else:
+            expression = expression + Case(
+                When(**{field: True}, then=Value(bit)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+    return expression
+
+
+def required_mask(language=None, category=None, religion=Religion.GENERAL):
+    """Return the bits a station needs to receive content with this descriptor"""
+    mask = 0
+    if language is not None:
+        if language not in LANGUAGE_FIELDS:
+            raise ValueError(f"Unknown language: {language}")
+        mask |= FLAG_BITS[LANGUAGE_FIELDS[language]]
+    if category is not None:
+        if category not in CATEGORY_FIELDS:
+            raise ValueError(f"Unknown category: {category}")
+        mask |= FLAG_BITS[CATEGORY_FIELDS[category]]
+    if religion is not None:
+        if religion not in RELIGION_BITS:
+            raise ValueError(f"Unknown religion: {religion}")
+        mask |= RELIGION_BITS[religion]
+    return mask
+
+
+def entitled_values(mask):
+    """Return the languages, categories and religions a station with this mask receives"""
+    languages = [language for language, field in LANGUAGE_FIELDS.items() if mask & FLAG_BITS[field]]
+    categories = [category for category, field in CATEGORY_FIELDS.items() if mask & FLAG_BITS[field]]
+    religions = [religion for religion, bit in RELIGION_BITS.items() if mask & bit]
+    return languages, categories, religions
+
+
+def _valid_masks():
+    flag_bits = list(FLAG_BITS.values())
+    masks = []
+    for access in RELIGION_ACCESS:
+        base = religion_bits(access)
+        for enabled in product((0, 1), repeat=len(flag_bits)):
+            mask = base
+            for bit, on in zip(flag_bits, enabled):
+                if on:
+                    mask |= bit
+            masks.append(mask)
+    return sorted(masks)
+
+
+# Every mask a station can actually have
+VALID_MASKS = _valid_masks()
+
+
+def matching_masks(required):
+    """
+    Return every valid mask that contains the required bits.
+
+    Filtering on ``entitlement_mask__in=matching_masks(...)`` lets the
+    database answer the query from the mask index instead of evaluating a
+    bitwise expression on every row.
+    """
+    return [mask for mask in VALID_MASKS if mask & required == required]
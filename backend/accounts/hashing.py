@@ -0,0 +1,194 @@
+# accounts/hashing.py
+"""
+Password hashing off the request thread.
+
+PBKDF2 keeps a CPU busy for tens of milliseconds per login. The async login
+views run it on a bounded pool instead of the event loop, and turn logins
+away with HashPoolBusy once too many are waiting, rather than letting every
+worker pile up behind the hasher.
+"""
+import asyncio
+import inspect
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_backends, get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.exceptions import PermissionDenied
+
+DEFAULT_HASH_POOL = {
+    # 'thread' works because hashlib releases the GIL while hashing;
+    # 'process' isolates hashing from the web workers completely
+    'KIND': 'thread',
+    'WORKERS': os.cpu_count() or 2,
+    # Logins allowed to wait for a worker before new ones are rejected
+    'MAX_QUEUE': 64,
+}
+
+
+# What authenticate() sends in user_login_failed in place of the password
+CLEANSED_SUBSTITUTE = '********************'
+
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing queue is full"""
+
+
+def verify_password(password, encoded):
+    """
+    Check a password against its encoded hash, and re-hash it when the
+    preferred hasher or its parameters have changed, like
+    User.check_password() does. Runs inside the pool.
+    """
+    rehashed = []
+    valid = check_password(password, encoded, setter=lambda raw: rehashed.append(make_password(raw)))
+    return valid, rehashed[0] if rehashed else None
+
+
+def hash_password(password):
+    return make_password(password)
+
+
+def _init_process():
+    import django
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'newskoop.settings')
+    django.setup()
+
+
+def process_executor(workers):
+    """Process pool whose workers have Django set up for make_password"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_process)
+
+
+class PasswordHashPool:
+    """Bounded executor for password hashing with queue-depth backpressure"""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @property
+    def config(self):
+        return {**DEFAULT_HASH_POOL, **getattr(settings, 'PASSWORD_HASH_POOL', {})}
+
+    @property
+    def capacity(self):
+        config = self.config
+        return config['WORKERS'] + config['MAX_QUEUE']
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                config = self.config
+                if config['KIND'] == 'process':
+                    self._executor = process_executor(config['WORKERS'])
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=config['WORKERS'], thread_name_prefix='password-hash'
+                    )
+            return self._executor
+
+    def submit(self, fn, *args):
+        executor = self.get_executor()
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise HashPoolBusy("Password hashing queue is full")
+            self.pending += 1
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    async def run(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'capacity': self.capacity,
+            }
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+            if future is not None:
+                self.completed += 1
+
+
+hash_pool = PasswordHashPool()
+
+
+async def aauthenticate(request, email, password):
+    """
+    Async equivalent of authenticate() for an email and password. The
+    backends in AUTHENTICATION_BACKENDS are tried in order, ModelBackend
+    with its hashing done on hash_pool and the others through their own
+    aauthenticate(). Sends user_login_failed when none accepts the
+    credentials. Returns the user (with radio_station loaded by
+    ModelBackend) or None, and raises HashPoolBusy under overload.
+    """
+    credentials = {'username': email, 'password': password}
+    # get_backends() loads AUTHENTICATION_BACKENDS in order
+    for backend_path, backend in zip(settings.AUTHENTICATION_BACKENDS, get_backends()):
+        try:
+            if isinstance(backend, ModelBackend):
+                user = await model_backend_authenticate(backend, email, password)
+            else:
+                try:
+                    inspect.signature(backend.authenticate).bind(request, **credentials)
+                except TypeError:
+                    # This backend doesn't accept these credentials
+                    continue
+                user = await backend.aauthenticate(request, **credentials)
+        except PermissionDenied:
+            # This backend says to stop in our tracks
+            break
+        if user is None:
+            continue
+        user.backend = backend_path
+        return user
+
+    # Masked like authenticate() masks them, so receivers never see the password
+    credentials['password'] = CLEANSED_SUBSTITUTE
+    await user_login_failed.asend(sender=__name__, credentials=credentials, request=request)
+    return None
+
+
+async def model_backend_authenticate(backend, email, password):
+    """ModelBackend.authenticate() with the password checked on hash_pool"""
+    User = get_user_model()
+    try:
+        user = await User._default_manager.select_related('radio_station').aget(**{User.USERNAME_FIELD: email})
+    except User.DoesNotExist:
+        # Hash anyway so unknown emails take as long as wrong passwords
+        await hash_pool.run(hash_password, password)
+        return None
+
+    valid, new_encoded = await hash_pool.run(verify_password, password, user.password)
+    if not valid or not backend.user_can_authenticate(user):
+        return None
+
+    if new_encoded:
+        user.password = new_encoded
+        await user.asave(update_fields=['password'])
+    return user
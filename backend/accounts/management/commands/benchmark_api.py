@@ -0,0 +1,365 @@
+# accounts/management/commands/benchmark_api.py
+import asyncio
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import statistics
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import django
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.authentication import user_cache
+from accounts.management.commands.benchmark_async_views import call
+from accounts.management.commands.benchmark_logins import percentile
+from accounts.models import CustomUser, RadioStation
+
+SCENARIOS = ('login', 'token-refresh', 'profile', 'admin-users', 'stations', 'user-list-page', 'station-list-page')
+
+METRIC_KEYS = ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms')
+
+# Metrics that fail the comparison with a baseline; p99 is reported, but
+# with a few hundred requests it is too noisy to gate on
+GATED_KEYS = ('requests_per_second', 'p50_ms', 'p95_ms')
+
+
+def unthrottled():
+    """REST_FRAMEWORK settings with every throttle rate out of reach"""
+    rates = settings.REST_FRAMEWORK.get('DEFAULT_THROTTLE_RATES', {})
+    return {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {scope: '1000000/min' for scope in rates}}
+
+
+def summarize(scenario, latencies, errors, elapsed):
+    return {
+        'scenario': scenario,
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+def median_result(rounds):
+    """Combine the rounds of a scenario, taking the median of each metric"""
+    result = dict(rounds[0])
+    result['requests'] = sum(round_['requests'] for round_ in rounds)
+    result['errors'] = sum(round_['errors'] for round_ in rounds)
+    for key in METRIC_KEYS:
+        result[key] = round(statistics.median(round_[key] for round_ in rounds), 1)
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with a baseline run, returning a row per scenario in
+    both, as (scenario, {metric: (baseline, current, change)}, regressed metrics).
+    """
+    previous = {result['scenario']: result for result in baseline.get('results', [])}
+    rows = []
+    for result in results:
+        before = previous.get(result['scenario'])
+        if before is None:
+            continue
+        changes = {}
+        regressed = []
+        for key in METRIC_KEYS:
+            old, new = before[key], result[key]
+            change = (new - old) / old if old else 0.0
+            changes[key] = (old, new, change)
+            worse = -change if key == 'requests_per_second' else change
+            if key in GATED_KEYS and worse > tolerance:
+                regressed.append(key)
+        rows.append((result['scenario'], changes, regressed))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test the accounts API and pages at a given concurrency, reporting throughput "
+        "and p50/p95/p99 latency per scenario. Requests go through the ASGI application "
+        "in-process, with the throttle rates raised out of reach, or to a running server "
+        "with --url (which must use this database, and be started with the THROTTLE_RATE_* "
+        "variables raised, as all requests come from one address). "
+        "Save a run with --save and compare a later one with --baseline; the command "
+        "fails when a scenario regressed by more than --tolerance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help="Comma separated: " + ', '.join(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=300, help="Requests per scenario")
+        parser.add_argument(
+            '--login-requests', type=int, default=30,
+            help="Requests for the login scenario, which hashes a password each time",
+        )
+        parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients")
+        parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per scenario")
+        parser.add_argument('--rounds', type=int, default=3, help="Runs per scenario; the median is reported")
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--stations', type=int, default=50, help="Radio stations to create, with 4 users each")
+        parser.add_argument('--seed', type=int, default=0, help="Seed for the generated data")
+        parser.add_argument('--save', help="Write the results to this JSON file")
+        parser.add_argument('--baseline', help="Compare with the results in this JSON file")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed change before a regression")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        self.random = random.Random(options['seed'])
+        self.tag = uuid.uuid4().hex[:8]
+        results = []
+        try:
+            self.create_data(options)
+            for scenario in scenarios:
+                total = options['login_requests'] if scenario == 'login' else options['requests']
+                rounds = []
+                for _ in range(options['rounds']):
+                    requests = self.requests_for(scenario, options['warmup'] + total)
+                    cache.clear()
+                    user_cache.clear()
+                    if options['url']:
+                        rounds.append(self.run_http(
+                            options['url'], scenario, requests, options['warmup'], options['concurrency'],
+                        ))
+                    else:
+                        rounds.append(self.run_asgi(scenario, requests, options['warmup'], options['concurrency']))
+                results.append(median_result(rounds))
+        finally:
+            self.delete_data()
+
+        run = {
+            'environment': {
+                'target': options['url'] or 'asgi',
+                'concurrency': options['concurrency'],
+                'rounds': options['rounds'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'cpus': os.cpu_count(),
+                'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            },
+            'results': results,
+        }
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(run, f, indent=2)
+                f.write('\n')
+
+        if options['json']:
+            self.stdout.write(json.dumps(run, indent=2))
+        else:
+            self.write_table(results)
+
+        if baseline is not None:
+            rows = compare(results, baseline, options['tolerance'])
+            self.write_comparison(rows)
+            regressions = [scenario for scenario, _, regressed in rows if regressed]
+            if regressions:
+                raise CommandError(f"Performance regressed for: {', '.join(regressions)}")
+
+    # --- Data ---
+
+    def create_data(self, options):
+        password = uuid.uuid4().hex
+        self.password = password
+        stations = RadioStation.objects.bulk_create(
+            RadioStation(name=f'Benchmark {self.tag} {n:04d}', province='gauteng')
+            for n in range(options['stations'])
+        )
+        for station in stations:
+            for n in range(4):
+                CustomUser.objects.create_user(
+                    f'benchmark-{self.tag}-{station.pk.hex[:8]}-{n}@newskoop.invalid', None,
+                    user_type=CustomUser.UserType.RADIO, radio_station=station,
+                )
+        self.login_user = CustomUser.objects.create_user(
+            f'benchmark-{self.tag}-login@newskoop.invalid', password, staff_role=CustomUser.StaffRole.INTERN,
+        )
+        # Authenticated requests are spread over enough admins to stay under the user throttle
+        per_admin = 900
+        authenticated = 3 * options['rounds'] * (options['requests'] + options['warmup'])
+        self.admins = [
+            CustomUser.objects.create_user(
+                f'benchmark-{self.tag}-admin{n}@newskoop.invalid', None, staff_role=CustomUser.StaffRole.ADMIN,
+            )
+            for n in range(authenticated // per_admin + 1)
+        ]
+        self.tokens = [str(RefreshToken.for_user(admin).access_token) for admin in self.admins]
+        self.station_ids = [station.pk for station in stations]
+        session = Client()
+        session.force_login(self.admins[0])
+        self.session_cookie = f"sessionid={session.cookies['sessionid'].value}"
+
+    def delete_data(self):
+        OutstandingToken.objects.filter(user__email__startswith=f'benchmark-{self.tag}-').delete()
+        CustomUser.objects.filter(email__startswith=f'benchmark-{self.tag}-').delete()
+        RadioStation.objects.filter(name__startswith=f'Benchmark {self.tag} ').delete()
+        cache.clear()
+
+    # --- Requests ---
+
+    def requests_for(self, scenario, count):
+        """(method, path, headers, body) for each request of a scenario"""
+        requests = []
+        for n in range(count):
+            headers = {'Accept': 'application/json'}
+            token = self.tokens[n % len(self.tokens)]
+            method, body = 'GET', b''
+            if scenario == 'login':
+                method, path = 'POST', '/api/accounts/login/'
+                body = json.dumps({'email': self.login_user.email, 'password': self.password}).encode()
+                headers['Content-Type'] = 'application/json'
+            elif scenario == 'token-refresh':
+                # Refresh tokens are rotated, so each can be used once
+                method, path = 'POST', '/api/accounts/token/refresh/'
+                body = json.dumps({'refresh': str(RefreshToken.for_user(self.login_user))}).encode()
+                headers['Content-Type'] = 'application/json'
+            elif scenario == 'profile':
+                path = '/api/accounts/profile/'
+                headers['Authorization'] = f'Bearer {token}'
+            elif scenario == 'admin-users':
+                page = self.random.randint(1, 20)
+                path = f'/api/accounts/admin/users/?page={page}'
+                headers['Authorization'] = f'Bearer {token}'
+            elif scenario == 'stations':
+                page = self.random.randint(1, max(1, len(self.station_ids) // 10))
+                path = f'/api/accounts/radio/stations/?page={page}'
+                headers['Authorization'] = f'Bearer {token}'
+            elif scenario == 'user-list-page':
+                path = f'/accounts/users/?page={self.random.randint(1, 20)}'
+                headers.update({'Cookie': self.session_cookie, 'Accept': 'text/html'})
+            else:
+                path = f'/accounts/stations/?page={self.random.randint(1, 5)}'
+                headers.update({'Cookie': self.session_cookie, 'Accept': 'text/html'})
+            requests.append((method, path, headers, body))
+        return requests
+
+    # --- Transports ---
+
+    def run_asgi(self, scenario, requests, warmup, concurrency):
+        """Clients on one event loop, calling the ASGI application directly"""
+        app = get_asgi_application()
+        latencies = []
+        errors = [0]
+
+        async def send(request):
+            method, path, headers, body = request
+            return await call(app, path, method=method, body=body, headers=list(headers.items()))
+
+        async def client(queue, measured):
+            while queue:
+                request = queue.pop()
+                start = time.perf_counter()
+                status = await send(request)
+                elapsed = time.perf_counter() - start
+                if not measured:
+                    continue
+                if status != 200:
+                    errors[0] += 1
+                else:
+                    latencies.append(elapsed)
+
+        async def run(batch, measured):
+            queue = list(reversed(batch))
+            await asyncio.gather(*(client(queue, measured) for _ in range(concurrency)))
+
+        with override_settings(DEBUG=False, REST_FRAMEWORK=unthrottled()):
+            asyncio.run(run(requests[:warmup], False))
+            start = time.perf_counter()
+            asyncio.run(run(requests[warmup:], True))
+            elapsed = time.perf_counter() - start
+        return summarize(scenario, latencies, errors[0], elapsed)
+
+    def run_http(self, base_url, scenario, requests, warmup, concurrency):
+        """One thread per client, each with its own keep-alive connection"""
+        url = urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        prefix = url.path.rstrip('/')
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def worker(queue, measured):
+            connection = connection_class(url.hostname, url.port, timeout=60)
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        method, path, headers, body = queue.pop()
+                    start = time.perf_counter()
+                    try:
+                        connection.request(method, prefix + path, body=body or None, headers=headers)
+                        response = connection.getresponse()
+                        response.read()
+                        status = response.status
+                    except (OSError, http.client.HTTPException):
+                        connection.close()
+                        status = 0
+                    elapsed = time.perf_counter() - start
+                    if not measured:
+                        continue
+                    with lock:
+                        if status != 200:
+                            errors[0] += 1
+                        else:
+                            latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        def run(batch, measured):
+            queue = list(reversed(batch))
+            threads = [threading.Thread(target=worker, args=(queue, measured)) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        run(requests[:warmup], False)
+        start = time.perf_counter()
+        run(requests[warmup:], True)
+        elapsed = time.perf_counter() - start
+        return summarize(scenario, latencies, errors[0], elapsed)
+
+    # --- Output ---
+
+    def write_table(self, results):
+        self.stdout.write(
+            f"{'scenario':<19}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['scenario']:<19}{result['requests']:>9}{result['errors']:>8}"
+                f"{result['requests_per_second']:>9}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+            )
+
+    def write_comparison(self, rows):
+        self.stdout.write('')
+        self.stdout.write(f"{'scenario':<19}{'req/s':>16}{'p50 ms':>16}{'p95 ms':>16}{'p99 ms':>16}")
+        for scenario, changes, regressed in rows:
+            cells = ''.join(
+                f"{f'{changes[key][2]:+.0%}' + (' !' if key in regressed else ''):>16}"
+                for key in METRIC_KEYS
+            )
+            self.stdout.write(f"{scenario:<19}{cells}")
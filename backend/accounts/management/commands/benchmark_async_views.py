@@ -0,0 +1,220 @@
+# accounts/management/commands/benchmark_async_views.py
+import asyncio
+import json
+import threading
+import time
+import tracemalloc
+import uuid
+from types import ModuleType
+
+from django.core.asgi import get_asgi_application
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.urls import path, re_path
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts import admin_views, async_views
+from accounts.authentication import user_cache
+from accounts.management.commands.benchmark_logins import percentile
+from accounts.models import CustomUser, RadioStation
+from accounts.views import UserProfileView
+
+ENDPOINTS = ('profile', 'stats', 'stations', 'station', 'station-users')
+
+
+def urlconf(stack):
+    """A URLconf serving the read endpoints from the sync or the async views"""
+    if stack == 'sync':
+        views = [
+            UserProfileView.as_view(), admin_views.system_stats, async_views.sync_station_list,
+            async_views.sync_station_detail, async_views.sync_station_users,
+        ]
+    else:
+        views = [
+            async_views.profile_view, async_views.system_stats_view, async_views.station_list_view,
+            async_views.station_detail_view, async_views.station_users_view,
+        ]
+    module = ModuleType(f'benchmark_{stack}_urls')
+    module.urlpatterns = [
+        path('profile/', views[0]),
+        path('admin/stats/', views[1]),
+        path('radio/stations/', views[2]),
+        re_path(r'^radio/stations/(?P<pk>[^/.]+)/$', views[3]),
+        re_path(r'^radio/stations/(?P<pk>[^/.]+)/users/$', views[4]),
+    ]
+    return module
+
+
+async def call(app, url, token=None, method='GET', body=b'', headers=()):
+    """Send one request through the ASGI application, returning the status code"""
+    path, _, query = url.partition('?')
+    request_headers = {'host': 'localhost', 'accept': 'application/json'}
+    if token:
+        request_headers['authorization'] = f'Bearer {token}'
+    if body:
+        request_headers['content-length'] = str(len(body))
+    request_headers.update((name.lower(), value) for name, value in headers)
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(name.encode(), value.encode()) for name, value in request_headers.items()],
+        'client': ('127.0.0.1', 40000),
+        'server': ('localhost', 80),
+    }
+    requested = False
+    status = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # The client stays connected until the handler cancels this
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await app(scope, receive, send)
+    return status[0] if status else 0
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync DRF views with the async views of accounts/async_views.py, "
+        "both served through the ASGI application: requests per second, latency, "
+        "Python memory allocated per open connection and threads in use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint and stack")
+        parser.add_argument('--concurrency', type=int, default=200, help="Open connections")
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help="Comma separated: " + ', '.join(ENDPOINTS))
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        station = RadioStation.objects.create(name=f'Benchmark {tag}')
+        for n in range(5):
+            CustomUser.objects.create_user(
+                f'benchmark-{tag}-radio{n}@newskoop.invalid', None,
+                user_type=CustomUser.UserType.RADIO, radio_station=station,
+            )
+        # Spread each run's requests over enough users to stay under the
+        # user throttle (its history is cleared with the cache between runs)
+        per_run = options['requests'] + 2 * options['concurrency']
+        admins = [
+            CustomUser.objects.create_user(
+                f'benchmark-{tag}-admin{n}@newskoop.invalid', None,
+                staff_role=CustomUser.StaffRole.ADMIN,
+            )
+            for n in range(per_run // 900 + 1)
+        ]
+        tokens = [str(RefreshToken.for_user(user).access_token) for user in admins]
+        urls = {
+            'profile': '/profile/',
+            'stats': '/admin/stats/',
+            'stations': '/radio/stations/',
+            'station': f'/radio/stations/{station.pk}/',
+            'station-users': f'/radio/stations/{station.pk}/users/',
+        }
+
+        results = []
+        try:
+            app = get_asgi_application()
+            for endpoint in options['endpoints'].split(','):
+                endpoint = endpoint.strip()
+                for stack in ('sync', 'async'):
+                    with override_settings(ROOT_URLCONF=urlconf(stack), DEBUG=False):
+                        cache.clear()
+                        user_cache.clear()
+                        results.append(self.run(
+                            app, stack, endpoint, urls[endpoint], tokens,
+                            options['requests'], options['concurrency'],
+                        ))
+        finally:
+            CustomUser.objects.filter(email__startswith=f'benchmark-{tag}-').delete()
+            station.delete()
+            cache.clear()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'endpoint':<15}{'stack':<7}{'requests':>9}{'errors':>8}{'req/s':>9}"
+            f"{'p50 ms':>9}{'p99 ms':>9}{'KiB/conn':>10}{'threads':>9}"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['endpoint']:<15}{result['stack']:<7}{result['requests']:>9}{result['errors']:>8}"
+                f"{result['requests_per_second']:>9}{result['p50_ms']:>9}{result['p99_ms']:>9}"
+                f"{result['kib_per_connection']:>10}{result['peak_threads']:>9}"
+            )
+
+    def run(self, app, stack, endpoint, url, tokens, total, concurrency):
+        latencies = []
+        errors = [0]
+        remaining = [total]
+        peak_threads = [threading.active_count()]
+
+        async def client(index):
+            token = tokens[index % len(tokens)]
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                status = await call(app, url, token)
+                if status != 200:
+                    errors[0] += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        async def watch_threads(done):
+            while not done.is_set():
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+                await asyncio.sleep(0.005)
+
+        async def throughput():
+            done = asyncio.Event()
+            watcher = asyncio.create_task(watch_threads(done))
+            await asyncio.gather(*(client(index) for index in range(concurrency)))
+            done.set()
+            await watcher
+
+        async def one_request_per_connection():
+            await asyncio.gather(*(call(app, url, tokens[index % len(tokens)]) for index in range(concurrency)))
+
+        # Warm up caches and connections before measuring
+        asyncio.run(one_request_per_connection())
+
+        start = time.perf_counter()
+        asyncio.run(throughput())
+        elapsed = time.perf_counter() - start
+
+        # Memory: everything allocated while `concurrency` requests are in flight
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        asyncio.run(one_request_per_connection())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        return {
+            'endpoint': endpoint,
+            'stack': stack,
+            'requests': len(latencies),
+            'errors': errors[0],
+            'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'kib_per_connection': round((peak - baseline) / concurrency / 1024, 1),
+            'peak_threads': peak_threads[0],
+        }
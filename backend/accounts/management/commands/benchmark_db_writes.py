@@ -0,0 +1,150 @@
+# accounts/management/commands/benchmark_db_writes.py
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from accounts.management.commands.benchmark_logins import percentile
+
+ROW_TABLE = 'benchmark_db_writes_row'
+LOG_TABLE = 'benchmark_db_writes_log'
+ROWS = 100
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent write throughput under each database profile. Every "
+        "write mimics a login: update one row and insert another, in one transaction."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profiles', default='sqlite-default,sqlite-tuned,configured',
+            help="Comma separated: sqlite-default, sqlite-tuned (temporary files) "
+                 "and configured (scratch tables in the default database)",
+        )
+        parser.add_argument('--threads', type=int, default=8, help="Concurrent writers")
+        parser.add_argument('--seconds', type=float, default=5.0, help="Duration per profile")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        results = []
+        for profile in options['profiles'].split(','):
+            profile = profile.strip()
+            with self.database(profile) as alias:
+                results.append(self.run(profile, alias, options['threads'], options['seconds']))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'profile':<16}{'writes':>8}{'errors':>8}{'writes/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result['profile']:<16}{result['writes']:>8}{result['errors']:>8}"
+                f"{result['writes_per_second']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+            )
+
+    @contextmanager
+    def database(self, profile):
+        """Register a connection alias for the profile, with the benchmark tables"""
+        path = None
+        if profile == 'configured':
+            alias = 'default'
+        elif profile in ('sqlite-default', 'sqlite-tuned'):
+            handle, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(handle)
+            alias = f'benchmark-{profile}'
+            connections.settings[alias] = {
+                **connections.settings['default'],
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': path,
+                'CONN_MAX_AGE': 0,
+                'OPTIONS': dict(settings.SQLITE_TUNED_OPTIONS) if profile == 'sqlite-tuned' else {},
+            }
+        else:
+            raise CommandError(f"Unknown profile '{profile}'")
+
+        self.create_tables(alias)
+        try:
+            yield alias
+        finally:
+            self.drop_tables(alias)
+            connections[alias].close()
+            if path:
+                del connections[alias]
+                del connections.settings[alias]
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+
+    def create_tables(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'CREATE TABLE {ROW_TABLE} (id INTEGER PRIMARY KEY, counter INTEGER NOT NULL, touched_at VARCHAR(40))')
+            cursor.execute(f'CREATE TABLE {LOG_TABLE} (row_id INTEGER NOT NULL, created_at VARCHAR(40))')
+            for row_id in range(ROWS):
+                cursor.execute(f'INSERT INTO {ROW_TABLE} (id, counter) VALUES (%s, 0)', [row_id])
+
+    def drop_tables(self, alias):
+        with connections[alias].cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {LOG_TABLE}')
+            cursor.execute(f'DROP TABLE IF EXISTS {ROW_TABLE}')
+
+    def run(self, profile, alias, threads, seconds):
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def worker():
+            try:
+                while time.perf_counter() < deadline:
+                    row_id = random.randrange(ROWS)
+                    now = timezone.now().isoformat()
+                    start = time.perf_counter()
+                    try:
+                        with transaction.atomic(using=alias):
+                            with connections[alias].cursor() as cursor:
+                                cursor.execute(
+                                    f'UPDATE {ROW_TABLE} SET counter = counter + 1, touched_at = %s WHERE id = %s',
+                                    [now, row_id],
+                                )
+                                cursor.execute(
+                                    f'INSERT INTO {LOG_TABLE} (row_id, created_at) VALUES (%s, %s)', [row_id, now]
+                                )
+                    except DatabaseError:
+                        # "database is locked" and friends
+                        with lock:
+                            errors[0] += 1
+                        continue
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+            finally:
+                connections[alias].close()
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        return {
+            'profile': profile,
+            'vendor': connections[alias].vendor,
+            'writes': len(latencies),
+            'errors': errors[0],
+            'writes_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        }
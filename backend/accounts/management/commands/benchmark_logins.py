@@ -0,0 +1,119 @@
+# accounts/management/commands/benchmark_logins.py
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+from django.contrib.auth import authenticate
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.hashing import HashPoolBusy, aauthenticate, hash_pool
+from accounts.models import CustomUser
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name, latencies, elapsed, rejected=0):
+    return {
+        'path': name,
+        'logins': len(latencies),
+        'rejected': rejected,
+        'logins_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = "Measure login throughput and p99 latency of the sync and async (hash pool) login paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200, help="Logins per path")
+        parser.add_argument('--concurrency', type=int, default=16, help="Concurrent logins")
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        email = f'benchmark-{uuid.uuid4().hex}@newskoop.invalid'
+        password = uuid.uuid4().hex
+        user = CustomUser.objects.create_user(
+            email, password, staff_role=CustomUser.StaffRole.INTERN
+        )
+        try:
+            results = [
+                self.run_sync(email, password, options['logins'], options['concurrency']),
+                self.run_async(email, password, options['logins'], options['concurrency']),
+            ]
+        finally:
+            user.delete()
+            hash_pool.shutdown()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{'path':<8}{'logins':>8}{'rejected':>10}{'logins/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for result in results:
+            self.stdout.write(
+                f"{result['path']:<8}{result['logins']:>8}{result['rejected']:>10}"
+                f"{result['logins_per_second']:>10}{result['p50_ms']:>10}{result['p99_ms']:>10}"
+            )
+
+    def run_sync(self, email, password, total, concurrency):
+        """One thread per concurrent login, each calling authenticate() inline"""
+        latencies = []
+        remaining = [total]
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    start = time.perf_counter()
+                    assert authenticate(username=email, password=password) is not None
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize('sync', latencies, time.perf_counter() - start)
+
+    def run_async(self, email, password, total, concurrency):
+        """Concurrent logins on one event loop, hashing on the hash pool"""
+        latencies = []
+        rejected = [0]
+
+        async def login(semaphore):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    assert await aauthenticate(None, email, password) is not None
+                except HashPoolBusy:
+                    rejected[0] += 1
+                    return
+                latencies.append(time.perf_counter() - start)
+
+        async def run():
+            semaphore = asyncio.Semaphore(concurrency)
+            await asyncio.gather(*(login(semaphore) for _ in range(total)))
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        return summarize('async', latencies, time.perf_counter() - start, rejected[0])
@@ -0,0 +1,35 @@
+# accounts/management/commands/prune_activity.py
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.activity import activity_settings, prune_events
+from accounts.models import ActivityEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete activity events older than the retention period, in batches. "
+        "Run it regularly, e.g. daily from cron."
+    )
+
+    def add_arguments(self, parser):
+        config = activity_settings()
+        parser.add_argument('--days', type=int, default=config['RETENTION_DAYS'], help="Days of events to keep")
+        parser.add_argument(
+            '--batch-size', type=int, default=config['PRUNE_BATCH_SIZE'], help="Events deleted per transaction",
+        )
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the expired events")
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+
+        if options['dry_run']:
+            count = ActivityEvent.objects.filter(created_at__lt=before).count()
+            self.stdout.write(f"{count} activity event(s) would be deleted.")
+            return
+
+        deleted = sum(prune_events(before, options['batch_size'], options['sleep']))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} activity event(s) older than {options['days']} days."))
@@ -0,0 +1,49 @@
+# accounts/management/commands/prune_tokens.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from accounts.blacklist import blacklist_filter
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired outstanding and blacklisted JWT refresh tokens in batches. "
+        "Run it regularly, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Tokens deleted per transaction")
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the expired tokens")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('pk')
+
+        if options['dry_run']:
+            self.stdout.write(f"{expired.count()} expired token(s) would be deleted.")
+            return
+
+        outstanding_deleted = blacklisted_deleted = 0
+        while True:
+            # Short transactions keep locks brief on a busy token table
+            with transaction.atomic():
+                pks = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+                if not pks:
+                    break
+                blacklisted_deleted += BlacklistedToken.objects.filter(token_id__in=pks).delete()[0]
+                outstanding_deleted += OutstandingToken.objects.filter(pk__in=pks).delete()[0]
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        if blacklisted_deleted:
+            blacklist_filter.rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {outstanding_deleted} expired outstanding token(s) "
+            f"and {blacklisted_deleted} blacklisted token(s)."
+        ))
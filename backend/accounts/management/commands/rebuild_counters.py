@@ -0,0 +1,31 @@
+# accounts/management/commands/rebuild_counters.py
+from django.core.management.base import BaseCommand
+
+from accounts.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute the dashboard counters from the user and station tables and report drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report drift, don't store the recomputed values",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        drift = rebuild_counters(dry_run=dry_run)
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("All counters are in sync."))
+            return
+
+        for name, (stored, actual) in sorted(drift.items()):
+            self.stdout.write(f"{name}: stored {stored}, actual {actual}")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} counter(s) have drifted."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(drift)} counter(s)."))
@@ -0,0 +1,17 @@
+# accounts/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+
+from accounts.search import SEARCH_FIELDS, rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the SQLite full-text search indexes from their tables. "
+        "Run it after VACUUM, which can renumber the rowids the indexes refer to."
+    )
+
+    def handle(self, *args, **options):
+        for table in SEARCH_FIELDS:
+            rebuild_index(table)
+            self.stdout.write(f"Rebuilt search index for {table}")
+        self.stdout.write(self.style.SUCCESS("Search indexes rebuilt."))
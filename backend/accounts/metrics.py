@@ -0,0 +1,351 @@
+# accounts/metrics.py
+"""
+Request metrics in Prometheus text format.
+
+MetricsMiddleware records, per resolved URL name, the latency, response
+size, number of SQL queries and SQL time of every request (the query
+stats come from QueryBudgetMiddleware), and counts responses by status.
+Each worker process keeps its aggregates in memory and a background
+thread writes them to its own file in METRICS['DIRECTORY'] every
+FLUSH_INTERVAL seconds, so requests never wait on the disk; the /metrics
+endpoint adds up the files of all workers. The files are named by PID and
+a boot id drawn when the process starts, so a worker reusing a dead
+worker's PID doesn't overwrite its totals. Point DIRECTORY at a
+directory that is emptied when the service is deployed.
+
+With METRICS['ENABLED'] off the middleware removes itself from the stack.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.renderers import BaseRenderer
+
+DEFAULT_METRICS = {
+    'ENABLED': False,
+    'DIRECTORY': None,
+    'FLUSH_INTERVAL': 5,
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+# name -> (type, help, label names, buckets)
+METRICS = {
+    'newskoop_http_requests_total': (
+        'counter', "Responses by URL name, method and status code", ('view', 'method', 'status'), None,
+    ),
+    'newskoop_http_request_duration_seconds': (
+        'histogram', "Time taken to produce a response", ('view', 'method'), LATENCY_BUCKETS,
+    ),
+    'newskoop_http_response_size_bytes': (
+        'histogram', "Size of the response body", ('view',), SIZE_BUCKETS,
+    ),
+    'newskoop_db_queries_per_request': (
+        'histogram', "SQL queries run per request", ('view',), QUERY_BUCKETS,
+    ),
+    'newskoop_db_query_duration_seconds': (
+        'histogram', "SQL time per request", ('view',), LATENCY_BUCKETS,
+    ),
+}
+
+# Anything else is counted as OTHER, so odd methods can't add label values
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+def metrics_settings():
+    return {**DEFAULT_METRICS, **getattr(settings, 'METRICS', {})}
+
+
+class Registry:
+    """The aggregates of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        if getattr(self, 'stopped', None) is not None:
+            # Stop the flusher of the aggregates being discarded
+            self.stopped.set()
+        self.pid = os.getpid()
+        self.boot_id = uuid.uuid4().hex[:12]
+        self.counters = {}
+        # (name, labels) -> [per-bucket counts, sum, count]
+        self.histograms = {}
+        self.flusher = None
+        self.stopped = threading.Event()
+
+    @property
+    def filename(self):
+        return f'{self.pid}-{self.boot_id}.json'
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][3]
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = [[0] * len(buckets), 0.0, 0]
+        index = bisect_left(buckets, value)
+        if index < len(buckets):
+            histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+    def record_request(self, view, method, status, duration, size, queries, sql_time):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Forked from the process that imported us: start from zero
+                self.reset()
+            self.inc('newskoop_http_requests_total', (view, method, str(status)))
+            self.observe('newskoop_http_request_duration_seconds', (view, method), duration)
+            if size is not None:
+                self.observe('newskoop_http_response_size_bytes', (view,), size)
+            if queries is not None:
+                self.observe('newskoop_db_queries_per_request', (view,), queries)
+                self.observe('newskoop_db_query_duration_seconds', (view,), sql_time)
+
+    def snapshot(self):
+        """The aggregates as a JSON-serializable dict"""
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), list(counts), total, count]
+                    for (name, labels), (counts, total, count) in self.histograms.items()
+                ],
+            }
+
+    def flush(self, directory):
+        """Write this process's aggregates to its file in ``directory``"""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.filename)
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self.snapshot(), f)
+        # Readers see either the old file or the new one, never half of it
+        os.replace(temporary, path)
+
+    def start_flusher(self, directory, interval):
+        """Flush every ``interval`` seconds from a daemon thread, once per process"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.reset()
+            if self.flusher is not None:
+                return
+            self.flusher = threading.Thread(
+                target=self.flush_every, args=(directory, interval, self.stopped),
+                name='metrics-flusher', daemon=True,
+            )
+            self.flusher.start()
+
+    def flush_every(self, directory, interval, stopped):
+        while not stopped.wait(interval):
+            if self.counters:
+                try:
+                    self.flush(directory)
+                except OSError:
+                    # Try again next time, e.g. once the directory is writable
+                    continue
+
+
+registry = Registry()
+
+
+def read_snapshots(directory):
+    """The snapshots written by the other processes"""
+    own = registry.filename
+    snapshots = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        if not name.endswith('.json') or name == own:
+            continue
+        try:
+            with open(os.path.join(directory, name)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    """Add up snapshots into {(name, labels): value or [counts, sum, count]}"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            if name in METRICS:
+                key = (name, tuple(labels))
+                counters[key] = counters.get(key, 0) + value
+        for name, labels, counts, total, count in snapshot.get('histograms', []):
+            if name not in METRICS or len(counts) != len(METRICS[name][3]):
+                # Written with other buckets, by an older release
+                continue
+            key = (name, tuple(labels))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0, 0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+            merged[2] += count
+    return counters, histograms
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_number(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def render_metrics(counters, histograms):
+    """The merged aggregates in the Prometheus text exposition format"""
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f'{name}{format_labels(label_names, labels)} {format_number(value)}')
+            continue
+        for (series, labels), (counts, total, count) in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                le = format_labels(label_names, labels, [('le', format_number(float(bound)))])
+                lines.append(f'{name}_bucket{le} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(label_names, labels, [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{format_labels(label_names, labels)} {format_number(total)}')
+            lines.append(f'{name}_count{format_labels(label_names, labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def collect():
+    """The metrics of every worker, as Prometheus text"""
+    snapshots = [registry.snapshot()]
+    directory = metrics_settings()['DIRECTORY']
+    if directory:
+        snapshots += read_snapshots(directory)
+    return render_metrics(*merge(snapshots))
+
+
+def flush_on_exit():
+    options = metrics_settings()
+    if options['ENABLED'] and options['DIRECTORY'] and registry.counters:
+        registry.flush(options['DIRECTORY'])
+
+
+atexit.register(flush_on_exit)
+
+
+def view_label(request):
+    """The URL name of the view that handled a request"""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Unmatched URLs share one label, so scanners can't add series
+        return 'unresolved'
+    return match.view_name or match.route
+
+
+class PrometheusRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, str):
+            # Error responses
+            data = ''.join(f'# {key}: {value}\n' for key, value in data.items())
+        return data.encode(self.charset)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, response size and SQL stats of every request.
+    Must come before QueryBudgetMiddleware, so the query stats are
+    complete when it reads them.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        options = metrics_settings()
+        if not options['ENABLED']:
+            raise MiddlewareNotUsed
+        self.directory = options['DIRECTORY']
+        self.flush_interval = options['FLUSH_INTERVAL']
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except Exception:
+            self.record(request, None, time.perf_counter() - start)
+            raise
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        except Exception:
+            self.record(request, None, time.perf_counter() - start)
+            raise
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, duration):
+        if response is None:
+            status, size = 500, None
+        elif response.streaming:
+            status = response.status_code
+            length = response.get('Content-Length')
+            size = int(length) if length else None
+        else:
+            status, size = response.status_code, len(response.content)
+
+        stats = getattr(request, 'query_stats', None)
+        registry.record_request(
+            view_label(request),
+            request.method if request.method in METHODS else 'OTHER',
+            status,
+            duration,
+            size,
+            stats.count if stats is not None else None,
+            stats.duration if stats is not None else 0.0,
+        )
+        if self.directory and registry.flusher is None:
+            registry.start_flusher(self.directory, self.flush_interval)
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:48
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def seed_counters(apps, schema_editor):
+    """Store the current counts so the counters start out exact"""
+    StatCounter = apps.get_model('accounts', 'StatCounter')
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    RadioStation = apps.get_model('accounts', 'RadioStation')
+
+    values = CustomUser.objects.aggregate(
+        total_users=Count('pk'),
+        active_users=Count('pk', filter=Q(is_active=True)),
+        staff_users=Count('pk', filter=Q(user_type='STAFF')),
+        radio_users=Count('pk', filter=Q(user_type='RADIO')),
+    )
+    values.update(RadioStation.objects.aggregate(
+        total_stations=Count('pk'),
+        active_stations=Count('pk', filter=Q(is_active=True)),
+    ))
+    StatCounter.objects.bulk_create([
+        StatCounter(name=name, value=value) for name, value in values.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_customuser_joined_keyset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
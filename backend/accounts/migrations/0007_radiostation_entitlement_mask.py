@@ -0,0 +1,53 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:50
+
+from django.db import migrations, models
+from django.db.models import Case, IntegerField, Value, When
+
+# The mask layout as of this migration, copied here so later changes to
+# accounts/entitlements.py don't change what it does
+RELIGION_ACCESS_BITS = {
+    'GENERAL_ONLY': 0b001,
+    'GENERAL_PLUS_CHRISTIAN': 0b011,
+    'GENERAL_PLUS_MUSLIM': 0b101,
+}
+FLAG_BITS = {
+    field: 1 << (3 + index)
+    for index, field in enumerate([
+        'access_english', 'access_afrikaans', 'access_xhosa',
+        'access_news_stories', 'access_news_bulletins', 'access_sport', 'access_finance', 'access_specialty',
+    ])
+}
+
+
+def fill_entitlement_masks(apps, schema_editor):
+    RadioStation = apps.get_model('accounts', 'RadioStation')
+    expression = Case(
+        *[When(religion_access=access, then=Value(bits)) for access, bits in RELIGION_ACCESS_BITS.items()],
+        default=Value(RELIGION_ACCESS_BITS['GENERAL_ONLY']),
+        output_field=IntegerField(),
+    )
+    for field, bit in FLAG_BITS.items():
+        expression = expression + Case(
+            When(**{field: True}, then=Value(bit)), default=Value(0), output_field=IntegerField(),
+        )
+    RadioStation.objects.update(entitlement_mask=expression)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_statcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='radiostation',
+            name='entitlement_mask',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_entitlement_masks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='radiostation',
+            index=models.Index(fields=['is_active', 'entitlement_mask'], name='station_entitlement_idx'),
+        ),
+    ]
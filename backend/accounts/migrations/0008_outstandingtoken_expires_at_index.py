@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index the expiry of simplejwt's outstanding tokens, so prune_tokens finds
+    expired rows without scanning the table.
+    """
+
+    dependencies = [
+        ('accounts', '0007_radiostation_entitlement_mask'),
+        ('token_blacklist', '0012_alter_outstandingtoken_user'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS "token_outstanding_expires_idx" '
+            'ON "token_blacklist_outstandingtoken" ("expires_at")',
+            'DROP INDEX IF EXISTS "token_outstanding_expires_idx"',
+        ),
+    ]
@@ -0,0 +1,87 @@
+from django.db import migrations
+
+# Frozen here so later changes to accounts.search don't rewrite history
+SEARCH_FIELDS = {
+    'accounts_customuser': ['email', 'first_name', 'last_name', 'mobile_number'],
+    'accounts_radiostation': ['name', 'description', 'contact_email', 'contact_number', 'website'],
+}
+
+
+def sqlite_index_sql(table, fields):
+    fts = f'{table}_fts'
+    columns = ', '.join(fields)
+    new_values = ', '.join(f'new.{field}' for field in fields)
+    old_values = ', '.join(f'old.{field}' for field in fields)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.rowid, {new_values}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.rowid, {new_values}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def sqlite_drop_sql(table):
+    fts = f'{table}_fts'
+    return [
+        f'DROP TRIGGER IF EXISTS {fts}_ai',
+        f'DROP TRIGGER IF EXISTS {fts}_ad',
+        f'DROP TRIGGER IF EXISTS {fts}_au',
+        f'DROP TABLE IF EXISTS {fts}',
+    ]
+
+
+def postgresql_index_sql(table, fields):
+    parts = " || ' ' || ".join(
+        f"translate(coalesce({field}, ''), '@.-_/:', '      ')" for field in fields
+    )
+    return [
+        f'CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} '
+        f"USING gin ((to_tsvector('simple', {parts})))",
+    ]
+
+
+def postgresql_drop_sql(table):
+    return [f'DROP INDEX IF EXISTS {table}_search_idx']
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, fields in SEARCH_FIELDS.items():
+        if vendor == 'sqlite':
+            statements = sqlite_index_sql(table, fields)
+        elif vendor == 'postgresql':
+            statements = postgresql_index_sql(table, fields)
+        else:
+            statements = []
+        for sql in statements:
+            schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table in SEARCH_FIELDS:
+        if vendor == 'sqlite':
+            statements = sqlite_drop_sql(table)
+        elif vendor == 'postgresql':
+            statements = postgresql_drop_sql(table)
+        else:
+            statements = []
+        for sql in statements:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_outstandingtoken_expires_at_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
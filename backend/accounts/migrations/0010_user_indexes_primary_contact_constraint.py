@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+def keep_one_primary_contact(apps, schema_editor):
+    """Keep the earliest primary contact of each station, demoting the rest"""
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    seen = set()
+    demote = []
+    primaries = (
+        CustomUser.objects.filter(is_primary_contact=True, radio_station__isnull=False)
+        .order_by('radio_station_id', 'date_joined', 'id')
+        .values_list('pk', 'radio_station_id')
+    )
+    for pk, station_id in primaries:
+        if station_id in seen:
+            demote.append(pk)
+        seen.add(station_id)
+    CustomUser.objects.filter(pk__in=demote).update(is_primary_contact=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_search_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['user_type', 'is_active'], name='user_type_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['user_type', 'staff_role'], name='user_type_role_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['radio_station', 'is_primary_contact'], name='user_station_primary_idx'),
+        ),
+        migrations.RunPython(keep_one_primary_contact, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='customuser',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_primary_contact', True)), fields=('radio_station',), name='one_primary_contact_per_station', violation_error_message='This station already has a primary contact.'),
+        ),
+    ]
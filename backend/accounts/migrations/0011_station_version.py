@@ -0,0 +1,25 @@
+import time
+
+from django.db import migrations
+
+
+def seed_station_version(apps, schema_editor):
+    StatCounter = apps.get_model('accounts', 'StatCounter')
+    StatCounter.objects.get_or_create(name='station_version', defaults={'value': 1})
+    StatCounter.objects.get_or_create(name='station_modified', defaults={'value': int(time.time())})
+
+
+def remove_station_version(apps, schema_editor):
+    StatCounter = apps.get_model('accounts', 'StatCounter')
+    StatCounter.objects.filter(name__in=['station_version', 'station_modified']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_user_indexes_primary_contact_constraint'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_station_version, remove_station_version),
+    ]
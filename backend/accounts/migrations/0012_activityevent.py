@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_station_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'User created'), (2, 'User updated'), (3, 'User deleted'), (4, 'Station created'), (5, 'Station updated'), (6, 'Station deleted'), (7, 'Password reset'), (8, 'User activated'), (9, 'User deactivated'), (10, 'Primary contact set')])),
+                ('actor_id', models.UUIDField(blank=True, null=True)),
+                ('user_id', models.UUIDField(blank=True, null=True)),
+                ('station_id', models.UUIDField(blank=True, null=True)),
+                ('summary', models.CharField(max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('user_id__isnull', False)), fields=['user_id', '-id'], name='activity_user_idx'), models.Index(condition=models.Q(('station_id__isnull', False)), fields=['station_id', '-id'], name='activity_station_idx')],
+            },
+        ),
+    ]
@@ -1,10 +1,30 @@
 # accounts/models.py
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
 import uuid
 
-class CustomUserManager(BaseUserManager):
+from .conditional import bump_station_version
+from .counters import CounterQuerySet, is_expression
+from .entitlements import (
+    ENTITLEMENT_FIELDS, Religion, entitlements_changed, mask_expression, matching_masks, required_mask, station_mask,
+)
+from .tracking import DirtyFieldsMixin
+
+
+# At most one primary contact per station, enforced by the database
+PRIMARY_CONTACT_CONSTRAINT = 'one_primary_contact_per_station'
+
+
+def is_primary_contact_conflict(error):
+    """Whether an IntegrityError was raised by the primary contact constraint"""
+    message = str(error)
+    # PostgreSQL names the constraint, SQLite the columns of its index
+    return PRIMARY_CONTACT_CONSTRAINT in message or 'accounts_customuser.radio_station_id' in message
+
+
+class CustomUserManager(BaseUserManager.from_queryset(CounterQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
@@ -29,7 +49,79 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(email, password, **extra_fields)
 
 
-class RadioStation(models.Model):
+class RadioStationQuerySet(CounterQuerySet):
+    """QuerySet that keeps entitlement_mask in sync with the access fields"""
+    
+    def eligible_for(self, language=None, category=None, religion=Religion.GENERAL, active_only=True):
+        """Return the stations allowed to receive content with this descriptor"""
+        queryset = self.filter(entitlement_mask__in=matching_masks(
+            required_mask(language=language, category=category, religion=religion)
+        ))
+        if active_only:
+            queryset = queryset.filter(is_active=True)
+        return queryset
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.entitlement_mask = station_mask(obj)
+        created = super().bulk_create(objs, *args, **kwargs)
+        bump_station_version()
+        entitlements_changed.send(sender=self.model, station_ids=[obj.pk for obj in created])
+        return created
+    
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        fields = list(fields)
+        if set(ENTITLEMENT_FIELDS) & set(fields):
+            for obj in objs:
+                obj.entitlement_mask = station_mask(obj)
+            if 'entitlement_mask' not in fields:
+                fields.append('entitlement_mask')
+        # Keep updated_at meaningful for conditional requests
+        now = timezone.now()
+        for obj in objs:
+            obj.updated_at = now
+        if 'updated_at' not in fields:
+            fields.append('updated_at')
+        # Runs through update(), which bumps the station version
+        return super().bulk_update(objs, fields, *args, **kwargs)
+    
+    bulk_update.alters_data = True
+    
+    def update(self, **kwargs):
+        # Keep updated_at meaningful for conditional requests
+        kwargs.setdefault('updated_at', timezone.now())
+        station_ids = None
+        if {'is_active', *ENTITLEMENT_FIELDS} & set(kwargs) and entitlements_changed.has_listeners(self.model):
+            station_ids = list(self.values_list('pk', flat=True))
+        rows = self._update_with_mask(**kwargs)
+        bump_station_version()
+        if station_ids:
+            entitlements_changed.send(sender=self.model, station_ids=station_ids)
+        return rows
+    
+    update.alters_data = True
+    
+    def _update_with_mask(self, **kwargs):
+        touched = set(ENTITLEMENT_FIELDS) & set(kwargs)
+        if not touched or 'entitlement_mask' in kwargs:
+            return super().update(**kwargs)
+        
+        if not any(is_expression(kwargs[field]) for field in touched):
+            # Compute the new mask in the same UPDATE
+            kwargs['entitlement_mask'] = mask_expression(kwargs)
+            return super().update(**kwargs)
+        
+        from django.db import transaction
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            self.model._default_manager.filter(pk__in=pks).update(entitlement_mask=mask_expression())
+        return rows
+
+
+class RadioStation(DirtyFieldsMixin, models.Model):
     """Model for radio stations that use the Newskoop platform"""
     
     # Province choices for South Africa
@@ -91,24 +183,41 @@ class RadioStation(models.Model):
     access_finance = models.BooleanField(default=False, help_text="Access to Finance content")
     access_specialty = models.BooleanField(default=False, help_text="Access to Specialty content")
     
+    # Bitmask of the access fields above, see accounts/entitlements.py
+    entitlement_mask = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = RadioStationQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'entitlement_mask'], name='station_entitlement_idx'),
+        ]
+    
     def save(self, *args, **kwargs):
-        # Check if the station is being deactivated
-        if not self.is_active and self.pk:
-            # Get the original instance from the database
-            original = RadioStation.objects.get(pk=self.pk)
-            if original.is_active:
-                from django.db import transaction
-                with transaction.atomic():
-                    #Deactivate all users associated with this station
-                    self.users.update(is_active=False)
+        # Keep the entitlement mask in sync with the access fields
+        self.entitlement_mask = station_mask(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(ENTITLEMENT_FIELDS) & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'entitlement_mask'}
+        entitled = self._state.adding or self.has_changed('is_active', *ENTITLEMENT_FIELDS)
         
-        super().save(*args, **kwargs)
+        # Deactivate the station's users along with it
+        if not self._state.adding and not self.is_active and self.has_changed('is_active'):
+            from django.db import transaction
+            with transaction.atomic():
+                self.users.update(is_active=False)
+                super().save(*args, **kwargs)
+        else:
+            super().save(*args, **kwargs)
+        
+        if entitled:
+            entitlements_changed.send(sender=RadioStation, station_ids=[self.pk], stations=[self])
     
     def __str__(self):
         return self.name
 
 
-class CustomUser(AbstractBaseUser, PermissionsMixin):
+class CustomUser(DirtyFieldsMixin, AbstractBaseUser, PermissionsMixin):
     """Customized user model for Newskoop platform"""
     
     # User type choices
@@ -162,10 +271,31 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     is_primary_contact = models.BooleanField(default=False)
     
     objects = CustomUserManager()
+    
+    redacted_fields = ('password',)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of the admin user list
+            models.Index(fields=['-date_joined', '-id'], name='user_joined_keyset_idx'),
+            models.Index(fields=['user_type', 'is_active'], name='user_type_active_idx'),
+            models.Index(fields=['user_type', 'staff_role'], name='user_type_role_idx'),
+            models.Index(fields=['radio_station', 'is_primary_contact'], name='user_station_primary_idx'),
+            # Case-insensitive email lookups, e.g. by bulk imports
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['radio_station'],
+                condition=models.Q(is_primary_contact=True),
+                name=PRIMARY_CONTACT_CONSTRAINT,
+                violation_error_message="This station already has a primary contact.",
+            ),
+        ]
+
     def __str__(self):
         return self.email
     
@@ -175,6 +305,26 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def get_short_name(self):
         return self.first_name or self.email.split('@')[0]
     
+    def make_primary_contact(self):
+        """
+        Make this user its station's primary contact, demoting the current
+        one. The unique constraint turns a concurrent change into an
+        IntegrityError, in which case the swap is retried.
+        """
+        from django.db import IntegrityError, transaction
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    CustomUser.objects.filter(
+                        radio_station_id=self.radio_station_id, is_primary_contact=True
+                    ).exclude(pk=self.pk).update(is_primary_contact=False)
+                    self.is_primary_contact = True
+                    self.save(update_fields=['is_primary_contact'])
+                return
+            except IntegrityError as error:
+                if attempt == 2 or not is_primary_contact_conflict(error):
+                    raise
+    
     def save(self, *args, **kwargs):
         # Set is_staff flag based on user_type
         if self.user_type == self.UserType.STAFF:
@@ -188,7 +338,72 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
                 self.is_staff = False
         
         # Ensure RADIO users have a radio_station
-        if self.user_type == self.UserType.RADIO and not self.radio_station:
+        if self.user_type == self.UserType.RADIO and self.radio_station_id is None:
             raise ValueError("Radio station users must be associated with a radio station")
             
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class StatCounter(models.Model):
+    """Materialized dashboard statistic, maintained by accounts/counters.py"""
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class ActivityEvent(models.Model):
+    """
+    Append-only record of something that happened to a user or station,
+    written by accounts/activity.py. Subjects are kept as plain ids rather
+    than foreign keys, so events outlive what they describe and writing one
+    takes no locks on the rows it mentions.
+    """
+
+    class Kind(models.IntegerChoices):
+        USER_CREATED = 1, 'User created'
+        USER_UPDATED = 2, 'User updated'
+        USER_DELETED = 3, 'User deleted'
+        STATION_CREATED = 4, 'Station created'
+        STATION_UPDATED = 5, 'Station updated'
+        STATION_DELETED = 6, 'Station deleted'
+        PASSWORD_RESET = 7, 'Password reset'
+        USER_ACTIVATED = 8, 'User activated'
+        USER_DEACTIVATED = 9, 'User deactivated'
+        PRIMARY_CONTACT_SET = 10, 'Primary contact set'
+
+    STATION_KINDS = {Kind.STATION_CREATED, Kind.STATION_UPDATED, Kind.STATION_DELETED, Kind.PRIMARY_CONTACT_SET}
+
+    created_at = models.DateTimeField(default=timezone.now)
+    kind = models.PositiveSmallIntegerField(choices=Kind.choices)
+    actor_id = models.UUIDField(null=True, blank=True)
+    user_id = models.UUIDField(null=True, blank=True)
+    station_id = models.UUIDField(null=True, blank=True)
+    summary = models.CharField(max_length=255)
+
+    class Meta:
+        # ids grow with time, so "latest N for a subject" is one range scan
+        # of these indexes; rows without the subject are left out of them
+        indexes = [
+            models.Index(
+                fields=['user_id', '-id'], name='activity_user_idx',
+                condition=models.Q(user_id__isnull=False),
+            ),
+            models.Index(
+                fields=['station_id', '-id'], name='activity_station_idx',
+                condition=models.Q(station_id__isnull=False),
+            ),
+        ]
+
+    def __str__(self):
+        return self.summary
+
+    @property
+    def category(self):
+        return 'station' if self.kind in self.STATION_KINDS else 'user'
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Activity events are append-only")
+        super().save(*args, **kwargs)
@@ -0,0 +1,266 @@
+# accounts/pagination.py
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+COUNT_EXACT = 'exact'
+COUNT_APPROXIMATE = 'approximate'
+COUNT_NONE = 'none'
+COUNT_MODES = (COUNT_EXACT, COUNT_APPROXIMATE, COUNT_NONE)
+
+
+def approximate_count(queryset):
+    """
+    Return a cheap estimate of the number of rows in a queryset.
+
+    Unfiltered querysets on PostgreSQL are answered from the planner
+    statistics in pg_class. Everything else falls back to an exact COUNT
+    that is cached for a short time, so repeated page loads only pay for
+    it once per interval.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been analyzed
+        if row and row[0] >= 0:
+            return row[0]
+
+    sql = str(queryset.order_by().query).encode('utf-8')
+    cache_key = 'accounts:count:%s' % hashlib.md5(sql).hexdigest()
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        timeout = getattr(settings, 'ACCOUNTS_APPROXIMATE_COUNT_TTL', 60)
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+class UserPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination that reports ``total_count`` from the paginator's
+    own COUNT instead of issuing a second one.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['total_count'] = self.page.paginator.count
+        return response
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on a tuple of columns.
+
+    Unlike DRF's CursorPagination, the cursor stores the full key of the
+    boundary row, so pages are found with a single index range scan and
+    stay stable while new rows are being inserted. The last ordering field
+    must be unique to break ties.
+
+    The ``count`` query parameter selects how ``total_count`` is computed:
+    ``exact``, ``approximate`` or ``none``, defaulting to ``default_count_mode``.
+    """
+    ordering = ('-pk',)
+    default_count_mode = COUNT_EXACT
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.count_mode = self.get_count_mode(request)
+
+        position, reverse = self.decode_cursor(request)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(self._invert(field) for field in ordering)
+
+        queryset = queryset.order_by(*ordering)
+        self.total_count = self.get_total_count(queryset)
+
+        if position is not None:
+            queryset = queryset.filter(self._build_filter(ordering, position, queryset.model))
+
+        # Fetch one extra row to find out whether there is another page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        if reverse:
+            self.has_previous = has_more
+            self.has_next = position is not None
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('total_count', self.total_count),
+            ('count_is_approximate', self.count_mode == COUNT_APPROXIMATE),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'total_count': {'type': 'integer', 'nullable': True},
+                'count_is_approximate': {'type': 'boolean'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+        return self.page_size
+
+    def get_count_mode(self, request):
+        mode = request.query_params.get(self.count_query_param, self.default_count_mode).lower()
+        return mode if mode in COUNT_MODES else self.default_count_mode
+
+    def get_total_count(self, queryset):
+        if self.count_mode == COUNT_NONE:
+            return None
+        if self.count_mode == COUNT_APPROXIMATE:
+            return approximate_count(queryset)
+        return queryset.count()
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        values = [
+            self._serialize_value(getattr(instance, self._field_name(field)))
+            for field in self.ordering
+        ]
+        payload = json.dumps({'v': values, 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['v']
+            reverse = bool(payload.get('r'))
+            if len(values) != len(self.ordering):
+                raise ValueError
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return values, reverse
+
+    def _build_filter(self, ordering, position, model):
+        """
+        Build the lexicographic "row comes after position" condition,
+        e.g. (a < x) OR (a = x AND b < y) for ordering ('-a', '-b').
+        """
+        condition = Q()
+        equal_so_far = Q()
+        for field, raw_value in zip(ordering, position):
+            name = self._field_name(field)
+            try:
+                value = model._meta.get_field(name).to_python(raw_value)
+            except Exception:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = '%s__%s' % (name, 'lt' if field.startswith('-') else 'gt')
+            condition |= equal_so_far & Q(**{lookup: value})
+            equal_so_far &= Q(**{name: value})
+        return condition
+
+    @staticmethod
+    def _field_name(field):
+        return field.lstrip('-')
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def _serialize_value(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return str(value)
+
+
+class UserKeysetPagination(KeysetPagination):
+    """Keyset pagination for users, newest first"""
+    ordering = ('-date_joined', '-id')
+
+
+def is_cursor_request(request, cursor_query_param='cursor'):
+    """Return True when the client opted in to cursor pagination"""
+    params = request.query_params
+    return params.get('pagination') == 'cursor' or cursor_query_param in params
+
+
+async def apaginate_queryset(paginator, queryset, request):
+    """
+    PageNumberPagination.paginate_queryset() for async views.
+
+    The COUNT and the page are fetched with the async ORM, leaving the
+    paginator ready for get_paginated_response().
+    """
+    paginator.request = request
+    page_size = paginator.get_page_size(request)
+    if not page_size:
+        return None
+
+    django_paginator = paginator.django_paginator_class(queryset, page_size)
+    # Prime the cached count so the paginator doesn't run a sync COUNT
+    django_paginator.count = await queryset.acount()
+    page_number = paginator.get_page_number(request, django_paginator)
+    try:
+        paginator.page = django_paginator.page(page_number)
+    except InvalidPage as exc:
+        msg = paginator.invalid_page_message.format(page_number=page_number, message=str(exc))
+        raise NotFound(msg)
+
+    paginator.page.object_list = [obj async for obj in paginator.page.object_list]
+    return paginator.page.object_list
@@ -0,0 +1,158 @@
+# accounts/query_budget.py
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('accounts')
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a view runs more queries than it declared"""
+
+
+class QueryStats:
+    """Query count and total SQL time recorded for one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Used as a connection.execute_wrapper, through record_query()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+# Stats of the request being handled. Async views run their queries on a
+# worker thread with its own connections, and context variables follow
+# them there, so every connection carries one recorder that looks it up.
+current_stats = ContextVar('query_stats', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_recorder)
+
+
+def query_budget(max_queries):
+    """
+    Declare the maximum number of queries a function view may run.
+
+    Class based views declare a ``query_budget`` attribute instead, either an
+    int or a dict keyed by viewset action (with ``'*'`` as the fallback).
+    Function views may pass a dict keyed by HTTP method the same way.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def get_view_budget(view_func, request):
+    """Return the query budget declared for the view handling a request"""
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    budget = getattr(view_class, 'query_budget', None) if view_class else None
+    if budget is None:
+        budget = getattr(view_func, 'query_budget', None)
+
+    if isinstance(budget, dict):
+        method = request.method.lower()
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get(method, method)
+        budget = budget.get(action, budget.get('*'))
+
+    return budget
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the number of queries and the SQL time of every request and
+    compare them against the budget declared by the view.
+
+    Over-budget requests are logged, or raise QueryBudgetExceeded when
+    QUERY_BUDGET_STRICT is set (the test suite uses this). With DEBUG or
+    QUERY_BUDGET_HEADERS on, the stats are also returned as response headers.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI, stay async so async views don't get a thread each
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        stats = self.start(request)
+        token = current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, stats, response)
+
+    async def __acall__(self, request):
+        stats = self.start(request)
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, stats, response)
+
+    def start(self, request):
+        # Connections opened before this module was loaded missed the signal
+        for connection in connections.all(initialized_only=True):
+            install_recorder(connection)
+        stats = QueryStats()
+        request.query_stats = stats
+        request.query_budget = None
+        return stats
+
+    def finish(self, request, stats, response):
+        budget = request.query_budget
+        if budget is not None and stats.count > budget:
+            message = "Query budget exceeded for %s: %d queries (budget %d, %.1f ms)" % (
+                request.path, stats.count, budget, stats.duration * 1000
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={
+                'path': request.path, 'queries': stats.count, 'query_budget': budget,
+                'sql_ms': round(stats.duration * 1000, 1),
+            })
+
+        if settings.DEBUG or getattr(settings, 'QUERY_BUDGET_HEADERS', False):
+            response['X-Query-Count'] = str(stats.count)
+            response['X-Query-Time-Ms'] = '%.2f' % (stats.duration * 1000)
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_view_budget(view_func, request)
+        return None
@@ -0,0 +1,220 @@
+# accounts/search.py
+"""
+Indexed, ranked full-text search over users and radio stations.
+
+On SQLite each table has an FTS5 index (``<table>_fts``) kept in sync by
+triggers, so saves, queryset updates and bulk_create all reach it. On
+PostgreSQL a GIN index over a tsvector expression does the same job with
+no triggers. Both are created by migration 0009, and put back after every
+migrate by ensure_indexes(): SQLite drops a table's triggers whenever a
+migration rebuilds the table, which it does for most AlterFields. Other
+databases fall back to icontains filters.
+
+Every search term is matched as a prefix, so "thand" finds "Thandi" and
+"thandi@exa" finds "thandi@example.com". Results are annotated with
+``search_rank``, higher being a better match.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import BooleanField, Expression, F, FloatField, Func, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.db.models.sql.constants import INNER
+from django.db.models.sql.datastructures import Join
+
+# Columns indexed for each model's table
+SEARCH_FIELDS = {
+    'accounts_customuser': ['email', 'first_name', 'last_name', 'mobile_number'],
+    'accounts_radiostation': ['name', 'description', 'contact_email', 'contact_number', 'website'],
+}
+
+# Terms are split like the indexes split text: on anything but letters and digits
+TERM_RE = re.compile(r'[^\W_]+')
+
+
+def search_terms(text):
+    return [term.lower() for term in TERM_RE.findall(text or '')][:10]
+
+
+# --- SQLite FTS5 ---
+
+def sqlite_trigger_sql(table, fields):
+    """Statements creating the triggers that keep an FTS5 index in sync with its table"""
+    fts = f'{table}_fts'
+    columns = ', '.join(fields)
+    new_values = ', '.join(f'new.{field}' for field in fields)
+    old_values = ', '.join(f'old.{field}' for field in fields)
+    return [
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.rowid, {new_values}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.rowid, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.rowid, {new_values}); END",
+    ]
+
+
+def sqlite_ensure_index(cursor, table, fields):
+    """Recreate a table's FTS5 triggers if a rebuild of the table dropped them"""
+    fts = f'{table}_fts'
+    triggers = {f'{fts}_ai', f'{fts}_ad', f'{fts}_au'}
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [table])
+    if triggers <= {name for name, in cursor.fetchall()}:
+        return False
+    for trigger in sorted(triggers):
+        cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    for sql in sqlite_trigger_sql(table, fields):
+        cursor.execute(sql)
+    # The rebuilt table's rows have new rowids
+    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    return True
+
+
+class IndexMatch:
+    """
+    The join_field of an FTS5 index joined to its table: the rowids are
+    equal and the index matches the query.
+    """
+
+    def __init__(self, fts, match):
+        self.fts = fts
+        self.match = match
+
+    def get_joining_fields(self):
+        return ()
+
+    def get_extra_restriction(self, alias, related_alias):
+        return RawSQL(
+            f'"{alias}".rowid = "{related_alias}".rowid AND "{alias}"."{self.fts}" MATCH %s',
+            [self.match],
+        )
+
+
+class IndexRank(Expression):
+    """The rank of a joined FTS5 index's row, higher being a better match"""
+    output_field = FloatField()
+
+    def __init__(self, alias):
+        super().__init__()
+        self.alias = alias
+
+    def as_sql(self, compiler, connection):
+        # rank is bm25(), which is lower for better matches
+        return f'-{compiler.quote_name_unless_alias(self.alias)}.rank', []
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(change_map.get(self.alias, self.alias))
+
+
+def sqlite_search(queryset, terms):
+    table = queryset.model._meta.db_table
+    fts = f'{table}_fts'
+    match = ' AND '.join(f'"{term}"*' for term in terms)
+    # Join the index once, so the query is run and bm25() computed once rather than per row
+    queryset = queryset.all()
+    query = queryset.query
+    alias = query.join(Join(fts, query.get_initial_alias(), None, INNER, IndexMatch(fts, match), False))
+    return queryset.annotate(search_rank=IndexRank(alias))
+
+
+# --- PostgreSQL ---
+
+class SearchDocument(Func):
+    """
+    The tsvector the GIN index is built over. It compiles to the index's
+    expression, which it must match for the index to be used, but over
+    resolved columns, so it follows the queryset's table aliases.
+    """
+    template = "to_tsvector('simple', %(expressions)s)"
+    # Split emails and URLs into words, as search_terms() does
+    arg_joiner = " || ' ' || "
+
+    def __init__(self, fields):
+        super().__init__(*[
+            Func(
+                Coalesce(F(field), Value(''), output_field=TextField()), Value('@.-_/:'), Value('      '),
+                function='translate', output_field=TextField(),
+            )
+            for field in fields
+        ], output_field=TextField())
+
+
+def postgresql_index_sql(table, fields):
+    parts = " || ' ' || ".join(
+        f"translate(coalesce({field}, ''), '@.-_/:', '      ')" for field in fields
+    )
+    return [
+        f'CREATE INDEX IF NOT EXISTS {table}_search_idx ON {table} '
+        f"USING gin ((to_tsvector('simple', {parts})))",
+    ]
+
+
+def postgresql_search(queryset, terms):
+    document = SearchDocument(SEARCH_FIELDS[queryset.model._meta.db_table])
+    query = Func(Value('simple'), Value(' & '.join(f'{term}:*' for term in terms)), function='to_tsquery')
+    return queryset.filter(
+        Func(document, query, template='%(expressions)s', arg_joiner=' @@ ', output_field=BooleanField())
+    ).annotate(
+        search_rank=Func(document, query, function='ts_rank', output_field=FloatField())
+    )
+
+
+# --- Other databases ---
+
+def fallback_search(queryset, terms):
+    fields = SEARCH_FIELDS[queryset.model._meta.db_table]
+    for term in terms:
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(condition)
+    return queryset.annotate(search_rank=RawSQL('1.0', [], output_field=FloatField()))
+
+
+def search(queryset, text, ranked=True):
+    """
+    Filter a CustomUser or RadioStation queryset to rows matching every
+    term in text. With ranked=True the best matches come first.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        queryset = sqlite_search(queryset, terms)
+    elif vendor == 'postgresql':
+        queryset = postgresql_search(queryset, terms)
+    else:
+        queryset = fallback_search(queryset, terms)
+
+    if ranked:
+        queryset = queryset.order_by(F('search_rank').desc(), 'pk')
+    return queryset
+
+
+def ensure_indexes(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate receiver putting back any part of the search indexes a
+    migration dropped, once migration 0009 has created them.
+    """
+    database = connections[using]
+    if ('accounts', '0009_search_indexes') not in MigrationRecorder(database).applied_migrations():
+        return
+    with database.cursor() as cursor:
+        for table, fields in SEARCH_FIELDS.items():
+            if database.vendor == 'sqlite':
+                sqlite_ensure_index(cursor, table, fields)
+            elif database.vendor == 'postgresql':
+                for sql in postgresql_index_sql(table, fields):
+                    cursor.execute(sql)
+
+
+def rebuild_index(table):
+    """Rebuild a SQLite FTS5 index from its table, e.g. after VACUUM changed rowids"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
@@ -1,11 +1,28 @@
 # accounts/serializers.py
+from contextlib import contextmanager
+
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
-from .models import RadioStation
+from django.db import IntegrityError, transaction
+from .models import RadioStation, is_primary_contact_conflict
 
 User = get_user_model()
 
+
+@contextmanager
+def primary_contact_errors():
+    """Report a write that breaks the one-primary-contact constraint as a validation error"""
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as error:
+        if not is_primary_contact_conflict(error):
+            raise
+        raise serializers.ValidationError(
+            {"is_primary_contact": "This station already has a primary contact."}
+        )
+
 class RadioStationSerializer(serializers.ModelSerializer):
     """Serializer for radio stations"""
     class Meta:
@@ -81,24 +98,12 @@ class RadioUserCreateSerializer(serializers.ModelSerializer):
         if not data.get('radio_station'):
             raise serializers.ValidationError({"radio_station": "This field is required for radio station users."})
         
-        # Validate is_primary_contact when creating a new primary contact
-        if data.get('is_primary_contact'):
-            # Check if there's already a primary contact for this station
-            station = data['radio_station']
-            existing_primary = User.objects.filter(
-                radio_station=station, 
-                is_primary_contact=True
-            ).exists()
-            
-            if existing_primary:
-                raise serializers.ValidationError(
-                    {"is_primary_contact": "This station already has a primary contact."}
-                )
-        
         return data
     
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
+        # One primary contact per station is enforced by a unique constraint
+        with primary_contact_errors():
+            user = User.objects.create_user(**validated_data)
         return user
 
 
@@ -111,24 +116,10 @@ class RadioUserUpdateSerializer(serializers.ModelSerializer):
             'radio_station', 'is_primary_contact', 'is_active'
         ]
     
-    def validate(self, data):
-        # Validate is_primary_contact when updating to be a primary contact
-        if data.get('is_primary_contact'):
-            # Get the radio station (either from the data or the instance)
-            station = data.get('radio_station') or self.instance.radio_station
-            
-            # Check if there's already a primary contact for this station (excluding this user)
-            existing_primary = User.objects.filter(
-                radio_station=station, 
-                is_primary_contact=True
-            ).exclude(id=self.instance.id).exists()
-            
-            if existing_primary:
-                raise serializers.ValidationError(
-                    {"is_primary_contact": "This station already has a primary contact."}
-                )
-        
-        return data
+    def update(self, instance, validated_data):
+        # One primary contact per station is enforced by a unique constraint
+        with primary_contact_errors():
+            return super().update(instance, validated_data)
 
 
 class StaffUserUpdateSerializer(serializers.ModelSerializer):
@@ -138,4 +129,44 @@ class StaffUserUpdateSerializer(serializers.ModelSerializer):
         fields = [
             'first_name', 'last_name', 'mobile_number', 
             'staff_role', 'is_active'
-        ]
\ No newline at end of file
+        ]
+
+class BulkUserRowSerializer(serializers.Serializer):
+    """
+    Validates one row of a bulk user import. Only checks the row itself;
+    email uniqueness, stations and primary contacts are checked for the
+    whole file at once by accounts/bulk_import.py.
+    """
+    email = serializers.EmailField()
+    password = serializers.CharField(validators=[validate_password])
+    first_name = serializers.CharField(max_length=30, required=False, allow_blank=True, default='')
+    last_name = serializers.CharField(max_length=30, required=False, allow_blank=True, default='')
+    mobile_number = serializers.CharField(max_length=20, required=False, allow_blank=True, default='')
+    user_type = serializers.ChoiceField(choices=User.UserType.choices)
+    staff_role = serializers.ChoiceField(choices=User.StaffRole.choices, required=False, allow_blank=True, allow_null=True)
+    radio_station = serializers.UUIDField(required=False, allow_null=True)
+    is_primary_contact = serializers.BooleanField(required=False, default=False)
+    is_active = serializers.BooleanField(required=False, default=True)
+    
+    def to_internal_value(self, data):
+        # Accept lower case choices, and treat empty CSV cells as missing
+        data = {key: value for key, value in data.items() if value not in ('', None)}
+        for field in ('user_type', 'staff_role'):
+            if isinstance(data.get(field), str):
+                data[field] = data[field].strip().upper()
+        return super().to_internal_value(data)
+    
+    def validate(self, data):
+        data['email'] = User.objects.normalize_email(data['email'])
+        
+        if data['user_type'] == User.UserType.STAFF:
+            if not data.get('staff_role'):
+                raise serializers.ValidationError({"staff_role": "This field is required for staff users."})
+            data['radio_station'] = None
+            data['is_primary_contact'] = False
+        else:
+            if not data.get('radio_station'):
+                raise serializers.ValidationError({"radio_station": "This field is required for radio station users."})
+            data['staff_role'] = None
+        
+        return data
@@ -1,23 +1,140 @@
 # In accounts/signals.py (create this file)
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from .models import CustomUser, RadioStation
+from .counters import apply_deltas, counted_fields, matching_counters, transition_deltas
+from .authentication import user_cache
+from .blacklist import blacklist_filter
+from .conditional import bump_station_version
+from . import activity
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 import logging
 
 logger = logging.getLogger('accounts')
 
+
+# =============== DASHBOARD COUNTERS ===============
+
+@receiver(post_init, sender=CustomUser)
+@receiver(post_init, sender=RadioStation)
+def remember_counters(sender, instance, **kwargs):
+    """Remember which counters a loaded row counts towards"""
+    if counted_fields(sender) & instance.get_deferred_fields():
+        instance._counters = None
+    else:
+        instance._counters = matching_counters(instance)
+
+
+@receiver(pre_save, sender=CustomUser)
+@receiver(pre_save, sender=RadioStation)
+@receiver(pre_delete, sender=CustomUser)
+@receiver(pre_delete, sender=RadioStation)
+def load_counters(sender, instance, **kwargs):
+    """Fetch the stored state of rows that were loaded without it"""
+    if instance._state.adding or getattr(instance, '_counters', None) is not None:
+        return
+    stored = sender._default_manager.filter(pk=instance.pk).first()
+    instance._counters = matching_counters(stored) if stored else None
+
+
+def update_counters(instance, created):
+    before = frozenset() if created else (getattr(instance, '_counters', None) or frozenset())
+    after = matching_counters(instance)
+    apply_deltas(transition_deltas(before, after))
+    instance._counters = after
+
+
+@receiver(post_delete, sender=CustomUser)
+@receiver(post_delete, sender=RadioStation)
+def row_deleted(sender, instance, **kwargs):
+    """Take deleted rows out of the counters"""
+    apply_deltas(transition_deltas(getattr(instance, '_counters', None) or frozenset(), frozenset()))
+
+
+# =============== AUTH USER CACHE ===============
+
 @receiver(post_save, sender=CustomUser)
-def user_saved(sender, instance, created, **kwargs):
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop a changed user from the authentication cache"""
+    user_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=RadioStation)
+def invalidate_station_users(sender, instance, **kwargs):
+    """Drop a station's users, which are cached with the station (and may have been deactivated with it)"""
+    if kwargs.get('created'):
+        return
+    user_cache.invalidate(*instance.users.values_list('pk', flat=True))
+
+
+# =============== STATION RESPONSE CACHE ===============
+
+@receiver(post_save, sender=RadioStation)
+@receiver(post_delete, sender=RadioStation)
+def station_changed(sender, instance, **kwargs):
+    """Invalidate cached station responses and change their ETags"""
+    bump_station_version()
+
+
+# =============== TOKEN BLACKLIST ===============
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance, created, **kwargs):
+    """Add newly blacklisted tokens to this process's blacklist filter"""
+    if created:
+        blacklist_filter.add(instance.token.jti)
+
+
+# =============== MODEL CHANGES ===============
+
+def saved_changes(instance, update_fields):
+    """The fields a save wrote that differ from the loaded values"""
+    changes = instance.get_dirty_fields()
+    if update_fields is not None:
+        changes = {name: change for name, change in changes.items() if name in update_fields}
+    return instance.describe_changes(changes) or 'no changes'
+
+
+class SavedChanges:
+    """saved_changes() as a log argument, worked out only if the record is emitted"""
+
+    def __init__(self, instance, update_fields):
+        self.instance = instance
+        self.update_fields = update_fields
+
+    def __str__(self):
+        return saved_changes(self.instance, self.update_fields)
+
+
+@receiver(post_save, sender=CustomUser)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
     """Log when users are created or modified"""
+    update_counters(instance, created)
+    activity.user_saved(instance, created, update_fields)
     if created:
-        logger.info(f"New user created: {instance.email} (Type: {instance.user_type})")
+        logger.info("New user created: %s (Type: %s)", instance.email, instance.user_type)
     else:
-        logger.info(f"User updated: {instance.email}")
+        logger.info("User updated: %s (%s)", instance.email, SavedChanges(instance, update_fields))
 
 @receiver(post_save, sender=RadioStation)
-def station_saved(sender, instance, created, **kwargs):
+def station_saved(sender, instance, created, update_fields=None, **kwargs):
     """Log when stations are created or modified"""
+    update_counters(instance, created)
+    activity.station_saved(instance, created, update_fields)
     if created:
-        logger.info(f"New radio station created: {instance.name}")
+        logger.info("New radio station created: %s", instance.name)
     else:
-        logger.info(f"Radio station updated: {instance.name}")
\ No newline at end of file
+        logger.info("Radio station updated: %s (%s)", instance.name, SavedChanges(instance, update_fields))
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    """Record deleted users in the activity log"""
+    activity.user_deleted(instance)
+
+
+@receiver(post_delete, sender=RadioStation)
+def station_deleted(sender, instance, **kwargs):
+    """Record deleted stations in the activity log"""
+    activity.station_deleted(instance)
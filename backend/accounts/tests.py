@@ -1,3 +1,1433 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import logging
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.permissions import IsAdminUser
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import async_views, metrics
+from .entitlements import Category, Language, Religion, station_mask
+from .authentication import user_cache
+from .hashing import hash_pool
+from .blacklist import BlacklistFilter, blacklist_filter
+from .bulk_import import UserImport
+from .search import postgresql_search, search
+from .management.commands.benchmark_api import compare, median_result
+from .throttling import RedisThrottleStore, ScopedRateThrottle, SQLiteThrottleStore, throttle_store
+from .activity import latest_events
+from .counters import compute_counters, read_counters, rebuild_counters
+from newskoop.log import JSONFormatter, NonBlockingQueueHandler, RoutingQueueListener, SamplingFilter
+
+from .models import ActivityEvent, CustomUser, RadioStation, StatCounter
+from .views import RadioStationViewSet
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class FastPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2 with few iterations, for tests that upgrade hashes"""
+    iterations = 1000
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class KeysetPaginationTests(TestCase):
+    """Admin user lists page by cursor, newest first, with a choice of counts"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        # Two pairs of users joined at the same instant, so the id breaks the ties
+        joined = timezone.now() - timedelta(days=1)
+        for n in range(5):
+            user = CustomUser.objects.create_user(f'user{n}@example.com', 'password')
+            CustomUser.objects.filter(pk=user.pk).update(date_joined=joined + timedelta(minutes=min(n, 3) // 2))
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = '/api/accounts/admin/users/'
+
+    def expected(self):
+        return [str(pk) for pk in CustomUser.objects.order_by('-date_joined', '-id').values_list('pk', flat=True)]
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def ids(self, page):
+        return [user['id'] for user in page['results']]
+
+    def test_next_and_previous_with_ties(self):
+        pages = []
+        page = self.get(self.url, pagination='cursor', page_size=2)
+        self.assertIsNone(page['previous'])
+        while True:
+            pages.append(self.ids(page))
+            if not page['next']:
+                break
+            page = self.get(page['next'])
+        self.assertEqual([len(ids) for ids in pages], [2, 2, 2])
+        self.assertEqual(sum(pages, []), self.expected())
+
+        back = []
+        while page['previous']:
+            page = self.get(page['previous'])
+            back.insert(0, self.ids(page))
+        self.assertEqual(back, pages[:-1])
+
+    def test_pages_stay_stable_while_users_are_added(self):
+        expected = self.expected()
+        first = self.get(self.url, pagination='cursor', page_size=2)
+        CustomUser.objects.create_user('newcomer@example.com', 'password')
+        second = self.get(first['next'])
+        self.assertEqual(self.ids(first) + self.ids(second), expected[:4])
+
+    def test_count_modes(self):
+        page = self.get(self.url, pagination='cursor', count='exact')
+        self.assertEqual((page['total_count'], page['count_is_approximate']), (6, False))
+
+        page = self.get(self.url, pagination='cursor', count='approximate')
+        self.assertEqual((page['total_count'], page['count_is_approximate']), (6, True))
+        # Served from the cached count for a while
+        CustomUser.objects.create_user('newcomer@example.com', 'password')
+        self.assertEqual(self.get(self.url, pagination='cursor', count='approximate')['total_count'], 6)
+
+        page = self.get(self.url, pagination='cursor', count='none')
+        self.assertEqual((page['total_count'], page['count_is_approximate']), (None, False))
+        self.assertEqual(len(page['results']), 7)
+
+    def test_invalid_cursor(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+        for value in [
+            'not-a-cursor',
+            cursor({'v': ['2026-01-01T00:00:00+00:00'], 'r': 0}),
+            cursor({'v': ['yesterday', str(self.admin.pk)], 'r': 0}),
+            cursor({'r': 0}),
+        ]:
+            with self.subTest(cursor=value):
+                self.assertEqual(self.client.get(self.url, {'cursor': value}).status_code, 404)
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    QUERY_BUDGET_STRICT=True,
+    QUERY_BUDGET_HEADERS=True,
+)
+class QueryBudgetTests(TestCase):
+    """Every accounts endpoint stays within its query budget as tables grow"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        cls.station = RadioStation.objects.create(name='Main FM')
+        cls.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            n = self.rows
+            station = RadioStation.objects.create(name=f'Station {n}')
+            CustomUser.objects.create_user(
+                f'radio{n}@example.com', 'password',
+                user_type=CustomUser.UserType.RADIO, radio_station=station,
+            )
+            CustomUser.objects.create_user(
+                f'member{n}@example.com', 'password',
+                user_type=CustomUser.UserType.RADIO, radio_station=self.station,
+            )
+            CustomUser.objects.create_user(
+                f'staff{n}@example.com', 'password',
+                user_type=CustomUser.UserType.STAFF, staff_role=CustomUser.StaffRole.EDITOR,
+            )
+            self.rows += 1
+
+    def api_client(self):
+        client = APIClient()
+        token = RefreshToken.for_user(self.admin).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def session_client(self):
+        client = APIClient()
+        client.force_login(self.admin)
+        return client
+
+    def api_urls(self):
+        return [
+            reverse('accounts:api_profile'),
+            '/api/accounts/admin/users/',
+            '/api/accounts/admin/users/?pagination=cursor',
+            '/api/accounts/admin/users/?page_size=100',
+            '/api/accounts/admin/users/staff/',
+            '/api/accounts/admin/users/radio/',
+            f'/api/accounts/admin/users/{self.admin.id}/',
+            '/api/accounts/radio/stations/?page_size=100',
+            f'/api/accounts/radio/stations/{self.station.id}/',
+            f'/api/accounts/radio/stations/{self.station.id}/users/',
+        ]
+
+    def template_urls(self):
+        return [
+            reverse('dashboard'),
+            reverse('profile'),
+            reverse('user_list'),
+            reverse('user_list') + '?user_type=RADIO',
+            reverse('station_list'),
+            reverse('station_detail', args=[self.station.id]),
+            reverse('station_user_list', args=[self.station.id]),
+            reverse('station_add_user', args=[self.station.id]),
+            reverse('station_edit', args=[self.station.id]),
+            reverse('create_radio_user'),
+            reverse('edit_user', args=[self.admin.id]),
+        ]
+
+    def measure(self):
+        user_cache.clear()
+        cache.clear()
+        counts = {}
+        for client, urls in ((self.api_client(), self.api_urls()),
+                             (self.session_client(), self.template_urls())):
+            for url in urls:
+                response = client.get(url)
+                self.assertEqual(response.status_code, 200, url)
+                self.assertIn('X-Query-Budget', response, f'{url} declares no query budget')
+                self.assertLessEqual(
+                    int(response['X-Query-Count']), int(response['X-Query-Budget']), url
+                )
+                counts[url] = int(response['X-Query-Count'])
+        return counts
+
+    def test_listings_run_in_constant_queries(self):
+        self.add_rows(2)
+        small = self.measure()
+        self.add_rows(8)
+        large = self.measure()
+        self.assertEqual(small, large)
+
+    def test_login_within_budget(self):
+        response = APIClient().post(
+            reverse('accounts:api_login'),
+            {'email': 'admin@example.com', 'password': 'password'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(int(response['X-Query-Count']), int(response['X-Query-Budget']))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, QUERY_BUDGET_HEADERS=True)
+class CachedAuthenticationTests(TestCase):
+    """JWT requests resolve their user from the cache once it is warm"""
+
+    def setUp(self):
+        user_cache.clear()
+        self.station = RadioStation.objects.create(name='Main FM')
+        self.user = CustomUser.objects.create_user(
+            'radio@example.com', 'password',
+            user_type=CustomUser.UserType.RADIO, radio_station=self.station,
+        )
+        self.client = APIClient()
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def get_profile(self):
+        return self.client.get(reverse('accounts:api_profile'))
+
+    def test_warm_requests_run_no_queries(self):
+        self.assertEqual(self.get_profile()['X-Query-Count'], '1')
+        response = self.get_profile()
+        self.assertEqual(response['X-Query-Count'], '0')
+        self.assertEqual(response.data['radio_station_name'], 'Main FM')
+        self.assertEqual(user_cache.stats()['hits'], 1)
+
+    def test_station_deactivation_invalidates_users(self):
+        self.assertEqual(self.get_profile().status_code, 200)
+        self.station.is_active = False
+        self.station.save()
+        self.assertEqual(self.get_profile().status_code, 401)
+
+    def test_user_save_invalidates(self):
+        self.get_profile()
+        self.user.first_name = 'Thandi'
+        self.user.save()
+        self.assertEqual(self.get_profile().data['first_name'], 'Thandi')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class CounterTests(TestCase):
+    """Materialized counters track saves, deletes and bulk writes"""
+
+    def assertCountersExact(self):
+        self.assertEqual(read_counters(), compute_counters())
+
+    def test_counters_follow_writes(self):
+        station = RadioStation.objects.create(name='Main FM')
+        staff = CustomUser.objects.create_user(
+            'staff@example.com', 'password', staff_role=CustomUser.StaffRole.EDITOR
+        )
+        for n in range(3):
+            CustomUser.objects.create_user(
+                f'radio{n}@example.com', 'password',
+                user_type=CustomUser.UserType.RADIO, radio_station=station,
+            )
+        self.assertCountersExact()
+
+        staff.is_active = False
+        staff.save()
+        self.assertCountersExact()
+
+        # Deactivating a station bulk-updates its users
+        station.is_active = False
+        station.save()
+        self.assertEqual(read_counters()['active_users'], 0)
+        self.assertCountersExact()
+
+        CustomUser.objects.filter(email='radio0@example.com').update(is_active=True)
+        CustomUser.objects.bulk_create([
+            CustomUser(email=f'bulk{n}@example.com', staff_role=CustomUser.StaffRole.INTERN)
+            for n in range(4)
+        ])
+        self.assertCountersExact()
+
+        bulk_users = list(CustomUser.objects.filter(email__startswith='bulk'))
+        for user in bulk_users[:2]:
+            user.is_active = False
+        CustomUser.objects.bulk_update(bulk_users, ['is_active'])
+        self.assertCountersExact()
+
+        # Deleting the station cascades to its users
+        RadioStation.objects.get(pk=station.pk).delete()
+        CustomUser.objects.only('email').get(email='staff@example.com').delete()
+        self.assertCountersExact()
+
+    def test_rebuild_reports_and_fixes_drift(self):
+        RadioStation.objects.create(name='Main FM')
+        StatCounter.objects.filter(name='total_stations').update(value=42)
+
+        self.assertEqual(rebuild_counters(dry_run=True), {'total_stations': (42, 1)})
+        self.assertEqual(rebuild_counters(), {'total_stations': (42, 1)})
+        self.assertEqual(rebuild_counters(), {})
+        self.assertCountersExact()
+
+
+class EntitlementMaskTests(TestCase):
+    """entitlement_mask follows the access flags and drives station lookup"""
+
+    def eligible(self, **descriptor):
+        return set(RadioStation.objects.eligible_for(**descriptor).values_list('name', flat=True))
+
+    def test_mask_stays_in_sync(self):
+        station = RadioStation.objects.create(name='Sport FM', access_sport=True)
+        self.assertEqual(station.entitlement_mask, station_mask(station))
+
+        RadioStation.objects.filter(pk=station.pk).update(access_xhosa=True)
+        station.refresh_from_db()
+        self.assertTrue(station.access_xhosa)
+        self.assertEqual(station.entitlement_mask, station_mask(station))
+
+        station.religion_access = 'GENERAL_PLUS_MUSLIM'
+        RadioStation.objects.bulk_update([station], ['religion_access'])
+        station.refresh_from_db()
+        self.assertEqual(station.entitlement_mask, station_mask(station))
+
+    def test_eligible_stations(self):
+        RadioStation.objects.create(name='English Sport', access_sport=True)
+        RadioStation.objects.create(name='English News', access_news_stories=True)
+        RadioStation.objects.create(
+            name='Christian Sport', access_sport=True, religion_access='GENERAL_PLUS_CHRISTIAN'
+        )
+        RadioStation.objects.create(
+            name='Afrikaans Sport', access_english=False, access_afrikaans=True, access_sport=True
+        )
+        RadioStation.objects.create(name='Off Air', access_sport=True, is_active=True)
+        RadioStation.objects.filter(name='Off Air').update(is_active=False)
+
+        self.assertEqual(
+            self.eligible(language=Language.ENGLISH, category=Category.SPORT),
+            {'English Sport', 'Christian Sport'},
+        )
+        self.assertEqual(
+            self.eligible(language=Language.ENGLISH, category=Category.SPORT, religion=Religion.CHRISTIAN),
+            {'Christian Sport'},
+        )
+        self.assertEqual(self.eligible(language=Language.AFRIKAANS), {'Afrikaans Sport'})
+        with self.assertRaises(ValueError):
+            self.eligible(language='KLINGON')
+
+
+class TokenBlacklistTests(TestCase):
+    """The Bloom filter never lets a blacklisted refresh token through"""
+
+    def setUp(self):
+        blacklist_filter.rebuild()
+        self.user = CustomUser.objects.create_user('radio@example.com', 'password')
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post(reverse('accounts:token_refresh'), {'refresh': str(token)}, format='json')
+
+    def test_rotated_token_cannot_be_reused(self):
+        token = RefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(token).status_code, 200)
+        self.assertEqual(self.refresh(token).status_code, 401)
+        self.assertTrue(blacklist_filter.might_contain(token['jti']))
+
+    def test_token_blacklisted_elsewhere_is_rejected(self):
+        token = RefreshToken.for_user(self.user)
+        outstanding = OutstandingToken.objects.get(jti=token['jti'])
+        # Insert without signals, as another worker's filter would see it
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=outstanding)])
+        blacklist_filter.sync()
+        self.assertEqual(self.refresh(token).status_code, 401)
+
+    def test_late_commit_is_picked_up(self):
+        blacklist_filter.sync()
+        token = RefreshToken.for_user(self.user)
+        outstanding = OutstandingToken.objects.get(jti=token['jti'])
+        # Committed after the last sync, but stamped (and numbered) before it
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=outstanding)])
+        BlacklistedToken.objects.update(blacklisted_at=timezone.now() - timedelta(seconds=5))
+        with override_settings(TOKEN_BLACKLIST_FILTER={'SYNC_INTERVAL': 3600}):
+            blacklist_filter.sync()
+            # In the filter itself, without a lookup
+            with self.assertNumQueries(0):
+                self.assertTrue(blacklist_filter.might_contain(token['jti']))
+
+    def test_token_rotated_on_another_worker_is_rejected(self):
+        shared = tempfile.TemporaryDirectory()
+        self.addCleanup(shared.cleanup)
+        caches = {**settings.CACHES, 'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': shared.name,
+        }}
+        with override_settings(CACHES=caches, TOKEN_BLACKLIST_FILTER={'SHARED_CACHE': 'shared', 'SYNC_INTERVAL': 3600}):
+            other_worker = BlacklistFilter()
+            other_worker.rebuild()
+            token = RefreshToken.for_user(self.user)
+            self.assertEqual(self.refresh(token).status_code, 200)
+            # Before the other worker's next sync, from the shared cache
+            with self.assertNumQueries(0):
+                self.assertTrue(other_worker.might_contain(token['jti']))
+
+    def test_local_cache_falls_back_to_the_database(self):
+        # The default cache is local memory, which other workers can't see
+        other_worker = BlacklistFilter()
+        other_worker.rebuild()
+        self.assertIsNone(other_worker.shared)
+        rotated, live = RefreshToken.for_user(self.user), RefreshToken.for_user(self.user)
+        self.assertEqual(self.refresh(rotated).status_code, 200)
+        with override_settings(TOKEN_BLACKLIST_FILTER={'SYNC_INTERVAL': 3600}):
+            with self.assertNumQueries(1):
+                self.assertTrue(other_worker.might_contain(rotated['jti']))
+            self.assertFalse(other_worker.might_contain(live['jti']))
+
+    def test_prune_tokens(self):
+        expired = RefreshToken.for_user(self.user)
+        live = RefreshToken.for_user(self.user)
+        expired_row = OutstandingToken.objects.get(jti=expired['jti'])
+        BlacklistedToken.objects.create(token=expired_row)
+        OutstandingToken.objects.filter(pk=expired_row.pk).update(
+            expires_at=expired_row.created_at - timedelta(days=1)
+        )
+
+        call_command('prune_tokens', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']]
+        )
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, BULK_USER_IMPORT={'BATCH_SIZE': 2, 'HASH_WORKERS': 1})
+class BulkImportTests(TestCase):
+    """Bulk imports create valid rows in batches and report the rest"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        self.station = RadioStation.objects.create(name='Main FM')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def import_users(self, data, **kwargs):
+        response = self.client.post(reverse('accounts:customuser-bulk-import'), data, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_csv_import(self):
+        csv_data = (
+            'email,password,user_type,staff_role,radio_station,is_primary_contact\n'
+            f'one@example.com,Xk8!plmq7,radio,,{self.station.pk},true\n'
+            'two@example.com,Xk8!plmq7,staff,editor,,\n'
+            'admin@example.com,Xk8!plmq7,staff,editor,,\n'
+            'ONE@example.com,Xk8!plmq7,staff,editor,,\n'
+            f'three@example.com,Xk8!plmq7,radio,,{self.station.pk},true\n'
+            'four@example.com,short,staff,,,\n'
+            'five@example.com,Xk8!plmq7,staff,intern,,\n'
+        )
+        lines = self.import_users(csv_data, content_type='text/csv')
+
+        errors = {line['row']: set(line['errors']) for line in lines if 'row' in line}
+        self.assertEqual(errors, {
+            3: {'email'}, 4: {'email'}, 5: {'is_primary_contact'}, 6: {'password'},
+        })
+        self.assertEqual(lines[-1]['summary']['created'], 3)
+        self.assertEqual(
+            set(CustomUser.objects.exclude(pk=self.admin.pk).values_list('email', flat=True)),
+            {'one@example.com', 'two@example.com', 'five@example.com'},
+        )
+        one = CustomUser.objects.get(email='one@example.com')
+        self.assertTrue(one.is_primary_contact)
+        self.assertTrue(one.check_password('Xk8!plmq7'))
+        self.assertEqual(read_counters()['total_users'], 4)
+
+    def test_existing_emails_match_in_any_case(self):
+        CustomUser.objects.create_user('Existing@Example.com', 'password')
+        rows = [{'email': 'existing@example.com', 'password': 'Xk8!plmq7', 'user_type': 'STAFF', 'staff_role': 'INTERN'}]
+        lines = self.import_users(rows, format='json')
+        self.assertEqual(lines[0]['errors'], {'email': ["A user with this email already exists."]})
+        self.assertEqual(CustomUser.objects.filter(email__iexact='existing@example.com').count(), 1)
+
+    def test_rejected_row_leaves_primary_contact_free(self):
+        rows = [
+            {'email': 'not-an-email', 'password': 'Xk8!plmq7', 'user_type': 'RADIO',
+             'radio_station': str(self.station.pk), 'is_primary_contact': True},
+            {'email': 'admin@example.com', 'password': 'Xk8!plmq7', 'user_type': 'RADIO',
+             'radio_station': str(self.station.pk), 'is_primary_contact': True},
+            {'email': 'contact@example.com', 'password': 'Xk8!plmq7', 'user_type': 'RADIO',
+             'radio_station': str(self.station.pk), 'is_primary_contact': True},
+        ]
+        lines = self.import_users(rows, format='json')
+        self.assertEqual({line['row']: set(line['errors']) for line in lines if 'row' in line}, {1: {'email'}, 2: {'email'}})
+        self.assertEqual(lines[-1]['summary']['created'], 1)
+        self.assertTrue(CustomUser.objects.get(email='contact@example.com').is_primary_contact)
+
+    def test_errors_stream_before_later_rows_are_validated(self):
+        rows = [
+            {'email': f'user{n}@example.com', 'password': 'short' if n == 0 else 'Xk8!plmq7',
+             'user_type': 'STAFF', 'staff_role': 'INTERN'}
+            for n in range(5)
+        ]
+        user_import = UserImport(rows)
+        progress = user_import.run()
+        self.assertEqual(next(progress)['row'], 1)
+        # Only the first batch has been validated so far
+        self.assertEqual([number for number, _ in user_import.valid], [2])
+        list(progress)
+        self.assertEqual(user_import.created, 4)
+
+    @override_settings(BULK_USER_IMPORT={'BATCH_SIZE': 3, 'HASH_WORKERS': 2})
+    def test_json_import_hashes_on_process_pool(self):
+        rows = [
+            {'email': f'user{n}@example.com', 'password': 'Xk8!plmq7', 'user_type': 'STAFF', 'staff_role': 'INTERN'}
+            for n in range(7)
+        ]
+        lines = self.import_users(rows, format='json')
+        self.assertEqual([line.get('created') for line in lines[:-1]], [3, 6, 7])
+        self.assertEqual(CustomUser.objects.filter(staff_role='INTERN', is_staff=True).count(), 7)
+        self.assertTrue(CustomUser.objects.get(email='user6@example.com').check_password('Xk8!plmq7'))
+
+    def test_dry_run(self):
+        rows = [{'email': 'new@example.com', 'password': 'Xk8!plmq7', 'user_type': 'STAFF', 'staff_role': 'ADMIN'}]
+        lines = self.import_users(
+            {'users': rows}, format='json', QUERY_STRING='dry_run=true'
+        )
+        self.assertEqual(lines, [{'summary': {
+            'rows': 1, 'valid': 1, 'created': 0, 'rejected': 0, 'dry_run': True,
+        }}])
+        self.assertFalse(CustomUser.objects.filter(email='new@example.com').exists())
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, EXPORT_CHUNK_SIZE=2)
+class ExportTests(TestCase):
+    """Exports stream every row in CSV and NDJSON"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        self.station = RadioStation.objects.create(name='Main FM')
+        for n in range(4):
+            CustomUser.objects.create_user(
+                f'radio{n}@example.com', 'password',
+                user_type=CustomUser.UserType.RADIO, radio_station=self.station,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def export(self, name, **kwargs):
+        response = self.client.get(reverse(name, kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_user_csv_export(self):
+        content = self.export('accounts:customuser-export', export_format='csv')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 5)
+        radio = [row for row in rows if row['user_type'] == 'RADIO']
+        self.assertEqual({row['radio_station_name'] for row in radio}, {'Main FM'})
+
+    def test_ndjson_starts_with_the_first_row(self):
+        response = self.client.get(reverse('accounts:customuser-export', kwargs={'export_format': 'ndjson'}))
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertEqual(chunks[0].count('\n'), 1)
+        self.assertEqual(sum(chunk.count('\n') for chunk in chunks), 5)
+
+    def test_station_ndjson_export(self):
+        content = self.export('accounts:radiostation-export', export_format='ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['name'] for row in rows], ['Main FM'])
+        self.assertEqual(rows[0]['id'], str(self.station.pk))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class SearchTests(TestCase):
+    """The search index follows writes and matches prefixes of any field"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        self.thandi = CustomUser.objects.create_user(
+            'tm@example.com', 'password', first_name='Thandi', last_name='Mokoena',
+            staff_role=CustomUser.StaffRole.EDITOR,
+        )
+        self.station = RadioStation.objects.create(
+            name='Jozi FM', description='Community radio for Soweto', contact_email='news@jozifm.co.za'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def emails(self, text):
+        return [user.email for user in search(CustomUser.objects.all(), text)]
+
+    def test_prefix_search_over_fields(self):
+        self.assertEqual(self.emails('thand'), ['tm@example.com'])
+        self.assertEqual(self.emails('Mokoena Thandi'), ['tm@example.com'])
+        self.assertEqual(self.emails('tm@exa'), ['tm@example.com'])
+        self.assertEqual(self.emails('thandeka'), [])
+        self.assertEqual(
+            [station.name for station in search(RadioStation.objects.all(), 'sowet')], ['Jozi FM']
+        )
+
+    def test_index_follows_writes(self):
+        CustomUser.objects.filter(pk=self.thandi.pk).update(last_name='Dlamini')
+        self.assertEqual(self.emails('mokoena'), [])
+        self.assertEqual(self.emails('dlamini'), ['tm@example.com'])
+
+        CustomUser.objects.bulk_create([CustomUser(email='sipho@example.com', first_name='Sipho')])
+        self.assertEqual(self.emails('sipho'), ['sipho@example.com'])
+
+        self.thandi.delete()
+        self.assertEqual(self.emails('thandi'), [])
+
+    def test_ranking(self):
+        CustomUser.objects.create_user('thandi@example.com', 'password', first_name='Thandi', last_name='Thandi')
+        self.assertEqual(self.emails('thandi')[0], 'thandi@example.com')
+
+    def test_index_joined_once(self):
+        CustomUser.objects.create_user('thandi@example.com', 'password', first_name='Thandi')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.emails('thandi')), 2)
+        sql = queries[0]['sql']
+        self.assertIn('INNER JOIN "accounts_customuser_fts"', sql)
+        self.assertNotIn('FROM "accounts_customuser_fts"', sql)
+
+        # Relabelled as a subquery
+        matching = search(CustomUser.objects.all(), 'thandi', ranked=False).values('pk')
+        self.assertEqual(CustomUser.objects.filter(pk__in=matching).count(), 2)
+
+    def test_triggers_come_back_after_migrate(self):
+        # As when a migration rebuilds the table
+        with connection.cursor() as cursor:
+            for trigger in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER accounts_customuser_fts_{trigger}')
+        emit_post_migrate_signal(verbosity=0, interactive=False, db=connection.alias)
+
+        CustomUser.objects.filter(pk=self.thandi.pk).update(last_name='Dlamini')
+        self.assertEqual(self.emails('dlamini'), ['tm@example.com'])
+        self.assertEqual(self.emails('mokoena'), [])
+
+    def test_postgresql_query_follows_table_aliases(self):
+        matching = postgresql_search(CustomUser.objects.all(), ['thandi']).values('pk')
+        sql = str(CustomUser.objects.filter(pk__in=matching).query)
+        subquery = sql[sql.index('IN (SELECT'):]
+        self.assertIn('COALESCE(U0."email"', subquery)
+        self.assertNotIn('"accounts_customuser".', subquery)
+
+    def test_views_search(self):
+        response = self.client.get(reverse('accounts:customuser-list'), {'search': 'thandi'})
+        self.assertEqual([user['email'] for user in response.data['results']], ['tm@example.com'])
+
+        response = self.client.get(reverse('accounts:radiostation-list'), {'search': 'jozifm'})
+        self.assertEqual([station['name'] for station in response.data['results']], ['Jozi FM'])
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('user_list'), {'q': 'mokoena'})
+        self.assertEqual([user.email for user in response.context['users']], ['tm@example.com'])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class PrimaryContactTests(TestCase):
+    """A station has at most one primary contact, enforced by the database"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        self.station = RadioStation.objects.create(name='Main FM')
+        self.primary = CustomUser.objects.create_user(
+            'primary@example.com', 'password', user_type=CustomUser.UserType.RADIO,
+            radio_station=self.station, is_primary_contact=True,
+        )
+        self.other = CustomUser.objects.create_user(
+            'other@example.com', 'password', user_type=CustomUser.UserType.RADIO, radio_station=self.station,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def primaries(self):
+        return list(self.station.users.filter(is_primary_contact=True).values_list('email', flat=True))
+
+    def test_constraint(self):
+        from django.db import IntegrityError, transaction
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CustomUser.objects.filter(pk=self.other.pk).update(is_primary_contact=True)
+
+    def test_api_rejects_second_primary(self):
+        response = self.client.post(reverse('accounts:customuser-list'), {
+            'email': 'new@example.com', 'password': 'Xk8!plmq7', 'user_type': 'RADIO',
+            'radio_station': self.station.pk, 'is_primary_contact': True,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('is_primary_contact', response.data)
+        self.assertFalse(CustomUser.objects.filter(email='new@example.com').exists())
+
+        response = self.client.patch(
+            reverse('accounts:customuser-detail', args=[self.other.pk]), {'is_primary_contact': True}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.primaries(), ['primary@example.com'])
+
+    def test_set_primary_contact_swaps(self):
+        response = self.client.post(
+            reverse('accounts:radiostation-set-primary-contact', args=[self.station.pk]),
+            {'user_id': str(self.other.pk)}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.primaries(), ['other@example.com'])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class DirtyFieldTests(TestCase):
+    """Saves know what changed, and write only that"""
+
+    def setUp(self):
+        self.station = RadioStation.objects.create(name='Main FM')
+        self.user = CustomUser.objects.create_user(
+            'radio@example.com', 'password', user_type=CustomUser.UserType.RADIO, radio_station=self.station,
+        )
+
+    def test_tracks_changes(self):
+        station = RadioStation.objects.get(pk=self.station.pk)
+        self.assertEqual(station.get_dirty_fields(), {})
+        station.name = 'Jozi FM'
+        self.assertEqual(station.get_dirty_fields(), {'name': ('Main FM', 'Jozi FM')})
+        self.assertEqual(station.describe_changes(), "name: 'Main FM' -> 'Jozi FM'")
+        station.save()
+        self.assertEqual(station.get_dirty_fields(), {})
+
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.set_password('another')
+        self.assertEqual(user.describe_changes(), 'password changed')
+
+    def test_saves_only_changed_columns(self):
+        station = RadioStation.objects.get(pk=self.station.pk)
+        station.description = 'Community radio'
+        with CaptureQueriesContext(connection) as queries:
+            station.save()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "accounts_radiostation"')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"description"', updates[0])
+        self.assertNotIn('"name"', updates[0])
+
+        with CaptureQueriesContext(connection) as queries:
+            station.save()
+        self.assertEqual(len(queries), 0)
+
+    def test_deactivation_without_extra_select(self):
+        station = RadioStation.objects.get(pk=self.station.pk)
+        station.is_active = False
+        with CaptureQueriesContext(connection) as queries:
+            station.save()
+        self.assertFalse(any(query['sql'].startswith('SELECT "accounts_radiostation"') for query in queries))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+
+        # Saving an inactive station again leaves its users alone
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=True)
+        station.description = 'Off air'
+        station.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_new_inactive_station(self):
+        station = RadioStation.objects.create(name='Off Air FM', is_active=False)
+        self.assertFalse(RadioStation.objects.get(pk=station.pk).is_active)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, QUERY_BUDGET_HEADERS=True)
+class ConditionalStationTests(TestCase):
+    """Station responses revalidate with ETags and are cached per version"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        self.station = RadioStation.objects.create(name='Main FM')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.list_url = reverse('accounts:radiostation-list')
+        self.detail_url = reverse('accounts:radiostation-detail', args=[self.station.pk])
+
+    def test_list_revalidation(self):
+        first = self.client.get(self.list_url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['X-Query-Count'], '1')
+
+        # Served from the response cache without touching the stations table
+        response = self.client.get(self.list_url)
+        self.assertEqual(response['X-Query-Count'], '1')
+        self.assertEqual(response.json()['results'][0]['name'], 'Main FM')
+
+        self.station.name = 'Jozi FM'
+        self.station.save()
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['results'][0]['name'], 'Jozi FM')
+
+    def test_detail_revalidation(self):
+        first = self.client.get(self.detail_url)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        RadioStation.objects.filter(pk=self.station.pk).update(access_sport=True)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['access_sport'])
+
+        missing = reverse('accounts:radiostation-detail', args=['not-a-uuid'])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, QUERY_BUDGET_HEADERS=True)
+class AsyncReadViewTests(TestCase):
+    """The async read views answer exactly like the DRF views they replace"""
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        self.station = RadioStation.objects.create(name='Main FM')
+        RadioStation.objects.create(name='Jozi FM')
+        self.radio_user = CustomUser.objects.create_user(
+            'radio@example.com', 'password',
+            user_type=CustomUser.UserType.RADIO, radio_station=self.station,
+        )
+        self.factory = AsyncRequestFactory()
+
+    def token(self, user):
+        return f'Bearer {RefreshToken.for_user(user).access_token}'
+
+    def call(self, view, url, user=None, method='get', **kwargs):
+        headers = {'Authorization': self.token(user)} if user else {}
+        headers.update(kwargs.pop('headers', {}))
+        request = getattr(self.factory, method)(url, headers=headers, **kwargs)
+        return async_to_sync(view)(request, **resolve(request.path).kwargs)
+
+    def test_matches_sync_views(self):
+        RadioStation.objects.bulk_create([RadioStation(name=f'Station {n}') for n in range(10)])
+        station = self.station.pk
+        cases = [
+            (async_views.profile_view, reverse('accounts:api_profile'), self.radio_user),
+            (async_views.station_list_view, reverse('accounts:radiostation-list') + '?search=fm', self.admin),
+            (async_views.station_list_view, reverse('accounts:radiostation-list') + '?page=2&ordering=name', self.admin),
+            (async_views.station_detail_view, reverse('accounts:radiostation-detail', args=[station]), self.admin),
+            (async_views.station_users_view, reverse('accounts:radiostation-users', args=[station]), self.admin),
+        ]
+        client = APIClient()
+        for view, url, user in cases:
+            with self.subTest(url=url):
+                cache.clear()
+                response = self.call(view, url, user)
+                self.assertEqual(response.status_code, 200, response.content)
+                client.credentials(HTTP_AUTHORIZATION=self.token(user))
+                cache.clear()
+                expected = client.get(url)
+                self.assertEqual(response.status_code, expected.status_code)
+                if expected.status_code == 200:
+                    self.assertEqual(json.loads(response.content), expected.json())
+
+        stats = json.loads(self.call(async_views.system_stats_view, reverse('accounts:admin_stats'), self.admin).content)
+        self.assertEqual(stats['total_stations'], 12)
+        self.assertIn('auth_cache', stats)
+
+    def test_errors_match_drf(self):
+        list_url = reverse('accounts:radiostation-list')
+        response = self.call(async_views.station_list_view, list_url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+        response = self.call(async_views.station_list_view, list_url, headers={'Authorization': 'Bearer bad'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(json.loads(response.content)['code'], 'token_not_valid')
+
+        self.assertEqual(self.call(async_views.station_list_view, list_url, self.radio_user).status_code, 403)
+        missing = reverse('accounts:radiostation-detail', args=['not-a-uuid'])
+        self.assertEqual(self.call(async_views.station_detail_view, missing, self.admin).status_code, 404)
+
+    def test_checks_run_on_the_drf_view(self):
+        # Permissions see the viewset and its action, not a stand-in
+        seen = []
+
+        class RecordingPermission(IsAdminUser):
+            def has_permission(self, request, view):
+                seen.append((type(view), view.action))
+                return super().has_permission(request, view)
+
+        url = reverse('accounts:radiostation-detail', args=[self.station.pk])
+        with mock.patch.object(RadioStationViewSet, 'permission_classes', [RecordingPermission]):
+            self.assertEqual(self.call(async_views.station_detail_view, url, self.admin).status_code, 200)
+            self.assertEqual(self.call(async_views.station_detail_view, url, self.radio_user).status_code, 403)
+        self.assertEqual(seen, [(RadioStationViewSet, 'retrieve')] * 2)
+
+        # A browser asking for HTML gets the browsable API from the DRF view
+        response = self.call(async_views.station_detail_view, url, self.admin, headers={'Accept': 'text/html'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+    def test_revalidation_and_writes(self):
+        url = reverse('accounts:radiostation-detail', args=[self.station.pk])
+        etag = self.call(async_views.station_detail_view, url, self.admin)['ETag']
+        response = self.call(async_views.station_detail_view, url, self.admin, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # Writes are handed to the DRF viewset
+        response = self.call(
+            async_views.station_list_view, reverse('accounts:radiostation-list'), self.admin,
+            method='post', data={'name': 'Cape FM'}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(RadioStation.objects.filter(name='Cape FM').exists())
+
+    def test_query_budget_middleware_runs_async(self):
+        # Queries made on the worker thread are counted against the request
+        response = async_to_sync(self.async_client.get)(
+            reverse('accounts:api_profile'), headers={'Authorization': self.token(self.radio_user)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Query-Count'], '1')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AsyncLoginViewTests(TestCase):
+    """The async login views authenticate like the sync ones, on the hash pool"""
+
+    def setUp(self):
+        throttle_store().clear()
+        self.user = CustomUser.objects.create_user('user@example.com', 'password')
+        self.factory = AsyncRequestFactory()
+        self.failures = []
+        handler = lambda sender, credentials, **kwargs: self.failures.append(credentials)
+        user_login_failed.connect(handler, weak=False)
+        self.addCleanup(user_login_failed.disconnect, handler)
+
+    def login(self, email, password):
+        request = self.factory.post(
+            reverse('accounts:api_login'), {'email': email, 'password': password}, content_type='application/json',
+        )
+        # Set by AuthenticationMiddleware
+        request.user = AnonymousUser()
+        return async_to_sync(async_views.login_view)(request)
+
+    def test_login(self):
+        response = self.login('user@example.com', 'password')
+        self.assertEqual(response.status_code, 200)
+        body = json.loads(response.content)
+        self.assertEqual(body['user']['email'], 'user@example.com')
+        self.assertIn('access', body)
+        self.assertEqual(self.failures, [])
+
+    def test_failed_logins(self):
+        for email, password in [('user@example.com', 'wrong'), ('nobody@example.com', 'password')]:
+            with self.subTest(email=email):
+                response = self.login(email, password)
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(json.loads(response.content), {'error': 'Invalid credentials'})
+        self.assertEqual([credentials['username'] for credentials in self.failures],
+                         ['user@example.com', 'nobody@example.com'])
+        self.assertEqual(self.failures[0]['password'], '********************')
+
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.login('user@example.com', 'password').status_code, 401)
+
+    def test_busy_pool(self):
+        with mock.patch.object(hash_pool, 'pending', hash_pool.capacity):
+            response = self.login('user@example.com', 'password')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_rehash_on_login(self):
+        hashers = ['accounts.tests.FastPBKDF2PasswordHasher'] + FAST_HASHERS
+        with override_settings(PASSWORD_HASHERS=hashers):
+            self.assertEqual(self.login('user@example.com', 'password').status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+        with override_settings(PASSWORD_HASHERS=hashers):
+            self.assertTrue(self.user.check_password('password'))
+
+    @override_settings(AUTHENTICATION_BACKENDS=['django.contrib.auth.backends.AllowAllUsersModelBackend'])
+    def test_configured_backends(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        # AllowAllUsersModelBackend lets the inactive user through to the inactive check
+        response = self.login('user@example.com', 'password')
+        self.assertEqual(response.status_code, 403)
+
+
+class ActivityLogTests(TestCase):
+    """Model changes and admin actions land in the activity log"""
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        self.station = RadioStation.objects.create(name='Main FM')
+        self.user = CustomUser.objects.create_user(
+            'radio@example.com', 'password',
+            user_type=CustomUser.UserType.RADIO, radio_station=self.station,
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def kinds(self, **filters):
+        return list(ActivityEvent.objects.filter(**filters).order_by('id').values_list('kind', flat=True))
+
+    def test_signals_record_changes(self):
+        Kind = ActivityEvent.Kind
+        self.user.last_login = timezone.now()
+        self.user.save()  # quiet field only
+        self.user.first_name = 'Thandi'
+        self.user.save()
+        self.station.name = 'Jozi FM'
+        self.station.save()
+        self.user.delete()
+
+        self.assertEqual(self.kinds(station_id=self.station.pk), [
+            Kind.STATION_CREATED, Kind.USER_CREATED, Kind.USER_UPDATED, Kind.STATION_UPDATED, Kind.USER_DELETED,
+        ])
+        self.assertEqual(
+            ActivityEvent.objects.get(kind=Kind.USER_UPDATED).summary,
+            'User "radio@example.com" was updated (first_name)',
+        )
+
+        event = ActivityEvent.objects.first()
+        event.summary = 'rewritten'
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_admin_actions_record_one_event(self):
+        Kind = ActivityEvent.Kind
+        before = ActivityEvent.objects.count()
+        self.client.post(reverse('accounts:customuser-reset-password', args=[self.user.pk]), {'password': 'n3w-pass'})
+        self.client.post(reverse('accounts:customuser-set-active', args=[self.user.pk]), {'is_active': False}, format='json')
+        self.client.post(
+            reverse('accounts:radiostation-set-primary-contact', args=[self.station.pk]), {'user_id': self.user.pk},
+        )
+
+        events = list(ActivityEvent.objects.filter(user_id=self.user.pk).order_by('-id')[:3])
+        self.assertEqual(ActivityEvent.objects.count(), before + 3)
+        self.assertEqual(
+            [event.kind for event in events], [Kind.PRIMARY_CONTACT_SET, Kind.USER_DEACTIVATED, Kind.PASSWORD_RESET]
+        )
+        self.assertTrue(all(event.actor_id == self.admin.pk for event in events))
+        self.assertEqual(events[0].station_id, self.station.pk)
+
+    def test_latest_events_use_the_subject_indexes(self):
+        latest = latest_events(limit=2, station_id=self.station.pk)
+        self.assertEqual([event.kind for event in latest], [ActivityEvent.Kind.USER_CREATED, ActivityEvent.Kind.STATION_CREATED])
+        if connection.vendor == 'sqlite':
+            plan = ActivityEvent.objects.filter(station_id=self.station.pk).order_by('-id')[:2].explain()
+            self.assertIn('activity_station_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+        client = APIClient()
+        client.force_login(self.user)
+        response = client.get(reverse('dashboard'))
+        self.assertEqual(response.context['recent_activity'][0]['text'], 'New user "radio@example.com" was created')
+
+    def test_prune(self):
+        old = timezone.now() - timedelta(days=400)
+        ActivityEvent.objects.bulk_create([
+            ActivityEvent(kind=ActivityEvent.Kind.USER_UPDATED, summary=f'old {n}', created_at=old) for n in range(5)
+        ])
+        recent = ActivityEvent.objects.filter(created_at__gt=old).count()
+
+        call_command('prune_activity', '--days', '180', '--batch-size', '2', stdout=StringIO())
+        self.assertFalse(ActivityEvent.objects.filter(created_at=old).exists())
+        self.assertEqual(ActivityEvent.objects.count(), recent)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(JSONFormatter())
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+
+class LoggingPipelineTests(TestCase):
+    """Logging calls queue records without formatting or writing them"""
+
+    def setUp(self):
+        self.logger = logging.getLogger('accounts.pipeline-test')
+        self.logger.propagate = False
+        self.target = ListHandler()
+        self.queue = queue.Queue(2)
+        self.handler = NonBlockingQueueHandler(self.queue, [self.target])
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def drain(self):
+        listener = RoutingQueueListener(self.queue)
+        listener.start()
+        listener.stop()
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        start = time.perf_counter()
+        for n in range(4):
+            self.logger.warning("Record %d", n)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(self.handler.dropped, 2)
+
+        self.drain()
+        self.logger.warning("After")
+        self.drain()
+        self.assertEqual([line['message'] for line in self.target.lines], ['Record 0', 'Record 1', 'After'])
+        self.assertEqual(self.target.lines[-1]['dropped'], 2)
+
+    def test_formatting_is_deferred_for_immutable_arguments(self):
+        self.logger.warning("User %s", 'thandi@example.com', extra={'station': 'Main FM'})
+        self.logger.warning("Changes %s", [1, 2])
+        queued = [self.queue.get_nowait(), self.queue.get_nowait()]
+        self.assertEqual((queued[0].msg, queued[0].args), ("User %s", ('thandi@example.com',)))
+        self.assertEqual((queued[1].msg, queued[1].args), ("Changes [1, 2]", None))
+
+        for record in queued:
+            self.queue.put_nowait(record)
+        self.drain()
+        self.assertEqual(self.target.lines[0]['message'], 'User thandi@example.com')
+        self.assertEqual(self.target.lines[0]['station'], 'Main FM')
+        self.assertEqual(self.target.lines[0]['logger'], 'accounts.pipeline-test')
+
+    def test_sampling(self):
+        sampler = SamplingFilter({'Noisy %s': 3})
+        self.logger.addFilter(sampler)
+        self.addCleanup(self.logger.removeFilter, sampler)
+        self.queue.maxsize = 0
+        for n in range(6):
+            self.logger.info("Noisy %s", n)
+        self.logger.warning("Noisy %s", 'warning')
+        self.logger.info("Quiet %s", 'kept')
+        self.drain()
+        self.assertEqual(
+            [line['message'] for line in self.target.lines],
+            ['Noisy 0', 'Noisy 3', 'Noisy warning', 'Quiet kept'],
+        )
+        self.assertEqual(self.target.lines[0]['sample_rate'], 3)
+
+
+class MetricsTests(TestCase):
+    """Request metrics are aggregated per URL name and served to staff"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin@example.com', 'password')
+        cls.radio = CustomUser.objects.create_user(
+            'radio@example.com', 'password',
+            user_type=CustomUser.UserType.RADIO, radio_station=RadioStation.objects.create(name='Main FM'),
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings = override_settings(METRICS={'ENABLED': True, 'DIRECTORY': self.directory, 'FLUSH_INTERVAL': 60})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def client_for(self, user):
+        client = APIClient()
+        token = RefreshToken.for_user(user).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return client
+
+    def scrape(self):
+        response = self.client_for(self.admin).get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        return response.content.decode()
+
+    def test_requests_are_recorded_per_url_name(self):
+        client = self.client_for(self.admin)
+        client.get(reverse('accounts:api_profile'))
+        client.get(reverse('accounts:api_profile'))
+        client.get(reverse('accounts:radiostation-detail', args=['not-a-station']))
+        self.client.force_login(self.admin)
+        self.client.get(reverse('dashboard'))
+        self.client.get('/no-such-page/')
+
+        text = self.scrape()
+        self.assertIn('newskoop_http_requests_total{view="accounts:api_profile",method="GET",status="200"} 2', text)
+        self.assertIn('newskoop_http_requests_total{view="accounts:radiostation-detail",method="GET",status="404"} 1', text)
+        self.assertIn('newskoop_http_requests_total{view="dashboard",method="GET",status="200"} 1', text)
+        self.assertIn('newskoop_http_requests_total{view="unresolved",method="GET",status="404"} 1', text)
+        self.assertIn(
+            'newskoop_http_request_duration_seconds_bucket{view="accounts:api_profile",method="GET",le="+Inf"} 2', text,
+        )
+        self.assertIn('newskoop_http_response_size_bytes_count{view="dashboard"} 1', text)
+        # Both profile requests ran at most one query (the token's user is cached)
+        self.assertIn('newskoop_db_queries_per_request_bucket{view="accounts:api_profile",le="1.0"} 2', text)
+        self.assertIn('newskoop_db_query_duration_seconds_count{view="dashboard"} 1', text)
+
+    def test_metrics_of_other_workers_are_added(self):
+        self.client_for(self.admin).get(reverse('accounts:api_profile'))
+        other = metrics.Registry()
+        other.record_request('accounts:api_profile', 'GET', 200, 0.02, 512, 1, 0.001)
+        with open(os.path.join(self.directory, '999999.json'), 'w') as f:
+            json.dump(other.snapshot(), f)
+
+        text = self.scrape()
+        self.assertIn('newskoop_http_requests_total{view="accounts:api_profile",method="GET",status="200"} 2', text)
+
+        # Each worker writes only its own file
+        metrics.registry.flush(self.directory)
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(['999999.json', metrics.registry.filename]))
+        self.assertIn('newskoop_http_requests_total{view="accounts:api_profile",method="GET",status="200"} 2', self.scrape())
+
+    def test_flushed_in_the_background(self):
+        flushed = threading.Event()
+        threads = []
+
+        def flush(directory):
+            threads.append(threading.current_thread())
+            flushed.set()
+
+        options = {'ENABLED': True, 'DIRECTORY': self.directory, 'FLUSH_INTERVAL': 0.01}
+        with override_settings(METRICS=options), mock.patch.object(metrics.registry, 'flush', side_effect=flush):
+            self.client_for(self.admin).get(reverse('accounts:api_profile'))
+            self.assertTrue(flushed.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_files_are_named_per_process_start(self):
+        # A worker reusing the PID of a dead one keeps its own file
+        self.assertNotEqual(metrics.Registry().filename, metrics.Registry().filename)
+        self.assertTrue(metrics.Registry().filename.startswith(f'{os.getpid()}-'))
+
+    def test_staff_only(self):
+        self.assertEqual(APIClient().get('/metrics').status_code, 401)
+        self.assertEqual(self.client_for(self.radio).get('/metrics').status_code, 403)
+
+    def test_disabled(self):
+        with override_settings(METRICS={'ENABLED': False}):
+            self.client_for(self.admin).get(reverse('accounts:api_profile'))
+            self.assertEqual(self.client_for(self.admin).get('/metrics').status_code, 404)
+        self.assertEqual(metrics.registry.counters, {})
+
+
+class LocalRedis:
+    """Stand-in for a Redis client, with the commands RedisThrottleStore uses"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    def pipeline(self):
+        redis, commands = self, []
+
+        class Pipeline:
+            def __getattr__(self, name):
+                return lambda *args: commands.append((name, args))
+
+            def execute(self):
+                return [getattr(redis, name)(*args) for name, args in commands]
+        return Pipeline()
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def decr(self, key):
+        self.values[key] = self.values.get(key, 0) - 1
+        return self.values[key]
+
+    def expire(self, key, seconds):
+        self.ttls[key] = seconds
+        return True
+
+    def get(self, key):
+        value = self.values.get(key)
+        return None if value is None else str(value).encode()
+
+    def scan_iter(self, match):
+        return [key for key in self.values if key.startswith(match.rstrip('*'))]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class ThrottledView(APIView):
+    throttle_scope = 'test'
+
+
+class ThrottleTests(TestCase):
+    """Sliding window throttles shared by every worker through the throttle store"""
+
+    def setUp(self):
+        throttle_store().clear()
+        self.now = 600.0
+        self.factory = APIRequestFactory()
+
+    def throttle(self, store):
+        throttle = ScopedRateThrottle()
+        throttle.timer = lambda: self.now
+        request = self.factory.get('/')
+        request.user = AnonymousUser()
+        with mock.patch.object(ScopedRateThrottle, 'THROTTLE_RATES', {'test': '3/min'}), \
+                mock.patch('accounts.throttling.throttle_store', return_value=store):
+            allowed = throttle.allow_request(request, ThrottledView())
+        return allowed, throttle.wait()
+
+    def check_sliding_window(self, store):
+        self.assertEqual([self.throttle(store)[0] for _ in range(3)], [True] * 3)
+        allowed, wait = self.throttle(store)
+        self.assertFalse(allowed)
+        # Next window: its first request still sees 3 * (1 - 1/3) + 1 = 3
+        self.assertAlmostEqual(wait, 80.0)
+
+        # Halfway through the next window the last one counts for 1.5
+        self.now += 90
+        self.assertEqual(self.throttle(store), (True, None))
+        allowed, wait = self.throttle(store)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 10.0)
+        self.now += 10
+        self.assertTrue(self.throttle(store)[0])
+
+    def test_sqlite_store(self):
+        with tempfile.TemporaryDirectory() as directory:
+            location = os.path.join(directory, 'throttle.sqlite3')
+            self.check_sliding_window(SQLiteThrottleStore(location))
+
+            # Another worker opening the same file shares the counts
+            first, second = SQLiteThrottleStore(location), SQLiteThrottleStore(location)
+            self.now += 600
+            self.assertEqual([self.throttle(store)[0] for store in (first, second, first, second)], [True] * 3 + [False])
+
+    def test_redis_store(self):
+        client = LocalRedis()
+        self.check_sliding_window(RedisThrottleStore(client))
+        self.assertEqual(set(client.ttls.values()), {121})
+        # Rejected requests were taken back
+        self.assertEqual(client.values['throttle:throttle_test_127.0.0.1:11'], 2)
+
+    def throttle_rates(self, **rates):
+        return override_settings(REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {**settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], **rates},
+        })
+
+    def test_login_and_refresh_scopes(self):
+        user = CustomUser.objects.create_user('radio@example.com', 'password')
+        client = APIClient()
+        # Only the scopes apply, not the anon rate
+        with self.throttle_rates(anon='1/min', login='2/min', token_refresh='1/min'):
+            statuses = [
+                client.post(reverse('accounts:api_login'), {'email': user.email, 'password': 'wrong'}, format='json')
+                for _ in range(3)
+            ]
+            self.assertEqual([response.status_code for response in statuses], [401, 401, 429])
+            self.assertIn('Retry-After', statuses[-1])
+
+            refresh = str(RefreshToken.for_user(user))
+            first = client.post(reverse('accounts:token_refresh'), {'refresh': refresh}, format='json')
+            second = client.post(reverse('accounts:token_refresh'), {'refresh': refresh}, format='json')
+            self.assertEqual((first.status_code, second.status_code), (200, 429))
+
+    def test_async_login_scope(self):
+        factory = AsyncRequestFactory()
+
+        def login():
+            request = factory.post(
+                reverse('accounts:api_login'), {'email': 'nobody@example.com', 'password': 'wrong'},
+                content_type='application/json',
+            )
+            request.user = AnonymousUser()
+            return async_to_sync(async_views.login_view)(request).status_code
+
+        with self.throttle_rates(anon='1/min', login='2/min'):
+            self.assertEqual([login() for _ in range(3)], [401, 401, 429])
+
+
+class BenchmarkComparisonTests(TestCase):
+    """benchmark_api flags scenarios that got slower than the baseline"""
+
+    def result(self, scenario, rps, p50, p95, p99):
+        return {
+            'scenario': scenario, 'requests': 100, 'errors': 0,
+            'requests_per_second': rps, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99,
+        }
+
+    def test_rounds_are_combined_by_median(self):
+        rounds = [self.result('profile', rps, rps / 10, rps / 5, rps / 2) for rps in (100.0, 300.0, 120.0)]
+        combined = median_result(rounds)
+        self.assertEqual((combined['requests'], combined['requests_per_second'], combined['p95_ms']), (300, 120.0, 24.0))
+
+    def test_regressions(self):
+        baseline = {'results': [
+            self.result('profile', 100.0, 10.0, 20.0, 30.0),
+            self.result('stations', 100.0, 10.0, 20.0, 30.0),
+            self.result('login', 2.0, 500.0, 900.0, 950.0),
+        ]}
+        rows = compare([
+            self.result('profile', 70.0, 10.0, 20.0, 30.0),    # throughput down 30%
+            self.result('stations', 110.0, 9.0, 20.0, 60.0),  # only p99 is worse, which isn't gated
+            self.result('admin-users', 50.0, 10.0, 20.0, 30.0),  # not in the baseline
+            self.result('login', 2.0, 500.0, 1200.0, 1300.0),  # p95 up 33%
+        ], baseline, tolerance=0.25)
+        self.assertEqual(
+            [(scenario, regressed) for scenario, _, regressed in rows],
+            [('profile', ['requests_per_second']), ('stations', []), ('login', ['p95_ms'])],
+        )
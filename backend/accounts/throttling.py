@@ -0,0 +1,234 @@
+# accounts/throttling.py
+"""
+Request throttles shared by every worker.
+
+DRF's throttles keep a list of request times per client in the default
+cache, which is local to each process and rewritten on every request.
+These throttles use a sliding window counter instead: two counts per
+client (this window and the last), kept in a store every worker shares.
+A request is allowed while
+
+    last window's count * (share of the last window still in view) + this window's count
+
+stays within the rate, so bursts at a window boundary can't get through
+twice the rate.
+
+THROTTLE_STORE['BACKEND'] picks the store:
+
+- ``'sqlite'``: a SQLite file (LOCATION) that all workers on the host open.
+  Without a LOCATION it sits next to the SQLite database, or in memory when
+  the database is (as in the test run).
+- ``'redis'``: a Redis server at the LOCATION URL, for several hosts.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from rest_framework import throttling
+from rest_framework.settings import api_settings
+
+DEFAULT_THROTTLE_STORE = {
+    'BACKEND': 'sqlite',
+    'LOCATION': None,
+    'KEY_PREFIX': 'throttle:',
+    # Seconds between deleting expired counters from the SQLite store
+    'PRUNE_INTERVAL': 60,
+}
+
+
+def store_settings():
+    return {**DEFAULT_THROTTLE_STORE, **getattr(settings, 'THROTTLE_STORE', {})}
+
+
+class SQLiteThrottleStore:
+    """Counters in a SQLite file, updated with one statement per request"""
+
+    def __init__(self, location, prune_interval=60):
+        self.location = location
+        self.prune_interval = prune_interval
+        self.local = threading.local()
+        self.pruned_at = time.time()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None, uri=self.location.startswith('file:'),
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS throttle ('
+                'key TEXT PRIMARY KEY, period INTEGER NOT NULL, hits INTEGER NOT NULL, '
+                'previous_hits INTEGER NOT NULL, expires REAL NOT NULL)'
+            )
+            self.local.connection = connection
+        return connection
+
+    def hit(self, key, window, ttl):
+        """Count a request in ``window``, returning (last window's count, this window's count)"""
+        now = time.time()
+        # The right-hand sides all see the row as it was before the update
+        previous, current = self.connection().execute(
+            'INSERT INTO throttle (key, period, hits, previous_hits, expires) VALUES (?, ?, 1, 0, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'previous_hits = CASE WHEN throttle.period = excluded.period THEN throttle.previous_hits '
+            'WHEN throttle.period = excluded.period - 1 THEN throttle.hits ELSE 0 END, '
+            'hits = CASE WHEN throttle.period = excluded.period THEN throttle.hits + 1 ELSE 1 END, '
+            'period = excluded.period, expires = excluded.expires '
+            'RETURNING previous_hits, hits',
+            (key, window, now + ttl),
+        ).fetchone()
+        if now - self.pruned_at > self.prune_interval:
+            self.prune(now)
+        return previous, current
+
+    def undo(self, key, window):
+        """Take back a request counted by hit()"""
+        self.connection().execute(
+            'UPDATE throttle SET hits = hits - 1 WHERE key = ? AND period = ? AND hits > 0',
+            (key, window),
+        )
+
+    def prune(self, now=None):
+        self.pruned_at = now or time.time()
+        self.connection().execute('DELETE FROM throttle WHERE expires < ?', (self.pruned_at,))
+
+    def clear(self):
+        self.connection().execute('DELETE FROM throttle')
+
+
+class RedisThrottleStore:
+    """
+    Counters in Redis, one key per client and window, expiring on their
+    own. ``client`` is anything with redis-py's incr/get/decr/pipeline.
+    """
+
+    def __init__(self, client, key_prefix='throttle:'):
+        self.client = client
+        self.key_prefix = key_prefix
+
+    @classmethod
+    def from_url(cls, url, key_prefix='throttle:'):
+        import redis
+
+        return cls(redis.Redis.from_url(url), key_prefix)
+
+    def counter_key(self, key, window):
+        return f'{self.key_prefix}{key}:{window}'
+
+    def hit(self, key, window, ttl):
+        pipeline = self.client.pipeline()
+        pipeline.incr(self.counter_key(key, window))
+        pipeline.expire(self.counter_key(key, window), int(ttl) + 1)
+        pipeline.get(self.counter_key(key, window - 1))
+        current, _, previous = pipeline.execute()
+        return int(previous or 0), int(current)
+
+    def undo(self, key, window):
+        self.client.decr(self.counter_key(key, window))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=f'{self.key_prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def default_sqlite_location():
+    """A file next to the SQLite database, shared by the workers using it"""
+    connection = connections['default']
+    if connection.vendor == 'sqlite':
+        if connection.is_in_memory_db():
+            # One process: keep the counters in memory too
+            return 'file:newskoop-throttle?mode=memory&cache=shared'
+        root, _ = os.path.splitext(str(connection.settings_dict['NAME']))
+        return f'{root}-throttle.sqlite3'
+    return os.path.join(tempfile.gettempdir(), 'newskoop-throttle.sqlite3')
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def throttle_store():
+    """The configured store, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = store_settings()
+                if options['BACKEND'] == 'redis':
+                    _store = RedisThrottleStore.from_url(options['LOCATION'], options['KEY_PREFIX'])
+                else:
+                    _store = SQLiteThrottleStore(
+                        options['LOCATION'] or default_sqlite_location(), options['PRUNE_INTERVAL'],
+                    )
+    return _store
+
+
+@receiver(setting_changed)
+def reset_store(setting, **kwargs):
+    global _store
+    if setting in ('THROTTLE_STORE', 'DATABASES'):
+        _store = None
+
+
+class SharedRateThrottle(throttling.SimpleRateThrottle):
+    """SimpleRateThrottle with a sliding window counter in the throttle store"""
+
+    @property
+    def THROTTLE_RATES(self):
+        # DRF reads the rates once, at import; reading them here lets overridden settings apply
+        return api_settings.DEFAULT_THROTTLE_RATES
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        now = self.timer()
+        window, offset = divmod(now, self.duration)
+        window = int(window)
+        store = throttle_store()
+        previous, current = store.hit(self.key, window, 2 * self.duration)
+        remaining = 1 - offset / self.duration
+        if previous * remaining + current <= self.num_requests:
+            return True
+
+        # Rejected requests don't use up the allowance
+        store.undo(self.key, window)
+        self.wait_seconds = self.time_until_allowed(previous, current - 1, offset)
+        return False
+
+    def time_until_allowed(self, previous, current, offset):
+        """Seconds until one more request fits in the sliding window"""
+        if current + 1 <= self.num_requests and previous:
+            # The last window's share shrinks enough during this window
+            share = 1 - (self.num_requests - current - 1) / previous
+            return max(0.0, share * self.duration - offset)
+        # Wait for the next window, where this window's count is the last one's
+        share = max(0.0, 1 - (self.num_requests - 1) / current) if current else 0.0
+        return (self.duration - offset) + share * self.duration
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class AnonRateThrottle(throttling.AnonRateThrottle, SharedRateThrottle):
+    """The 'anon' rate, per IP address, for unauthenticated requests"""
+
+
+class UserRateThrottle(throttling.UserRateThrottle, SharedRateThrottle):
+    """The 'user' rate, per user (or IP address when unauthenticated)"""
+
+
+class ScopedRateThrottle(throttling.ScopedRateThrottle, SharedRateThrottle):
+    """The rate named by the view's ``throttle_scope``, per user or IP address"""
@@ -0,0 +1,118 @@
+# accounts/tracking.py
+"""
+Dirty-field tracking for models.
+
+DirtyFieldsMixin remembers each field's value as loaded from the database,
+so save() and signal receivers can tell which fields changed without
+querying the stored row again. Saving an existing instance writes only
+the changed columns.
+"""
+import datetime
+
+from django.db import models
+
+
+def display_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return repr(value)
+
+
+class DirtyFieldsMixin(models.Model):
+    """
+    Tracks changes to concrete fields since the instance was loaded or
+    last saved. New instances count every assigned field as changed.
+    """
+
+    # Fields whose values are left out of describe_changes()
+    redacted_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Deferred fields are missing from __dict__ and aren't tracked until loaded
+        instance._loaded_values = {
+            field.attname: instance.__dict__[field.attname]
+            for field in cls._meta.concrete_fields
+            if field.attname in instance.__dict__
+        }
+        return instance
+
+    def initial_value(self, field_name):
+        """The field's value when loaded, or None if it wasn't loaded"""
+        field = self._meta.get_field(field_name)
+        return getattr(self, '_loaded_values', {}).get(field.attname)
+
+    def get_dirty_fields(self):
+        """Return {field name: (initial value, current value)} for changed fields"""
+        loaded = getattr(self, '_loaded_values', {})
+        dirty = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            current = self.__dict__[field.attname]
+            if field.attname not in loaded:
+                dirty[field.name] = (None, current)
+            elif loaded[field.attname] != current:
+                dirty[field.name] = (loaded[field.attname], current)
+        return dirty
+
+    def has_changed(self, *field_names):
+        dirty = self.get_dirty_fields()
+        return any(name in dirty for name in field_names)
+
+    def describe_changes(self, changes=None):
+        """Human readable summary of the changed fields, for logging"""
+        changes = self.get_dirty_fields() if changes is None else changes
+        parts = []
+        for name, (old, new) in changes.items():
+            if getattr(self._meta.get_field(name), 'auto_now', False):
+                continue
+            if name in self.redacted_fields:
+                parts.append(f"{name} changed")
+            else:
+                parts.append(f"{name}: {display_value(old)} -> {display_value(new)}")
+        return ', '.join(parts)
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using')
+        partial = (
+            not args
+            and not self._state.adding
+            and kwargs.get('update_fields') is None
+            and not kwargs.get('force_insert')
+            and hasattr(self, '_loaded_values')
+            and (using is None or using == self._state.db)
+        )
+        if partial:
+            # Write only what changed, plus auto_now timestamps
+            update_fields = set(self.get_dirty_fields())
+            if update_fields:
+                update_fields.update(
+                    field.name for field in self._meta.concrete_fields if getattr(field, 'auto_now', False)
+                )
+            kwargs['update_fields'] = update_fields
+
+        super().save(*args, **kwargs)
+
+        # What was written is the new baseline
+        saved = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (saved is None or field.name in saved or field.attname in saved):
+                loaded[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded
+
+    save.alters_data = True
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        loaded = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if fields is None or field.name in fields or field.attname in fields:
+                if field.attname in self.__dict__:
+                    loaded[field.attname] = self.__dict__[field.attname]
+        self._loaded_values = loaded
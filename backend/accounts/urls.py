@@ -1,9 +1,11 @@
 # accounts/urls.py
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
 from . import admin_views
+from . import async_views
+from .blacklist import FilteredTokenRefreshView
 
 # Create a router for admin views
 admin_router = DefaultRouter()
@@ -15,18 +17,42 @@ radio_router.register(r'stations', views.RadioStationViewSet)
 
 app_name = 'accounts'
 
+# Under ASGI, logins can hash passwords off the event loop
+if settings.ASYNC_LOGIN:
+    login_api_view = async_views.login_view
+    login_page_view = async_views.login_page_view
+else:
+    login_api_view = views.LoginView.as_view()
+    login_page_view = views.LoginPageView.as_view()
+
+# Under ASGI, the read-heavy endpoints can run on the event loop
+if settings.ASYNC_READ_VIEWS:
+    profile_view = async_views.profile_view
+    stats_view = async_views.system_stats_view
+    station_read_urlpatterns = [
+        path('radio/stations/', async_views.station_list_view),
+        re_path(r'^radio/stations/(?P<pk>[^/.]+)/$', async_views.station_detail_view),
+        re_path(r'^radio/stations/(?P<pk>[^/.]+)/users/$', async_views.station_users_view),
+    ]
+else:
+    profile_view = views.UserProfileView.as_view()
+    stats_view = admin_views.system_stats
+    station_read_urlpatterns = []
+
 # API endpoints
 api_urlpatterns = [
     # User endpoints
-    path('login/', views.LoginView.as_view(), name='api_login'),
+    path('login/', login_api_view, name='api_login'),
     path('logout/', views.LogoutView.as_view(), name='api_logout'),
-    path('profile/', views.UserProfileView.as_view(), name='api_profile'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('profile/', profile_view, name='api_profile'),
+    path('token/refresh/', FilteredTokenRefreshView.as_view(), name='token_refresh'),
     
     # Admin endpoints
+    path('admin/stats/', stats_view, name='admin_stats'),
     path('admin/', include(admin_router.urls)),
     
     # Radio station endpoints
+    *station_read_urlpatterns,
     path('radio/', include(radio_router.urls)),
 ]
 
@@ -35,7 +61,7 @@ template_urlpatterns = [
     # Authentication and dashboard
     path('', views.dashboard_view, name='home'),
     path('dashboard/', views.dashboard_view, name='dashboard'),
-    path('accounts/login/', views.LoginPageView.as_view(), name='login'),  # Updated
+    path('accounts/login/', login_page_view, name='login'),  # Updated
     path('accounts/logout/', views.logout_view, name='logout'),  # Updated
     path('accounts/profile/', views.profile_view, name='profile'),  # Updated
     
@@ -16,7 +16,15 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import get_user_model
 
-from .models import RadioStation, CustomUser
+from .models import ActivityEvent, RadioStation, CustomUser
+from .query_budget import query_budget
+from .blacklist import FilteredRefreshToken
+from .counters import read_counters
+from .exports import STATION_EXPORT_COLUMNS, export_response
+from .search import search
+from .throttling import ScopedRateThrottle
+from .conditional import ConditionalStationMixin
+from .activity import admin_action, dashboard_activity, latest_events
 from .serializers import (
     UserSerializer, 
     RadioStationSerializer,
@@ -34,7 +42,11 @@ class LoginView(APIView):
     """
     API Login view that accepts email and password and returns JWT tokens
     """
+    query_budget = 5
     permission_classes = [permissions.AllowAny]
+    # Only the login rate: the anon rate would lock out a whole office behind one address
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'login'
     
     def post(self, request):
         email = request.data.get('email')
@@ -48,45 +60,54 @@ class LoginView(APIView):
             errors['password'] = 'Password is required'
         
         if errors:
-            logger.warning(f"API login attempt with missing credentials: {', '.join(errors.keys())}")
+            logger.warning("API login attempt with missing credentials: %s", ', '.join(errors.keys()))
             return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
         
         user = authenticate(request, username=email, password=password)
+        body, status_code = login_result(user, email)
+        return Response(body, status=status_code)
+
+
+def login_result(user, email):
+    """
+    Build the API login response body and status for an authentication
+    result. Shared by LoginView and the async login view.
+    """
+    if user:
+        if not user.is_active:
+            logger.warning("API login attempt by inactive user: %s", email)
+            return {'error': 'Account is inactive'}, status.HTTP_403_FORBIDDEN
         
-        if user:
-            if not user.is_active:
-                logger.warning(f"API login attempt by inactive user: {email}")
-                return Response({'error': 'Account is inactive'}, status=status.HTTP_403_FORBIDDEN)
-            
-            refresh = RefreshToken.for_user(user)
-            logger.info(f"API user login successful: {user.email}")
-            return Response({
-                'user': UserSerializer(user).data,
-                'refresh': str(refresh),
-                'access': str(refresh.access_token)
-            })
-        
-        logger.warning(f"Failed API login attempt for email: {email}")
-        return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+        refresh = RefreshToken.for_user(user)
+        logger.info("API user login successful: %s", user.email)
+        return {
+            'user': UserSerializer(user).data,
+            'refresh': str(refresh),
+            'access': str(refresh.access_token)
+        }, status.HTTP_200_OK
+    
+    logger.warning("Failed API login attempt for email: %s", email)
+    return {'error': 'Invalid credentials'}, status.HTTP_401_UNAUTHORIZED
 
 
 class LogoutView(APIView):
     """
     API Logout view that blacklists the refresh token
     """
+    query_budget = 5
     def post(self, request):
         try:
             refresh_token = request.data.get('refresh')
             if not refresh_token:
-                logger.warning(f"API logout attempt without refresh token")
+                logger.warning("API logout attempt without refresh token")
                 return Response({"error": "Refresh token is required"}, status=status.HTTP_400_BAD_REQUEST)
                 
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
-            logger.info(f"API user logged out: {request.user.email}")
+            logger.info("API user logged out: %s", request.user.email)
             return Response(status=status.HTTP_204_NO_CONTENT)
         except Exception as e:
-            logger.error(f"API logout error: {str(e)}")
+            logger.error("API logout error: %s", e)
             return Response({'error': 'Something went wrong'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
@@ -94,18 +115,19 @@ class UserProfileView(APIView):
     """
     API View for getting and updating user profile
     """
+    query_budget = {'get': 2, 'put': 4}
     def get(self, request):
         serializer = UserSerializer(request.user)
-        logger.info(f"API user profile accessed: {request.user.email}")
+        logger.info("API user profile accessed: %s", request.user.email)
         return Response(serializer.data)
     
     def put(self, request):
         serializer = UserSerializer(request.user, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
-            logger.info(f"API user profile updated: {request.user.email}")
+            logger.info("API user profile updated: %s", request.user.email)
             return Response(serializer.data)
-        logger.warning(f"API user profile update failed: {serializer.errors}")
+        logger.warning("API user profile update failed: %s", serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
 
@@ -120,20 +142,35 @@ class AdminPermission(permissions.BasePermission):
         )
 
 
-class RadioStationViewSet(viewsets.ModelViewSet):
-    """ViewSet for managing radio stations"""
+class RadioStationViewSet(ConditionalStationMixin, viewsets.ModelViewSet):
+    """ViewSet for managing radio stations, with conditional GET on list and retrieve"""
+    query_budget = {'list': 3, 'retrieve': 2, 'users': 3, '*': 8}
     queryset = RadioStation.objects.all().order_by('name')
     serializer_class = RadioStationSerializer
     permission_classes = [AdminPermission]
     
+    def get_queryset(self):
+        """Full-text search stations with ``?search=``"""
+        queryset = super().get_queryset()
+        search_query = self.request.query_params.get('search')
+        if search_query:
+            queryset = search(queryset, search_query)
+        return queryset
+    
     @action(detail=True, methods=['get'])
     def users(self, request, pk=None):
         """Get all users for a specific radio station"""
         station = self.get_object()
-        users = station.users.all()
+        users = station.users.select_related('radio_station')
         serializer = UserSerializer(users, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'], url_path='export/(?P<export_format>csv|ndjson)')
+    def export(self, request, export_format=None):
+        """Stream all radio stations as CSV or NDJSON"""
+        queryset = self.filter_queryset(self.get_queryset())
+        return export_response(queryset, STATION_EXPORT_COLUMNS, export_format, 'stations')
+    
     @action(detail=True, methods=['post'])
     def add_user(self, request, pk=None):
         """Add a new user to a radio station"""
@@ -165,15 +202,12 @@ class RadioStationViewSet(viewsets.ModelViewSet):
             # Find the user
             user = station.users.get(id=user_id)
             
-            # Use transaction to ensure atomicity
-            from django.db import transaction
-            with transaction.atomic():
-                # Reset any existing primary contacts
-                station.users.filter(is_primary_contact=True).update(is_primary_contact=False)
-                
-                # Set this user as primary
-                user.is_primary_contact = True
-                user.save()
+            # Demote the current primary contact and promote this user atomically
+            with admin_action(
+                request.user, ActivityEvent.Kind.PRIMARY_CONTACT_SET,
+                f'"{user.email}" is now the primary contact for "{station.name}"', user=user, station=station,
+            ):
+                user.make_primary_contact()
             
             return Response({"success": "Primary contact updated"})
         except CustomUser.DoesNotExist:
@@ -187,6 +221,7 @@ class RadioStationViewSet(viewsets.ModelViewSet):
 
 class LoginPageView(APIView):
     """View for handling user login with templates"""
+    query_budget = 10
     permission_classes = [permissions.AllowAny]
     
     def get(self, request):
@@ -214,37 +249,46 @@ class LoginPageView(APIView):
         
         # Attempt to authenticate
         user = authenticate(request, username=email, password=password)
+        return finish_page_login(request, user, email)
+
+
+def finish_page_login(request, user, email):
+    """
+    Log the user in and redirect, or re-render the login page, for an
+    authentication result. Shared by LoginPageView and the async login view.
+    """
+    if user:
+        if not user.is_active:
+            logger.warning("Login attempt by inactive user: %s", email)
+            messages.warning(request, 'Your account is inactive. Please contact an administrator.')
+            return render(request, 'accounts/login.html')
         
-        if user:
-            if not user.is_active:
-                logger.warning(f"Login attempt by inactive user: {email}")
-                messages.warning(request, 'Your account is inactive. Please contact an administrator.')
-                return render(request, 'accounts/login.html')
-            
-            # Log the user in using Django's session-based authentication
-            django_login(request, user)
-            logger.info(f"User login successful: {user.email}")
-            
-            # Redirect to appropriate page
-            return redirect('dashboard')
+        # Log the user in using Django's session-based authentication
+        django_login(request, user)
+        logger.info("User login successful: %s", user.email)
         
-        # Authentication failed
-        logger.warning(f"Failed login attempt for email: {email}")
-        messages.error(request, 'Invalid email or password.')
-        return render(request, 'accounts/login.html')
+        # Redirect to appropriate page
+        return redirect('dashboard')
+    
+    # Authentication failed
+    logger.warning("Failed login attempt for email: %s", email)
+    messages.error(request, 'Invalid email or password.')
+    return render(request, 'accounts/login.html')
 
 
+@query_budget({'post': 4})
 @require_http_methods(["POST"])
 def logout_view(request):
     """Handle user logout (template-based)"""
     if request.user.is_authenticated:
-        logger.info(f"User logged out: {request.user.email}")
+        logger.info("User logged out: %s", request.user.email)
     
     django_logout(request)
     messages.success(request, 'You have been logged out.')
     return redirect('login')
 
 
+@query_budget(4)
 @login_required
 def dashboard_view(request):
     """Dashboard view for authenticated users"""
@@ -253,31 +297,16 @@ def dashboard_view(request):
     
     # Get user-specific stats and activities
     if user.user_type == CustomUser.UserType.STAFF:
-        # Admin dashboard stats
+        # Admin dashboard stats, read from the materialized counters
+        counters = read_counters()
         stats = {
-            'active_users': CustomUser.objects.filter(is_active=True).count(),
-            'active_stations': RadioStation.objects.filter(is_active=True).count(),
+            'active_users': counters['active_users'],
+            'active_stations': counters['active_stations'],
             'content_count': 0,  # Will be populated once newsroom models are added
         }
         
-        # Mock recent activity for now
-        recent_activity = [
-            {
-                'type': 'user',
-                'text': 'New user "john@example.com" was created',
-                'time': '2 hours ago'
-            },
-            {
-                'type': 'station',
-                'text': 'Radio station "Community FM" was updated',
-                'time': '3 hours ago'
-            },
-            {
-                'type': 'content',
-                'text': 'New bulletin "Morning News" was published',
-                'time': '5 hours ago'
-            }
-        ]
+        # Latest events across all users and stations
+        recent_activity = dashboard_activity(latest_events())
     else:
         # Radio user dashboard stats
         stats = {
@@ -286,19 +315,8 @@ def dashboard_view(request):
             'new_updates': 0
         }
         
-        # Mock recent activity for radio users
-        recent_activity = [
-            {
-                'type': 'content',
-                'text': 'New content is available for your station',
-                'time': '1 hour ago'
-            },
-            {
-                'type': 'station',
-                'text': 'Your station details were updated',
-                'time': '1 day ago'
-            }
-        ]
+        # Events about the user's station and its users
+        recent_activity = dashboard_activity(latest_events(station_id=user.radio_station_id))
     
     context['stats'] = stats
     context['recent_activity'] = recent_activity
@@ -306,6 +324,7 @@ def dashboard_view(request):
     return render(request, 'dashboard.html', context)
 
 
+@query_budget({'get': 2, 'post': 4})
 @login_required
 def profile_view(request):
     """View function for user profile page"""
@@ -341,6 +360,7 @@ def admin_required(view_func):
 
 # =============== RADIO STATION MANAGEMENT VIEWS ===============
 
+@query_budget(3)
 @login_required
 @admin_required
 def station_list(request):
@@ -350,7 +370,7 @@ def station_list(request):
     # Handle search
     search_query = request.GET.get('q')
     if search_query:
-        stations = stations.filter(name__icontains=search_query)
+        stations = search(stations, search_query)
     
     # Handle filters
     province_filter = request.GET.get('province')
@@ -370,6 +390,7 @@ def station_list(request):
         'provinces': RadioStation.Province.choices,
     })
 
+@query_budget({'get': 2, 'post': 10})
 @login_required
 @admin_required
 def station_create(request):
@@ -478,6 +499,7 @@ def station_create(request):
         'religion_choices': RadioStation.RELIGION_CHOICES,
     })
 
+@query_budget({'get': 3, 'post': 8})
 @login_required
 @admin_required
 def station_edit(request, station_id):
@@ -514,11 +536,8 @@ def station_edit(request, station_id):
                 'religion_choices': RadioStation.RELIGION_CHOICES,
             })
         
-        # Update the station
+        # Update the station; only changed fields are written
         try:
-            # Save previous active state to check for changes
-            was_active = station.is_active
-            
             station.name = name
             station.description = description
             station.province = province
@@ -551,6 +570,7 @@ def station_edit(request, station_id):
         'religion_choices': RadioStation.RELIGION_CHOICES,
     })
 
+@query_budget(4)
 @login_required
 @admin_required
 def station_detail(request, station_id):
@@ -563,6 +583,7 @@ def station_detail(request, station_id):
         'users': station_users,
     })
 
+@query_budget({'get': 4, 'post': 12})
 @login_required
 @admin_required
 def station_delete(request, station_id):
@@ -579,6 +600,7 @@ def station_delete(request, station_id):
         'station': station,
     })
 
+@query_budget(4)
 @login_required
 @admin_required
 def station_user_list(request, station_id):
@@ -591,6 +613,7 @@ def station_user_list(request, station_id):
         'users': users,
     })
 
+@query_budget({'get': 4, 'post': 10})
 @login_required
 @admin_required
 def station_add_user(request, station_id):
@@ -621,27 +644,24 @@ def station_add_user(request, station_id):
                 'station': station,
             })
         
-        # Check if there's already a primary contact
-        if is_primary_contact and station.users.filter(is_primary_contact=True).exists():
-            # Get the existing primary contact
-            existing_primary = station.users.get(is_primary_contact=True)
-            # Update the existing primary contact
-            existing_primary.is_primary_contact = False
-            existing_primary.save()
-        
         # Create the user
         try:
-            user = CustomUser.objects.create_user(
-                email=email,
-                password=password,
-                first_name=first_name,
-                last_name=last_name,
-                mobile_number=mobile_number,
-                user_type=CustomUser.UserType.RADIO,
-                radio_station=station,
-                is_primary_contact=is_primary_contact,
-                is_active=is_active
-            )
+            from django.db import transaction
+            with transaction.atomic():
+                user = CustomUser.objects.create_user(
+                    email=email,
+                    password=password,
+                    first_name=first_name,
+                    last_name=last_name,
+                    mobile_number=mobile_number,
+                    user_type=CustomUser.UserType.RADIO,
+                    radio_station=station,
+                    is_active=is_active
+                )
+                
+                # Take over as primary contact from any existing one
+                if is_primary_contact:
+                    user.make_primary_contact()
             
             messages.success(request, f'User "{email}" has been added to the station.')
             return redirect('station_user_list', station_id=station.id)
@@ -654,6 +674,7 @@ def station_add_user(request, station_id):
         'station': station,
     })
 
+@query_budget({'post': 8})
 @login_required
 @admin_required
 def set_primary_contact(request, station_id, user_id):
@@ -665,12 +686,12 @@ def set_primary_contact(request, station_id, user_id):
         station = get_object_or_404(RadioStation, id=station_id)
         user = get_object_or_404(CustomUser, id=user_id, radio_station=station)
         
-        # Reset any existing primary contacts
-        station.users.filter(is_primary_contact=True).update(is_primary_contact=False)
-        
-        # Set this user as primary
-        user.is_primary_contact = True
-        user.save()
+        # Demote the current primary contact and promote this user atomically
+        with admin_action(
+            request.user, ActivityEvent.Kind.PRIMARY_CONTACT_SET,
+            f'"{user.email}" is now the primary contact for "{station.name}"', user=user, station=station,
+        ):
+            user.make_primary_contact()
         
         return JsonResponse({'success': True})
     
@@ -679,18 +700,19 @@ def set_primary_contact(request, station_id, user_id):
     
     # =============== USER MANAGEMENT VIEWS ===============
 
+@query_budget(4)
 @login_required
 @admin_required
 def user_list(request):
     """View for listing all users"""
     # Default to staff users
     user_type = request.GET.get('user_type', CustomUser.UserType.STAFF)
-    users = CustomUser.objects.filter(user_type=user_type).order_by('email')
+    users = CustomUser.objects.filter(user_type=user_type).select_related('radio_station').order_by('email')
     
     # Handle search
     search_query = request.GET.get('q')
     if search_query:
-        users = users.filter(email__icontains=search_query)
+        users = search(users, search_query)
     
     # Handle filters
     if user_type == CustomUser.UserType.STAFF:
@@ -723,6 +745,7 @@ def user_list(request):
         'status_filter': status_filter,
     })
 
+@query_budget({'get': 2, 'post': 6})
 @login_required
 @admin_required
 def create_staff_user(request):
@@ -775,6 +798,7 @@ def create_staff_user(request):
         'staff_roles': CustomUser.StaffRole.choices,
     })
 
+@query_budget({'get': 3, 'post': 10})
 @login_required
 @admin_required
 def create_radio_user(request):
@@ -813,27 +837,24 @@ def create_radio_user(request):
                 'stations': RadioStation.objects.all().order_by('name'),
             })
         
-        # Check if there's already a primary contact
-        if is_primary_contact and station.users.filter(is_primary_contact=True).exists():
-            # Get the existing primary contact
-            existing_primary = station.users.get(is_primary_contact=True)
-            # Update the existing primary contact
-            existing_primary.is_primary_contact = False
-            existing_primary.save()
-        
         # Create the user
         try:
-            user = CustomUser.objects.create_user(
-                email=email,
-                password=password,
-                first_name=first_name,
-                last_name=last_name,
-                mobile_number=mobile_number,
-                user_type=CustomUser.UserType.RADIO,
-                radio_station=station,
-                is_primary_contact=is_primary_contact,
-                is_active=is_active
-            )
+            from django.db import transaction
+            with transaction.atomic():
+                user = CustomUser.objects.create_user(
+                    email=email,
+                    password=password,
+                    first_name=first_name,
+                    last_name=last_name,
+                    mobile_number=mobile_number,
+                    user_type=CustomUser.UserType.RADIO,
+                    radio_station=station,
+                    is_active=is_active
+                )
+                
+                # Take over as primary contact from any existing one
+                if is_primary_contact:
+                    user.make_primary_contact()
             
             messages.success(request, f'Radio user "{email}" has been created.')
             return redirect('user_list')
@@ -846,6 +867,7 @@ def create_radio_user(request):
         'stations': RadioStation.objects.all().order_by('name'),
     })
 
+@query_budget({'get': 3, 'post': 8})
 @login_required
 @admin_required
 def edit_user(request, user_id):
@@ -859,6 +881,8 @@ def edit_user(request, user_id):
         mobile_number = request.POST.get('mobile_number')
         is_active = request.POST.get('is_active') == 'on'
         
+        make_primary = False
+        
         # User type specific data
         if user.user_type == CustomUser.UserType.STAFF:
             staff_role = request.POST.get('staff_role')
@@ -870,14 +894,14 @@ def edit_user(request, user_id):
             # Get the radio station
             try:
                 station = RadioStation.objects.get(id=radio_station_id)
+                moved = station.pk != user.radio_station_id
                 user.radio_station = station
                 
-                # Handle primary contact change
-                if is_primary_contact != user.is_primary_contact:
-                    if is_primary_contact:
-                        # Reset any existing primary contacts
-                        station.users.filter(is_primary_contact=True).update(is_primary_contact=False)
-                    user.is_primary_contact = is_primary_contact
+                # Promotion happens after the save, taking over from the
+                # station's current primary contact
+                make_primary = is_primary_contact and (moved or not user.is_primary_contact)
+                if make_primary or not is_primary_contact:
+                    user.is_primary_contact = False
                 
             except RadioStation.DoesNotExist:
                 messages.error(request, 'Selected radio station does not exist.')
@@ -889,7 +913,11 @@ def edit_user(request, user_id):
             user.last_name = last_name
             user.mobile_number = mobile_number
             user.is_active = is_active
-            user.save()
+            from django.db import transaction
+            with transaction.atomic():
+                user.save()
+                if make_primary:
+                    user.make_primary_contact()
             
             messages.success(request, f'User "{user.email}" has been updated.')
             return redirect('user_list')
@@ -907,6 +935,7 @@ def edit_user(request, user_id):
         context['stations'] = RadioStation.objects.all().order_by('name')
         return render(request, 'accounts/users/edit_radio.html', context)
 
+@query_budget({'get': 3, 'post': 8})
 @login_required
 @admin_required
 def delete_user(request, user_id):
@@ -923,6 +952,7 @@ def delete_user(request, user_id):
         'user': user,
     })
 
+@query_budget({'get': 3, 'post': 4})
 @login_required
 @admin_required
 def reset_password(request, user_id):
@@ -939,8 +969,12 @@ def reset_password(request, user_id):
             })
         
         try:
-            user.set_password(password)
-            user.save()
+            with admin_action(
+                request.user, ActivityEvent.Kind.PASSWORD_RESET,
+                f'Password for "{user.email}" was reset', user=user,
+            ):
+                user.set_password(password)
+                user.save()
             messages.success(request, f'Password for "{user.email}" has been reset.')
             return redirect('user_list')
         
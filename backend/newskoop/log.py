@@ -0,0 +1,185 @@
+# newskoop/log.py
+"""
+Non-blocking, structured logging.
+
+configure() is used as LOGGING_CONFIG. It applies LOGGING with dictConfig,
+then moves the handlers of the loggers in LOG_QUEUE['LOGGERS'] behind a
+queue. A logging call on a request thread only filters the record and
+puts it on the queue; a background listener thread formats it and writes
+it to the original handlers, so slow disks and log rotation never hold up
+a request. When the queue is full, records are dropped and counted
+instead of waiting.
+
+Messages should use %-style arguments (``logger.info("Saved %s", name)``)
+rather than f-strings, so records that are filtered out or sampled away
+are never formatted, and the rest are formatted on the listener thread.
+LOG_SAMPLING keeps one in N records of chosen noisy messages.
+"""
+import atexit
+import datetime
+import json
+import logging
+import logging.config
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+DEFAULT_LOG_QUEUE = {
+    'ENABLED': True,
+    'LOGGERS': ['django', 'accounts', 'newsroom', 'radio_zone'],
+    'MAX_SIZE': 10000,
+}
+
+# Arguments that can't change before the listener formats the message
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'queue_handlers'}
+
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with any ``extra`` fields included"""
+
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(
+                timespec='milliseconds'
+            ),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in N records of the configured messages. ``rates`` maps a
+    message template (the unformatted msg) to N, with ``'*'`` matching
+    every message of the logger. Warnings and errors are always kept.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.msg, self.rates.get('*'))
+        if not rate or rate <= 1:
+            return True
+        with self.lock:
+            count = self.counts.get(record.msg, 0)
+            self.counts[record.msg] = count + 1
+        if count % rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    Queues records for the handlers it stands in for, without formatting
+    them. Drops records when the queue is full; the next record queued
+    carries the number dropped.
+    """
+
+    def __init__(self, log_queue, handlers):
+        super().__init__(log_queue)
+        self.handlers = tuple(handlers)
+        self.dropped = 0
+
+    def prepare(self, record):
+        args = record.args
+        values = args.values() if isinstance(args, dict) else (args or ())
+        if not all(isinstance(value, IMMUTABLE_ARGS) for value in values):
+            # Objects may change before the listener gets to them
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Don't keep the traceback's frames alive in the queue
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.queue_handlers = self.handlers
+        return record
+
+    def enqueue(self, record):
+        if self.dropped:
+            record.dropped = self.dropped
+            self.dropped = 0
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1 + getattr(record, 'dropped', 0)
+
+
+class RoutingQueueListener(QueueListener):
+    """Passes each record to the handlers of the queue handler that queued it"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue, respect_handler_level=True)
+
+    def handle(self, record):
+        handlers = record.__dict__.pop('queue_handlers', ())
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def queue_loggers(logger_names, max_size):
+    """Put the named loggers' handlers behind one queue and listener thread"""
+    global _listener
+    stop_listener()
+
+    log_queue = queue.Queue(max_size)
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+        if not handlers:
+            continue
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(NonBlockingQueueHandler(log_queue, handlers))
+
+    _listener = RoutingQueueListener(log_queue)
+    _listener.start()
+    return _listener
+
+
+def stop_listener():
+    """Write out the queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure(config):
+    """LOGGING_CONFIG: dictConfig, sampling filters, then the queue"""
+    from django.conf import settings
+
+    logging.config.dictConfig(config)
+
+    for name, rates in getattr(settings, 'LOG_SAMPLING', {}).items():
+        logging.getLogger(name).addFilter(SamplingFilter(rates))
+
+    options = {**DEFAULT_LOG_QUEUE, **getattr(settings, 'LOG_QUEUE', {})}
+    if options['ENABLED']:
+        queue_loggers(options['LOGGERS'], options['MAX_SIZE'])
+
+
+atexit.register(stop_listener)
@@ -1,6 +1,7 @@
 # newskoop_project/settings.py
 
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -43,7 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'accounts.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'accounts.query_budget.QueryBudgetMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -74,13 +77,60 @@ TEMPLATES = [
 WSGI_APPLICATION = 'newskoop.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+# DB_ENGINE=postgresql for multi-node deployments; the SQLite profile is
+# tuned for a single node. Compare them with `manage.py benchmark_db_writes`.
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+
+# SQLite tuning: WAL lets reads run alongside a write, IMMEDIATE transactions
+# take the write lock up front so busy_timeout (OPTIONS['timeout']) can wait
+# for it instead of failing with "database is locked"
+SQLITE_TUNED_OPTIONS = {
+    'timeout': int(os.getenv('DB_SQLITE_BUSY_TIMEOUT', '20')),
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        f"PRAGMA mmap_size={int(os.getenv('DB_SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)))};"
+        'PRAGMA cache_size=-16000;'
+        'PRAGMA temp_store=MEMORY'
+    ),
 }
 
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'newskoop'),
+            'USER': os.getenv('DB_USER', 'newskoop'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Keep connections open between requests, checking them before reuse
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {},
+        }
+    }
+    if os.getenv('DB_POOL', 'False') == 'True':
+        # psycopg's connection pool (needs psycopg[pool]), which replaces
+        # persistent connections
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': SQLITE_TUNED_OPTIONS if os.getenv('DB_SQLITE_TUNED', 'True') == 'True' else {},
+        }
+    }
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -115,6 +165,18 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Per-request SQL query budgets (see accounts/query_budget.py)
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+QUERY_BUDGET_HEADERS = os.getenv('QUERY_BUDGET_HEADERS', 'False') == 'True'
+
+# Request metrics served at /metrics (see accounts/metrics.py). Each worker
+# writes its aggregates to METRICS_DIR, which should be emptied on deploy.
+METRICS = {
+    'ENABLED': os.getenv('METRICS_ENABLED', 'False') == 'True',
+    'DIRECTORY': os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'newskoop-metrics')),
+    'FLUSH_INTERVAL': int(os.getenv('METRICS_FLUSH_INTERVAL', '5')),
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -143,7 +205,7 @@ MESSAGE_TAGS = {
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -157,14 +219,29 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
+    # Sliding window counters shared by every worker (see accounts/throttling.py)
     'DEFAULT_THROTTLE_CLASSES': [
-    'rest_framework.throttling.AnonRateThrottle',
-    'rest_framework.throttling.UserRateThrottle'
+        'accounts.throttling.AnonRateThrottle',
+        'accounts.throttling.UserRateThrottle',
+        'accounts.throttling.ScopedRateThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'anon': '20/hour',  # Limit anonymous users
-        'user': '1000/day'  # Limit authenticated users
-    }
+        'anon': os.getenv('THROTTLE_RATE_ANON', '20/hour'),  # Limit anonymous users
+        'user': os.getenv('THROTTLE_RATE_USER', '1000/day'),  # Limit authenticated users
+        'login': os.getenv('THROTTLE_RATE_LOGIN', '10/min'),
+        'token_refresh': os.getenv('THROTTLE_RATE_TOKEN_REFRESH', '30/min'),
+    },
+    # Reverse proxies in front of the app. With 0 the throttles key on the
+    # connecting address and ignore X-Forwarded-For, which clients can forge;
+    # behind N proxies they use the address the Nth from last one saw.
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
+}
+
+# Store shared by the throttles: 'sqlite' (a file next to the database
+# unless THROTTLE_STORE_LOCATION is set) or 'redis' (LOCATION is a redis:// URL)
+THROTTLE_STORE = {
+    'BACKEND': os.getenv('THROTTLE_STORE', 'sqlite'),
+    'LOCATION': os.getenv('THROTTLE_STORE_LOCATION') or None,
 }
 
 # JWT Settings
@@ -184,6 +261,75 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Serve the login views asynchronously (for ASGI deployments), hashing
+# passwords on a bounded pool (see accounts/hashing.py)
+ASYNC_LOGIN = os.getenv('ASYNC_LOGIN', 'False') == 'True'
+# Serve the profile, stats and station reads from async views (accounts/async_views.py)
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+PASSWORD_HASH_POOL = {
+    'KIND': os.getenv('PASSWORD_HASH_POOL_KIND', 'thread'),
+    'WORKERS': int(os.getenv('PASSWORD_HASH_POOL_WORKERS', str(os.cpu_count() or 2))),
+    'MAX_QUEUE': int(os.getenv('PASSWORD_HASH_POOL_MAX_QUEUE', '64')),
+}
+
+# Cache of JWT-authenticated users (see accounts/authentication.py)
+AUTH_USER_CACHE = {
+    'TTL': int(os.getenv('AUTH_USER_CACHE_TTL', '30')),
+    'MAX_ENTRIES': 10000,
+    'SHARED_CACHE': os.getenv('AUTH_USER_SHARED_CACHE') or None,
+}
+
+# Bulk user import (see accounts/bulk_import.py)
+BULK_USER_IMPORT = {
+    'BATCH_SIZE': int(os.getenv('BULK_USER_IMPORT_BATCH_SIZE', '500')),
+    'HASH_WORKERS': int(os.getenv('BULK_USER_IMPORT_HASH_WORKERS', str(os.cpu_count() or 2))),
+    'MAX_ROWS': int(os.getenv('BULK_USER_IMPORT_MAX_ROWS', '20000')),
+}
+
+# Rows fetched per round trip by the streaming CSV/NDJSON exports (see accounts/exports.py)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Bloom filter in front of the refresh token blacklist (see accounts/blacklist.py)
+TOKEN_BLACKLIST_FILTER = {
+    'ENABLED': os.getenv('TOKEN_BLACKLIST_FILTER', 'True') == 'True',
+    'SYNC_INTERVAL': 2,
+    'SYNC_MARGIN': 60,
+    'REBUILD_INTERVAL': 3600,
+    # Use a cache every worker shares (e.g. Redis) in multi-worker deployments;
+    # with a local-memory one, filter misses are checked in the database
+    'SHARED_CACHE': os.getenv('TOKEN_BLACKLIST_SHARED_CACHE', 'default'),
+}
+
+# Activity event log shown on the dashboards (see accounts/activity.py)
+ACTIVITY_LOG = {
+    'RETENTION_DAYS': int(os.getenv('ACTIVITY_RETENTION_DAYS', '180')),
+    'PRUNE_BATCH_SIZE': 5000,
+    'DASHBOARD_EVENTS': 10,
+}
+
+# Story revision history (see newsroom/revisions.py)
+STORY_REVISIONS = {
+    'MAX_CHAIN': 16,
+    'COMPRESSION_LEVEL': 6,
+}
+
+# Per-station story feeds (see radio_zone/fanout.py)
+STATION_FEEDS = {
+    'BATCH_SIZE': 500,
+    'BACKFILL_DAYS': int(os.getenv('STATION_FEED_BACKFILL_DAYS', '30')),
+}
+
+# Chunked audio uploads (see newsroom/uploads.py)
+AUDIO_UPLOADS = {
+    'MAX_SIZE': int(os.getenv('AUDIO_UPLOAD_MAX_SIZE', str(2 * 1024 ** 3))),
+    'EXPIRE_HOURS': 24,
+}
+
+# Rendered story variants (see newsroom/rendering.py)
+STORY_RENDERING = {
+    'READ_OUT_WPM': int(os.getenv('STORY_READ_OUT_WPM', '160')),
+}
+
 # Spectacular API settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Newskoop API',
@@ -249,6 +395,22 @@ CORS_ALLOW_HEADERS = [
 ]
 
 # Logging Configuration
+# The handlers below are written to by a background thread, fed through a
+# queue, so logging never blocks a request (see newskoop/log.py)
+LOGGING_CONFIG = 'newskoop.log.configure'
+LOG_QUEUE = {
+    'ENABLED': os.getenv('LOG_QUEUE', 'True') == 'True',
+    'LOGGERS': ['django', 'accounts', 'newsroom', 'radio_zone'],
+    'MAX_SIZE': 10000,
+}
+# Keep one in N records of these messages (by unformatted message, or '*')
+LOG_SAMPLING = {
+    'accounts': {
+        'API user profile accessed: %s': 20,
+        'User updated: %s (%s)': 10,
+    },
+}
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -262,12 +424,15 @@ LOGGING = {
             'format': '{levelname} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'newskoop.log.JSONFormatter',
+        },
     },
     'handlers': {
         'console': {
             'level': 'INFO',
             'class': 'logging.StreamHandler',
-            'formatter': 'simple',
+            'formatter': os.getenv('LOG_CONSOLE_FORMAT', 'simple'),
         },
         'file': {
             'level': 'INFO',
@@ -275,7 +440,7 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs', 'newskoop.log'),
             'maxBytes': 1024 * 1024 * 5,  # 5 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
         'error_file': {
             'level': 'ERROR',
@@ -283,7 +448,7 @@ LOGGING = {
             'filename': os.path.join(BASE_DIR, 'logs', 'newskoop_error.log'),
             'maxBytes': 1024 * 1024 * 5,  # 5 MB
             'backupCount': 5,
-            'formatter': 'verbose',
+            'formatter': 'json',
         },
     },
     'loggers': {
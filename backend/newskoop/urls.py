@@ -5,6 +5,7 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 from accounts.urls import template_urlpatterns
+from accounts.admin_views import metrics
 
 urlpatterns = [
     # Django admin
@@ -12,8 +13,13 @@ urlpatterns = [
     
     # API endpoints
     path('api/accounts/', include('accounts.urls')),
+    path('api/newsroom/', include('newsroom.urls')),
+    path('api/radio/', include('radio_zone.urls')),
     # Other API endpoints will be added as apps are developed
     
+    # Prometheus scrape endpoint (see accounts/metrics.py)
+    path('metrics', metrics, name='metrics'),
+
     # API documentation
     path('schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
@@ -1,3 +1,15 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Story
+
+
+class StoryAdmin(admin.ModelAdmin):
+    list_display = ('title', 'category', 'language', 'status', 'published_at', 'author', 'revision_number', 'updated_at')
+    list_filter = ('status', 'category', 'language', 'religion')
+    search_fields = ('title',)
+    readonly_fields = ('published_at', 'revision_number', 'created_at', 'updated_at')
+
+    def save_model(self, request, obj, form, change):
+        obj.save(editor=request.user)
+
+admin.site.register(Story, StoryAdmin)
@@ -0,0 +1,39 @@
+# newsroom/management/commands/prune_uploads.py
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from newsroom.models import AudioUpload
+from newsroom.uploads import upload_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete audio uploads, and their files, that were never finished or failed their checksum. "
+        "Run it regularly, e.g. hourly from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=None,
+            help="Age after which unfinished uploads are deleted (default: AUDIO_UPLOADS['EXPIRE_HOURS'])",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only count the uploads")
+
+    def handle(self, *args, **options):
+        hours = options['hours'] if options['hours'] is not None else upload_settings()['EXPIRE_HOURS']
+        expired = AudioUpload.objects.exclude(status=AudioUpload.Status.COMPLETE).filter(
+            created_at__lt=timezone.now() - datetime.timedelta(hours=hours),
+        )
+
+        if options['dry_run']:
+            self.stdout.write(f"{expired.count()} unfinished upload(s) would be deleted.")
+            return
+
+        deleted = 0
+        for upload in list(expired):
+            upload.file.delete(save=False)
+            upload.delete()
+            deleted += 1
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} unfinished upload(s)."))
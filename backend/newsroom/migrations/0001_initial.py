@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:37
+
+import ckeditor.fields
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Story',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('body', ckeditor.fields.RichTextField(blank=True)),
+                ('language', models.CharField(choices=[('ENGLISH', 'English'), ('AFRIKAANS', 'Afrikaans'), ('XHOSA', 'Xhosa')], default='ENGLISH', max_length=20)),
+                ('category', models.CharField(choices=[('NEWS_STORIES', 'News Stories'), ('NEWS_BULLETINS', 'News Bulletins'), ('SPORT', 'Sport'), ('FINANCE', 'Finance'), ('SPECIALTY', 'Specialty')], default='NEWS_STORIES', max_length=20)),
+                ('religion', models.CharField(choices=[('GENERAL', 'General'), ('CHRISTIAN', 'Christian'), ('MUSLIM', 'Muslim')], default='GENERAL', max_length=20)),
+                ('revision_number', models.PositiveIntegerField(default=0, editable=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stories', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'stories',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StoryRevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('title', models.CharField(max_length=200)),
+                ('data', models.BinaryField()),
+                ('chain_length', models.PositiveSmallIntegerField(default=0)),
+                ('chain_bytes', models.PositiveIntegerField(default=0)),
+                ('body_length', models.PositiveIntegerField(default=0)),
+                ('editor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='newsroom.story')),
+            ],
+            options={
+                'ordering': ['-number'],
+                'constraints': [models.UniqueConstraint(fields=('story', 'number'), name='story_revision_number_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsroom', '0002_story_rendering'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='published_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='status',
+            field=models.CharField(choices=[('DRAFT', 'Draft'), ('PUBLISHED', 'Published')], default='DRAFT', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['status', '-published_at'], name='story_published_idx'),
+        ),
+    ]
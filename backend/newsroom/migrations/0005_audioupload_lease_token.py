@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('newsroom', '0004_audio_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audioupload',
+            name='lease_token',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+    ]
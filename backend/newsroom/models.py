@@ -1,3 +1,183 @@
-from django.db import models
+# newsroom/models.py
+import uuid
 
-# Create your models here.
+from ckeditor.fields import RichTextField
+from django.conf import settings
+from django.db import models, transaction
+from django.utils import timezone
+
+from accounts.entitlements import Category, Language, Religion
+from accounts.tracking import DirtyFieldsMixin
+
+from .rendering import render_story
+from .revisions import record_revision
+
+
+class Story(DirtyFieldsMixin, models.Model):
+    """
+    A news story, written and revised in the newsroom. Saving a change to
+    the title or body records a StoryRevision (see newsroom/revisions.py),
+    and a new body is rendered for delivery (see newsroom/rendering.py).
+    Publishing fans the story out to the feeds of the stations entitled to
+    it (see radio_zone/fanout.py).
+    """
+
+    class Status(models.TextChoices):
+        DRAFT = 'DRAFT', 'Draft'
+        PUBLISHED = 'PUBLISHED', 'Published'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    title = models.CharField(max_length=200)
+    body = RichTextField(blank=True)
+
+    # What the story is, for deciding which stations receive it
+    language = models.CharField(max_length=20, choices=Language.choices, default=Language.ENGLISH)
+    category = models.CharField(max_length=20, choices=Category.choices, default=Category.NEWS_STORIES)
+    religion = models.CharField(max_length=20, choices=Religion.choices, default=Religion.GENERAL)
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.DRAFT)
+    # Set when the story is published, cleared when it's unpublished
+    published_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='stories',
+    )
+    # Number of the latest revision
+    revision_number = models.PositiveIntegerField(default=0, editable=False)
+
+    # Variants rendered from the body on save (see newsroom/rendering.py)
+    rendered_html = models.TextField(blank=True, editable=False)
+    plain_text = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    read_seconds = models.PositiveIntegerField(default=0, editable=False)
+    content_hash = models.CharField(max_length=64, blank=True, editable=False)
+    renderer_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'stories'
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['status', '-published_at'], name='story_published_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    def save(self, *args, editor=None, **kwargs):
+        """Save the story, recording a revision by ``editor`` if the title or body changed"""
+        render_story(self)
+        if self.status == Story.Status.PUBLISHED and self.published_at is None:
+            self.published_at = timezone.now()
+        elif self.status != Story.Status.PUBLISHED:
+            self.published_at = None
+        if not self._state.adding and not self.has_changed('title', 'body'):
+            super().save(*args, **kwargs)
+            return
+
+        with transaction.atomic():
+            if self._state.adding:
+                base = ''
+                self.revision_number = 1
+            else:
+                base = self.revision_base()
+            super().save(*args, **kwargs)
+            record_revision(self, base, editor)
+
+    save.alters_data = True
+
+    def revision_base(self):
+        """
+        Lock the story and return the body of its latest revision, which the
+        new revision's delta is made against. Sets the new revision number.
+        """
+        stored = Story.objects.select_for_update().filter(pk=self.pk).values_list('revision_number', flat=True).get()
+        loaded_body = getattr(self, '_loaded_values', {}).get('body')
+        if stored == self.initial_value('revision_number') and loaded_body is not None:
+            base = loaded_body
+        else:
+            # Someone else saved since this instance was loaded (or the body
+            # was deferred): diff against what is stored
+            base = Story.objects.filter(pk=self.pk).values_list('body', flat=True).get()
+        self.revision_number = stored + 1
+        return base
+
+
+class StoryRevision(models.Model):
+    """
+    One saved version of a story. ``data`` is a compressed snapshot of the
+    body when ``chain_length`` is 0, and otherwise a compressed delta
+    against the revision before it.
+    """
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='revisions')
+    number = models.PositiveIntegerField()
+    editor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    title = models.CharField(max_length=200)
+    data = models.BinaryField()
+    # Deltas since the last snapshot, and their total compressed size
+    chain_length = models.PositiveSmallIntegerField(default=0)
+    chain_bytes = models.PositiveIntegerField(default=0)
+    body_length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-number']
+        constraints = [
+            models.UniqueConstraint(fields=['story', 'number'], name='story_revision_number_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.story_id} revision {self.number}'
+
+    @property
+    def is_snapshot(self):
+        return self.chain_length == 0
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Story revisions can't be changed once written")
+        super().save(*args, **kwargs)
+
+
+class AudioUpload(models.Model):
+    """
+    An audio file uploaded in chunks (see newsroom/uploads.py). ``offset``
+    is how many bytes of it have been received.
+    """
+
+    class Status(models.TextChoices):
+        UPLOADING = 'UPLOADING', 'Uploading'
+        COMPLETE = 'COMPLETE', 'Complete'
+        FAILED = 'FAILED', 'Failed'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    story = models.ForeignKey(Story, on_delete=models.SET_NULL, null=True, blank=True, related_name='audio')
+    uploader = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
+    # Name of the file on the uploader's machine
+    filename = models.CharField(max_length=255)
+    file = models.FileField(max_length=255, blank=True, editable=False)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    offset = models.PositiveBigIntegerField(default=0, editable=False)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.UPLOADING, editable=False)
+    # Lease of the request writing a chunk, if any, and the token of its claim
+    locked_until = models.DateTimeField(null=True, blank=True, editable=False)
+    lease_token = models.UUIDField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='audio_upload_status_idx'),
+        ]
+
+    def __str__(self):
+        return self.filename
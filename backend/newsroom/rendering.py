@@ -0,0 +1,180 @@
+# newsroom/rendering.py
+"""
+Render story bodies once, on save.
+
+CKEditor HTML is sanitized against an allowlist (styles, classes, scripts
+and unknown tags are removed) and turned into a plain-text read-out for
+presenters, with its word count and read-out time. The results are stored
+on the story with a hash of the body they came from, so delivering a
+story is a column read. They are recomputed when the body changes, and
+lazily, on the next save or read, when RENDERER_VERSION is raised.
+"""
+import hashlib
+import math
+import re
+from html import escape
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+# Raise when the output of render() changes, to re-render stored stories
+RENDERER_VERSION = 2
+
+DEFAULT_STORY_RENDERING = {
+    # Presenter read-out speed, in words per minute
+    'READ_OUT_WPM': 160,
+}
+
+ALLOWED_TAGS = {
+    'p', 'br', 'strong', 'b', 'em', 'i', 'u', 's', 'sub', 'sup', 'blockquote', 'hr',
+    'h2', 'h3', 'h4', 'ul', 'ol', 'li', 'a', 'table', 'thead', 'tbody', 'tr', 'th', 'td',
+}
+ALLOWED_ATTRIBUTES = {
+    'a': {'href', 'title'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan'},
+}
+VOID_TAGS = {'br', 'hr', 'embed'}
+# Removed along with everything inside them (void ones have nothing inside)
+DROPPED_TAGS = {'script', 'style', 'iframe', 'object', 'embed', 'noscript', 'template', 'head', 'title', 'svg'}
+# Tags that start a new paragraph of the read-out
+BLOCK_TAGS = {'p', 'div', 'blockquote', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'li', 'table', 'tr', 'hr'}
+WORD_RE = re.compile(r'\w')
+SAFE_URL = re.compile(r'^(?:https?:|mailto:|/|#)', re.IGNORECASE)
+
+
+def rendering_settings():
+    return {**DEFAULT_STORY_RENDERING, **getattr(settings, 'STORY_RENDERING', {})}
+
+
+def content_hash(body):
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+class Renderer(HTMLParser):
+    """Builds the sanitized HTML and the read-out text in one pass"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.text = []
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            # A void tag has no end tag to stop dropping at
+            if tag not in VOID_TAGS:
+                self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n\n')
+        elif tag == 'br':
+            self.text.append('\n')
+        if tag == 'li':
+            self.text.append('- ')
+        if tag not in ALLOWED_TAGS:
+            return
+
+        allowed = ALLOWED_ATTRIBUTES.get(tag, ())
+        attributes = ''
+        for name, value in attrs:
+            if name not in allowed or value is None:
+                continue
+            if name == 'href' and not SAFE_URL.match(value.strip()):
+                continue
+            attributes += f' {name}="{escape(value, quote=True)}"'
+        self.html.append(f'<{tag}{attributes}>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        # A self-closed <iframe/> or <svg/> has no content to drop
+        if tag in DROPPED_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            if tag not in VOID_TAGS:
+                self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append('\n\n')
+        if tag in ALLOWED_TAGS and tag in self.open_tags:
+            # Close anything left open inside it too
+            while self.open_tags:
+                open_tag = self.open_tags.pop()
+                self.html.append(f'</{open_tag}>')
+                if open_tag == tag:
+                    break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.html.append(escape(data, quote=False))
+        self.text.append(data)
+
+    def result(self):
+        self.close()
+        html = ''.join(self.html) + ''.join(f'</{tag}>' for tag in reversed(self.open_tags))
+        paragraphs = (re.sub(r'[ \t\r\f\v\xa0]+', ' ', part).strip() for part in re.split(r'\n{2,}', ''.join(self.text)))
+        text = '\n\n'.join(
+            '\n'.join(line.strip() for line in paragraph.split('\n')) for paragraph in paragraphs if paragraph
+        )
+        return html, text
+
+
+def render(body):
+    """Return the stored variants of a story body"""
+    renderer = Renderer()
+    renderer.feed(body)
+    html, text = renderer.result()
+    # List bullets and stray punctuation aren't read out
+    words = sum(1 for word in text.split() if WORD_RE.search(word))
+    return {
+        'rendered_html': html,
+        'plain_text': text,
+        'word_count': words,
+        'read_seconds': math.ceil(words * 60 / rendering_settings()['READ_OUT_WPM']),
+    }
+
+
+def is_current(story):
+    return story.renderer_version == RENDERER_VERSION and story.content_hash == content_hash(story.body)
+
+
+def render_story(story):
+    """Set the story's variants if they are missing or stale; True if they were"""
+    if is_current(story):
+        return False
+    for field, value in render(story.body).items():
+        setattr(story, field, value)
+    story.content_hash = content_hash(story.body)
+    story.renderer_version = RENDERER_VERSION
+    return True
+
+
+RENDERED_FIELDS = ('rendered_html', 'plain_text', 'word_count', 'read_seconds', 'content_hash', 'renderer_version')
+
+
+def refresh_rendering(stories):
+    """
+    Re-render stories rendered by an older renderer, writing the new
+    variants back so the next read is a column read again. Stories whose
+    body changed meanwhile are left to their own save.
+    """
+    from .models import Story
+
+    stale = [story for story in stories if story.renderer_version != RENDERER_VERSION]
+    for story in stale:
+        stored_hash = story.content_hash
+        render_story(story)
+        Story.objects.filter(pk=story.pk, content_hash=stored_hash).update(
+            **{field: getattr(story, field) for field in RENDERED_FIELDS}
+        )
+    return stories
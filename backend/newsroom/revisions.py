@@ -0,0 +1,234 @@
+# newsroom/revisions.py
+"""
+Delta-compressed story revisions.
+
+Every save of a story that changes its title or body appends a
+StoryRevision. Most revisions store only a zlib-compressed delta against
+the revision before them, so a revision costs about as much as the edit
+that made it. A revision is stored as a full compressed snapshot instead
+when the chain of deltas since the last snapshot reaches MAX_CHAIN, or
+when the deltas add up to more than a snapshot would take. Reconstructing
+any revision therefore reads one snapshot and at most MAX_CHAIN - 1
+deltas, whatever the number of revisions.
+
+Deltas work on HTML tokens (tags, and words with their trailing
+whitespace), so an edited word costs one word, whatever the length of the
+paragraph around it.
+"""
+import difflib
+import json
+import re
+import zlib
+
+from django.conf import settings
+
+DEFAULT_STORY_REVISIONS = {
+    # Deltas between snapshots; reconstructing reads at most this many rows
+    'MAX_CHAIN': 16,
+    'COMPRESSION_LEVEL': 6,
+}
+
+TOKEN_RE = re.compile(r'<[^>]*>|[^<\s]+\s*|\s+')
+
+
+def revision_settings():
+    return {**DEFAULT_STORY_REVISIONS, **getattr(settings, 'STORY_REVISIONS', {})}
+
+
+# --- Deltas ---
+
+def tokenize(text):
+    return TOKEN_RE.findall(text)
+
+
+def make_delta(base, text):
+    """
+    Return the operations that turn ``base`` into ``text``: [start, length]
+    copies a slice of base, a string is inserted as is.
+    """
+    old, new = tokenize(base), tokenize(text)
+    # Edits are usually in one place: match the unchanged ends directly and
+    # only diff the middle
+    prefix = 0
+    limit = min(len(old), len(new))
+    while prefix < limit and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+
+    offsets = [0]
+    for token in old:
+        offsets.append(offsets[-1] + len(token))
+
+    operations = []
+
+    def copy(start, end):
+        # Token range of base -> character slice
+        if start < end:
+            begin, length = offsets[start], offsets[end] - offsets[start]
+            if operations and isinstance(operations[-1], list) and sum(operations[-1]) == begin:
+                operations[-1][1] += length
+            else:
+                operations.append([begin, length])
+
+    def insert(tokens):
+        if tokens:
+            if operations and isinstance(operations[-1], str):
+                operations[-1] += ''.join(tokens)
+            else:
+                operations.append(''.join(tokens))
+
+    copy(0, prefix)
+    middle_old, middle_new = old[prefix:len(old) - suffix], new[prefix:len(new) - suffix]
+    # For long middles (rewrites), autojunk skips matching on very common
+    # tokens, keeping the diff fast at the cost of a slightly larger delta
+    matcher = difflib.SequenceMatcher(None, middle_old, middle_new)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            copy(prefix + i1, prefix + i2)
+        else:
+            insert(middle_new[j1:j2])
+    copy(len(old) - suffix, len(old))
+    return operations
+
+
+def apply_delta(base, operations):
+    parts = []
+    for operation in operations:
+        if isinstance(operation, str):
+            parts.append(operation)
+        else:
+            start, length = operation
+            parts.append(base[start:start + length])
+    return ''.join(parts)
+
+
+def compress(value):
+    data = json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return zlib.compress(data, revision_settings()['COMPRESSION_LEVEL'])
+
+
+def decompress(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+# --- Writing ---
+
+def record_revision(story, base, editor=None):
+    """
+    Append a revision for the story's current title and body. ``base`` is
+    the body of the story's latest revision. Called by Story.save() in the
+    same transaction.
+    """
+    from .models import StoryRevision
+
+    options = revision_settings()
+    number = story.revision_number
+    text = story.body
+    latest = None
+    if number > 1:
+        latest = (
+            StoryRevision.objects.filter(story=story, number=number - 1)
+            .values('chain_length', 'chain_bytes').first()
+        )
+
+    snapshot = compress(text)
+    data, chain_length, chain_bytes = snapshot, 0, 0
+    if latest is not None and latest['chain_length'] + 1 < options['MAX_CHAIN']:
+        delta = compress(make_delta(base, text))
+        # Once the deltas outgrow a snapshot, a snapshot is cheaper to read back
+        if latest['chain_bytes'] + len(delta) < len(snapshot):
+            data = delta
+            chain_length = latest['chain_length'] + 1
+            chain_bytes = latest['chain_bytes'] + len(delta)
+
+    return StoryRevision.objects.create(
+        story=story,
+        number=number,
+        editor=editor if editor is not None and editor.is_authenticated else None,
+        title=story.title,
+        data=data,
+        chain_length=chain_length,
+        chain_bytes=chain_bytes,
+        body_length=len(text),
+    )
+
+
+# --- Reading ---
+
+def chain_rows(story_id, number):
+    """The revisions needed to rebuild ``number``: its snapshot and the deltas after it"""
+    from .models import StoryRevision
+
+    revisions = StoryRevision.objects.filter(story_id=story_id)
+    chain_length = revisions.filter(number=number).values_list('chain_length', flat=True).first()
+    if chain_length is None:
+        return None
+    return list(
+        revisions.filter(number__gte=number - chain_length, number__lte=number)
+        .order_by('number').values('number', 'title', 'data', 'chain_length', 'editor_id', 'created_at')
+    )
+
+
+def replay(rows):
+    """Yield (row, body) for each row of a chain, starting at its snapshot"""
+    body = None
+    for row in rows:
+        payload = decompress(row['data'])
+        body = payload if row['chain_length'] == 0 else apply_delta(body, payload)
+        yield row, body
+
+
+def revision_body(story_id, number):
+    """The title, body and metadata of one revision, or None if it doesn't exist"""
+    rows = chain_rows(story_id, number)
+    if rows is None:
+        return None
+    row, body = list(replay(rows))[-1]
+    return {**row, 'body': body}
+
+
+def revision_bodies(story_id, numbers):
+    """
+    Rebuild several revisions, reading each chain once: revisions that
+    share a snapshot are rebuilt from the same rows.
+    """
+    wanted = sorted(set(numbers), reverse=True)
+    found = {}
+    for number in wanted:
+        if number in found:
+            continue
+        rows = chain_rows(story_id, number)
+        if rows is None:
+            continue
+        for row, body in replay(rows):
+            if row['number'] in wanted:
+                found[row['number']] = {**row, 'body': body}
+    return found
+
+
+def diff_revisions(story_id, first, second, context=3):
+    """
+    Unified diff between two revisions, one HTML tag or line of text per
+    diff line. Returns None if either revision doesn't exist.
+    """
+    bodies = revision_bodies(story_id, [first, second])
+    if first not in bodies or second not in bodies:
+        return None
+    before, after = bodies[first], bodies[second]
+    lines = difflib.unified_diff(
+        html_lines(before['body']), html_lines(after['body']),
+        fromfile=f'revision {first}', tofile=f'revision {second}', n=context, lineterm='',
+    )
+    return {
+        'from': first,
+        'to': second,
+        'title': None if before['title'] == after['title'] else {'from': before['title'], 'to': after['title']},
+        'diff': '\n'.join(lines),
+    }
+
+
+def html_lines(body):
+    """Split HTML after each tag and line break, for line-based diffs"""
+    return [line for line in re.split(r'(?<=>)|\n', body) if line.strip()]
@@ -0,0 +1,94 @@
+# newsroom/serializers.py
+import os
+import re
+
+from rest_framework import serializers
+
+from .models import AudioUpload, Story, StoryRevision
+from .uploads import create_file, upload_settings
+
+
+class StorySerializer(serializers.ModelSerializer):
+    """Serializer for stories. Saving records a revision by the requesting user."""
+    author = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = Story
+        fields = [
+            'id', 'title', 'body', 'language', 'category', 'religion', 'status', 'published_at', 'author',
+            'revision_number', 'rendered_html', 'plain_text', 'word_count', 'read_seconds',
+            'created_at', 'updated_at',
+        ]
+        read_only_fields = [
+            'id', 'published_at', 'revision_number', 'rendered_html', 'plain_text', 'word_count', 'read_seconds',
+            'created_at', 'updated_at',
+        ]
+
+    def create(self, validated_data):
+        editor = validated_data.pop('editor', None)
+        story = Story(**validated_data)
+        story.save(editor=editor)
+        return story
+
+    def update(self, instance, validated_data):
+        editor = validated_data.pop('editor', None)
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(editor=editor)
+        return instance
+
+
+class StoryRevisionSerializer(serializers.ModelSerializer):
+    """Revision metadata, without the stored data"""
+    # Annotated by the view, which leaves the data itself unloaded
+    stored_bytes = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = StoryRevision
+        fields = ['number', 'title', 'editor', 'created_at', 'body_length', 'is_snapshot', 'stored_bytes']
+
+
+class RevisionBodySerializer(serializers.Serializer):
+    """A revision rebuilt from its snapshot and deltas"""
+    number = serializers.IntegerField()
+    title = serializers.CharField()
+    body = serializers.CharField()
+    editor = serializers.UUIDField(source='editor_id', allow_null=True)
+    created_at = serializers.DateTimeField()
+
+
+class AudioUploadSerializer(serializers.ModelSerializer):
+    """Serializer for audio uploads. Creating one creates its empty file; chunks are sent with PATCH."""
+    uploader = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    class Meta:
+        model = AudioUpload
+        fields = [
+            'id', 'story', 'uploader', 'filename', 'size', 'sha256', 'offset', 'status', 'file',
+            'created_at', 'completed_at',
+        ]
+        read_only_fields = ['id', 'offset', 'status', 'file', 'created_at', 'completed_at']
+
+    def validate_filename(self, value):
+        extensions = upload_settings()['EXTENSIONS']
+        if os.path.splitext(value)[1].lower() not in extensions:
+            raise serializers.ValidationError(f"Audio files must end in one of: {', '.join(extensions)}")
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        max_size = upload_settings()['MAX_SIZE']
+        if not 0 < value <= max_size:
+            raise serializers.ValidationError(f"Size must be between 1 and {max_size} bytes")
+        return value
+
+    def validate_sha256(self, value):
+        value = value.lower()
+        if not re.fullmatch(r'[0-9a-f]{64}', value):
+            raise serializers.ValidationError("Must be a hex SHA-256 digest")
+        return value
+
+    def create(self, validated_data):
+        upload = AudioUpload(**validated_data)
+        create_file(upload)
+        upload.save()
+        return upload
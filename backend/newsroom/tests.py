@@ -1,3 +1,475 @@
-from django.test import TestCase
+import base64
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.http import UnreadablePostError
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.models import CustomUser, RadioStation
+
+from . import rendering
+from .models import AudioUpload, Story, StoryRevision
+from .rendering import refresh_rendering, render
+from .revisions import apply_delta, compress, make_delta, revision_bodies, revision_body
+from .uploads import CHUNK_CONTENT_TYPE, UploadError, claim, receive_chunk
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+WORDS = 'the minister said on tuesday that provincial roads would be repaired before winter rains'.split()
+
+
+def article(rng, paragraphs=40):
+    return '\n'.join(
+        '<p>' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(30, 60))) + '</p>'
+        for _ in range(paragraphs)
+    )
+
+
+def edit(rng, body):
+    """Change, add or drop a few words somewhere in the body"""
+    words = body.split(' ')
+    position = rng.randrange(len(words))
+    kind = rng.choice(['replace', 'insert', 'delete'])
+    if kind == 'replace':
+        words[position] = rng.choice(WORDS).upper()
+    elif kind == 'insert':
+        words[position:position] = ['<strong>breaking</strong>', rng.choice(WORDS)]
+    else:
+        del words[position:position + 3]
+    return ' '.join(words)
+
+
+class DeltaTests(TestCase):
+    """Deltas rebuild the new text exactly and grow with the edit, not the text"""
+
+    def test_round_trip(self):
+        rng = random.Random(1)
+        base = article(rng)
+        for _ in range(50):
+            text = edit(rng, base)
+            self.assertEqual(apply_delta(base, make_delta(base, text)), text)
+            base = text
+        self.assertEqual(apply_delta('', make_delta('', base)), base)
+        self.assertEqual(apply_delta(base, make_delta(base, '')), '')
+
+    def test_size_follows_the_edit(self):
+        rng = random.Random(2)
+        base = article(rng, paragraphs=200)
+        text = base.replace('</p>', ' <em>Updated</em></p>', 1)
+        self.assertLess(len(compress(make_delta(base, text))), 60)
+        self.assertGreater(len(compress(base)), 5000)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, STORY_REVISIONS={'MAX_CHAIN': 8})
+class StoryRevisionTests(TestCase):
+    """Saving a story records a compact revision that can be rebuilt"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journalist = CustomUser.objects.create_user(
+            'journalist@example.com', 'password', staff_role=CustomUser.StaffRole.JOURNALIST,
+        )
+        cls.editor = CustomUser.objects.create_user(
+            'editor@example.com', 'password', staff_role=CustomUser.StaffRole.EDITOR,
+        )
+
+    def write_history(self, edits):
+        rng = random.Random(3)
+        story = Story(title='Roads', body=article(rng), author=self.journalist)
+        story.save(editor=self.journalist)
+        versions = {1: story.body}
+        for _ in range(edits):
+            story = Story.objects.get(pk=story.pk)
+            story.body = edit(rng, story.body)
+            story.save(editor=self.editor)
+            versions[story.revision_number] = story.body
+        return story, versions
+
+    def test_every_revision_is_rebuilt(self):
+        story, versions = self.write_history(30)
+        self.assertEqual(story.revision_number, 31)
+        for number, body in versions.items():
+            self.assertEqual(revision_body(story.pk, number)['body'], body)
+        self.assertEqual({n: r['body'] for n, r in revision_bodies(story.pk, [5, 6, 20]).items()},
+                         {n: versions[n] for n in (5, 6, 20)})
+
+    def test_storage_follows_the_edits(self):
+        story, versions = self.write_history(30)
+        revisions = list(StoryRevision.objects.filter(story=story).order_by('number'))
+        snapshots = [revision.number for revision in revisions if revision.is_snapshot]
+        self.assertEqual(snapshots, [1, 9, 17, 25])
+        self.assertTrue(all(revision.chain_length < 8 for revision in revisions))
+
+        stored = sum(len(revision.data) for revision in revisions)
+        full_copies = sum(len(compress(body)) for body in versions.values())
+        self.assertLess(stored, full_copies / 5)
+
+    def test_rebuilding_reads_one_chain(self):
+        story, _ = self.write_history(20)
+        with CaptureQueriesContext(connection) as queries:
+            revision_body(story.pk, 16)
+        self.assertEqual(len(queries), 2)
+        self.assertIn('"newsroom_storyrevision"."number" >= 9', queries[1]['sql'])
+
+    def test_unchanged_save_adds_no_revision(self):
+        story, _ = self.write_history(1)
+        story.language = 'AFRIKAANS'
+        story.save(editor=self.editor)
+        self.assertEqual(story.revisions.count(), 2)
+        with self.assertRaises(ValueError):
+            story.revisions.first().save()
+
+    def test_concurrent_edits_keep_history_intact(self):
+        story, _ = self.write_history(2)
+        first = Story.objects.get(pk=story.pk)
+        second = Story.objects.get(pk=story.pk)
+        first.body += '<p>From the first editor</p>'
+        first.save(editor=self.journalist)
+        second.body = '<p>Rewritten</p>'
+        second.save(editor=self.editor)
+
+        self.assertEqual(second.revision_number, 5)
+        self.assertTrue(revision_body(story.pk, 4)['body'].endswith('<p>From the first editor</p>'))
+        self.assertEqual(revision_body(story.pk, 5)['body'], '<p>Rewritten</p>')
+
+
+class RenderingTests(TestCase):
+    """Story bodies are sanitized and rendered once, when they change"""
+
+    def test_sanitizes_editor_html(self):
+        rendered = render(
+            '<p style="color:red" class="lead" onclick="steal()">Roads <b>closed</b></p>'
+            '<script>alert(1)</script><style>p {}</style>'
+            '<a href="javascript:alert(1)">bad</a> <a href="https://example.com/?a=1&b=2" target="_blank">good</a>'
+            '<font face="Arial">unknown tag</font><ul><li>one<li>two</ul>'
+        )['rendered_html']
+        self.assertEqual(
+            rendered,
+            '<p>Roads <b>closed</b></p><a>bad</a> <a href="https://example.com/?a=1&amp;b=2">good</a>'
+            'unknown tag<ul><li>one<li>two</li></li></ul>',
+        )
+
+    def test_dropped_tags_without_content(self):
+        # Void and self-closed dropped tags don't swallow the rest of the story
+        for dropped in ['<embed src="x">', '<embed src="x"></embed>', '<iframe src="x"/>', '<svg/>']:
+            with self.subTest(dropped=dropped):
+                rendered = render(f'<p>a</p>{dropped}<p>important</p>')
+                self.assertEqual(rendered['rendered_html'], '<p>a</p><p>important</p>')
+                self.assertEqual(rendered['plain_text'], 'a\n\nimportant')
+
+        rendered = render('<script>x</script><iframe src="x"><p>inside</p></iframe><p>after</p>')
+        self.assertEqual(rendered['rendered_html'], '<p>after</p>')
+
+    @override_settings(STORY_RENDERING={'READ_OUT_WPM': 120})
+    def test_read_out(self):
+        rendered = render('<h2>Roads</h2><p>The&nbsp;minister said<br>roads would be repaired.</p><ul><li>N1</li></ul>')
+        self.assertEqual(rendered['plain_text'], 'Roads\n\nThe minister said\nroads would be repaired.\n\n- N1')
+        self.assertEqual(rendered['word_count'], 9)
+        self.assertEqual(rendered['read_seconds'], 5)
+
+    def test_renders_only_when_the_body_changes(self):
+        story = Story.objects.create(title='Roads', body='<p>Roads closed</p>')
+        self.assertEqual(story.plain_text, 'Roads closed')
+        self.assertEqual(story.renderer_version, rendering.RENDERER_VERSION)
+
+        story = Story.objects.get(pk=story.pk)
+        with mock.patch('newsroom.rendering.render', wraps=render) as renderer:
+            story.title = 'Road closures'
+            story.save()
+            renderer.assert_not_called()
+            story.body = '<p>Roads open</p>'
+            story.save()
+            renderer.assert_called_once()
+        self.assertEqual(Story.objects.get(pk=story.pk).rendered_html, '<p>Roads open</p>')
+
+    def test_new_renderer_version_re_renders_lazily(self):
+        story = Story.objects.create(title='Roads', body='<p>Roads closed</p>')
+        version = rendering.RENDERER_VERSION + 1
+        with mock.patch('newsroom.rendering.RENDERER_VERSION', version), \
+                mock.patch('newsroom.rendering.render', wraps=render) as renderer:
+            stories = refresh_rendering(list(Story.objects.all()))
+            self.assertEqual(stories[0].renderer_version, version)
+            self.assertEqual(Story.objects.get(pk=story.pk).renderer_version, version)
+            refresh_rendering(list(Story.objects.all()))
+        renderer.assert_called_once()
+
+    def test_refresh_leaves_newer_bodies_alone(self):
+        story = Story.objects.create(title='Roads', body='<p>Roads closed</p>')
+        Story.objects.filter(pk=story.pk).update(renderer_version=0)
+        stale = Story.objects.get(pk=story.pk)
+        edited = Story.objects.get(pk=story.pk)
+        edited.body = '<p>Roads open</p>'
+        edited.save()
+        refresh_rendering([stale])
+        self.assertEqual(Story.objects.get(pk=story.pk).plain_text, 'Roads open')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, QUERY_BUDGET_STRICT=True)
+class StoryAPITests(TestCase):
+    """Stories and their revision history over the API"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journalist = CustomUser.objects.create_user(
+            'journalist@example.com', 'password', staff_role=CustomUser.StaffRole.JOURNALIST,
+        )
+        cls.radio = CustomUser.objects.create_user(
+            'radio@example.com', 'password',
+            user_type=CustomUser.UserType.RADIO, radio_station=RadioStation.objects.create(name='Main FM'),
+        )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_revision_history(self):
+        client = self.client_for(self.journalist)
+        created = client.post(reverse('newsroom:story-list'), {
+            'title': 'Roads', 'body': '<p>The minister said roads would be repaired.</p>',
+        }, format='json')
+        self.assertEqual(created.status_code, 201)
+        detail = reverse('newsroom:story-detail', args=[created.data['id']])
+        client.patch(detail, {'body': '<p>The minister said all roads would be repaired by May.</p>'}, format='json')
+        client.patch(detail, {'title': 'Road repairs'}, format='json')
+
+        self.assertEqual(created.data['plain_text'], 'The minister said roads would be repaired.')
+        self.assertEqual(created.data['word_count'], 7)
+
+        revisions = client.get(reverse('newsroom:story-revisions', args=[created.data['id']]))
+        self.assertEqual([revision['number'] for revision in revisions.data['results']], [3, 2, 1])
+        self.assertEqual(revisions.data['results'][0]['editor'], self.journalist.pk)
+        self.assertNotIn('data', revisions.data['results'][0])
+
+        revision = client.get(reverse('newsroom:story-revision', args=[created.data['id'], 1]))
+        self.assertEqual(revision.data['body'], '<p>The minister said roads would be repaired.</p>')
+
+        diff = client.get(reverse('newsroom:story-diff', args=[created.data['id']]), {'from': 1, 'to': 3})
+        self.assertEqual(diff.data['title'], {'from': 'Roads', 'to': 'Road repairs'})
+        self.assertIn('-The minister said roads would be repaired.</p>', diff.data['diff'])
+        self.assertIn('+The minister said all roads would be repaired by May.</p>', diff.data['diff'])
+
+        missing = client.get(reverse('newsroom:story-revision', args=[created.data['id'], 9]))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_newsroom_staff_only(self):
+        response = self.client_for(self.radio).get(reverse('newsroom:story-list'))
+        self.assertEqual(response.status_code, 403)
+
+
+class SyntheticStream:
+    """Bytes ``start`` to ``end`` of a file made up as it's read, optionally cut off at ``drop_at``"""
+
+    def __init__(self, end, start=0, drop_at=None):
+        self.end = end
+        self.drop_at = drop_at
+        self.position = start
+        self.digest = hashlib.sha256()
+
+    def read(self, size):
+        if self.drop_at is not None and self.position >= self.drop_at:
+            raise UnreadablePostError('connection reset')
+        size = min(size, self.end - self.position)
+        block = bytes([self.position // 4096 % 251]) * size
+        self.position += size
+        self.digest.update(block)
+        return block
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, QUERY_BUDGET_STRICT=True)
+class AudioUploadTests(TestCase):
+    """Audio is uploaded in checked chunks that can be resumed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.journalist = CustomUser.objects.create_user(
+            'journalist@example.com', 'password', staff_role=CustomUser.StaffRole.JOURNALIST,
+        )
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.journalist).access_token}')
+        self.audio = os.urandom(300_000)
+
+    def create(self, data=None):
+        response = self.client.post(reverse('newsroom:audioupload-list'), {
+            'filename': 'bulletin.mp3', 'size': len(data or self.audio),
+            'sha256': hashlib.sha256(data or self.audio).hexdigest(),
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def send(self, url, offset, chunk, checksum=True):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum:
+            digest = base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+            headers['HTTP_UPLOAD_CHECKSUM'] = f'sha256 {digest}'
+        return self.client.patch(url, chunk, content_type=CHUNK_CONTENT_TYPE, **headers)
+
+    def test_upload_in_chunks(self):
+        created = self.create()
+        url = created['Location']
+        for offset in range(0, len(self.audio), 128_000):
+            response = self.send(url, offset, self.audio[offset:offset + 128_000])
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(int(response['Upload-Offset']), min(offset + 128_000, len(self.audio)))
+
+        upload = AudioUpload.objects.get(pk=created.data['id'])
+        self.assertEqual(upload.status, AudioUpload.Status.COMPLETE)
+        self.assertTrue(upload.file.name.startswith('audio/'))
+        with upload.file.open('rb') as file:
+            self.assertEqual(file.read(), self.audio)
+
+    def test_resume_after_dropped_connection(self):
+        created = self.create()
+        url = created['Location']
+        self.send(url, 0, self.audio[:100_000])
+
+        # The connection drops partway through a chunk sent without a checksum
+        upload = AudioUpload.objects.get(pk=created.data['id'])
+        stream = mock.Mock()
+        stream.read.side_effect = [self.audio[100_000:150_000], UnreadablePostError('connection reset')]
+        receive_chunk(upload, stream, 100_000, 200_000)
+
+        resume = self.client.head(url)
+        self.assertEqual(resume['Upload-Offset'], '150000')
+        response = self.send(url, 150_000, self.audio[150_000:])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(AudioUpload.objects.get(pk=upload.pk).status, AudioUpload.Status.COMPLETE)
+
+    def test_bad_chunks_are_refused(self):
+        url = self.create()['Location']
+        self.send(url, 0, self.audio[:100_000])
+
+        conflict = self.send(url, 50_000, self.audio[50_000:150_000])
+        self.assertEqual(conflict.status_code, 409)
+        self.assertEqual(conflict['Upload-Offset'], '100000')
+
+        digest = base64.b64encode(hashlib.sha256(b'something else').digest()).decode()
+        mismatch = self.client.patch(
+            url, self.audio[100_000:200_000], content_type=CHUNK_CONTENT_TYPE,
+            HTTP_UPLOAD_OFFSET='100000', HTTP_UPLOAD_CHECKSUM=f'sha256 {digest}',
+        )
+        self.assertEqual(mismatch.status_code, 400)
+        self.assertEqual(mismatch['Upload-Offset'], '100000')
+        upload = AudioUpload.objects.get()
+        self.assertEqual(os.path.getsize(upload.file.path), 100_000)
+
+        too_long = self.send(url, 100_000, self.audio[100_000:] + b'extra')
+        self.assertEqual(too_long.status_code, 413)
+        wrong_type = self.client.patch(url, {'offset': 1}, format='json', HTTP_UPLOAD_OFFSET='100000')
+        self.assertEqual(wrong_type.status_code, 415)
+
+    def take_over(self, upload, offset):
+        """Another request claims the upload, as after this one's lease ran out"""
+        AudioUpload.objects.filter(pk=upload.pk).update(offset=offset, locked_until=None, lease_token=None)
+        claim(upload, offset)
+
+    def test_writer_taken_over_stops(self):
+        upload = AudioUpload.objects.get(pk=self.create().data['id'])
+        stream = mock.Mock()
+
+        # While streaming: the lease renewal finds the new writer's token
+        def read(size):
+            if stream.read.call_count == 2:
+                self.take_over(upload, 0)
+            return self.audio[:size]
+        stream.read.side_effect = read
+        with override_settings(AUDIO_UPLOADS={'LEASE_SECONDS': 0, 'READ_SIZE': 50_000}):
+            with self.assertRaises(UploadError) as raised:
+                receive_chunk(upload, stream, 0, 200_000)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(stream.read.call_count, 2)
+
+        # After the last byte: the offset isn't written over the new writer's
+        AudioUpload.objects.filter(pk=upload.pk).update(locked_until=None)
+        stream.read.side_effect = lambda size: self.take_over(upload, 0) or self.audio[:size]
+        with self.assertRaises(UploadError) as raised:
+            receive_chunk(upload, stream, 0, 100_000)
+        self.assertEqual(raised.exception.status, 409)
+        stored = AudioUpload.objects.get(pk=upload.pk)
+        self.assertEqual((stored.offset, upload.offset), (0, 0))
+        self.assertIsNotNone(stored.lease_token)
+
+    def test_taken_over_writer_leaves_the_file_alone(self):
+        for drop in (False, True):
+            with self.subTest(drop=drop):
+                upload = AudioUpload.objects.get(pk=self.create().data['id'])
+                stream = mock.Mock()
+
+                # The new writer claims the upload and writes while this one waits for its next block
+                def read(size):
+                    if stream.read.call_count == 2:
+                        self.take_over(upload, 0)
+                        with open(upload.file.path, 'r+b') as file:
+                            file.write(b'new writer')
+                        return b'' if drop else self.audio[50_000:50_000 + size]
+                    return self.audio[:size]
+                stream.read.side_effect = read
+                with override_settings(AUDIO_UPLOADS={'LEASE_SECONDS': 0, 'READ_SIZE': 50_000}):
+                    with self.assertRaises(UploadError) as raised:
+                        receive_chunk(upload, stream, 0, 200_000, checksum=hashlib.sha256(self.audio[:200_000]).digest())
+                self.assertEqual(raised.exception.status, 409)
+                # Neither the next block nor the cut-off of the failed chunk reached the file
+                with open(upload.file.path, 'rb') as file:
+                    self.assertEqual(file.read(), b'new writer' + self.audio[10:50_000])
+
+    def test_whole_file_checksum(self):
+        url = self.create()['Location']
+        corrupted = self.audio[:-1] + bytes([self.audio[-1] ^ 1])
+        response = self.send(url, 0, corrupted)
+        self.assertEqual(response.status_code, 422)
+        upload = AudioUpload.objects.get()
+        self.assertEqual(upload.status, AudioUpload.Status.FAILED)
+        self.assertEqual(upload.file.name, '')
+
+        # The file is checked as it is on disk, not as it was streamed
+        created = self.create()
+        self.send(created['Location'], 0, self.audio[:200_000])
+        upload = AudioUpload.objects.get(pk=created.data['id'])
+        with open(upload.file.path, 'r+b') as file:
+            file.write(b'changed')
+        response = self.send(created['Location'], 200_000, self.audio[200_000:])
+        self.assertEqual(response.status_code, 422)
+
+    def test_validation(self):
+        response = self.client.post(reverse('newsroom:audioupload-list'), {
+            'filename': 'bulletin.exe', 'size': 0, 'sha256': 'abc',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'filename', 'size', 'sha256'})
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_memory_stays_flat(self):
+        length = 64 * 1024 * 1024
+        expected = SyntheticStream(length)
+        while expected.position < length:
+            expected.read(1024 * 1024)
+        upload = AudioUpload.objects.get(pk=self.create(b'x').data['id'])
+        AudioUpload.objects.filter(pk=upload.pk).update(size=length, sha256=expected.digest.hexdigest())
+        upload.refresh_from_db()
+
+        tracemalloc.start()
+        try:
+            receive_chunk(upload, SyntheticStream(length, drop_at=length // 2), 0, length)
+            receive_chunk(upload, SyntheticStream(length, start=length // 2), length // 2, length // 2)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(upload.status, AudioUpload.Status.COMPLETE)
+        self.assertLess(peak, 4 * 1024 * 1024)
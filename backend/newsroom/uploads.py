@@ -0,0 +1,247 @@
+# newsroom/uploads.py
+"""
+Chunked, resumable uploads of bulletin audio.
+
+Django's upload handlers read a whole multipart body into memory or a
+temporary file before the view runs, and then copy it into storage.
+Audio is uploaded in raw chunks instead, in a protocol modelled on tus:
+
+1. ``POST`` the file's name, size and SHA-256 to create an AudioUpload.
+   Its file is created empty at its final path in MEDIA_ROOT.
+2. ``PATCH`` the file in chunks, each sent with the ``Upload-Offset`` it
+   starts at. The body is streamed into the file READ_SIZE bytes at a
+   time, so a worker holds one block whatever the size of the chunk or
+   the file. A chunk sent with ``Upload-Checksum: sha256 <base64 digest>``
+   is checked as it streams, and cut off again if it doesn't match.
+3. After a dropped connection, ``HEAD`` returns the ``Upload-Offset`` the
+   server has; the client resends from there. Without a chunk checksum,
+   whatever arrived before the drop is kept.
+
+When the last byte arrives the file is read back from disk, a block at a
+time, and checked against the SHA-256 of the whole file.
+
+One writer at a time holds a short lease on an upload, so a client
+retrying a chunk can't interleave with itself. Each claim draws a new
+lease token. Before each write to the file the writer makes sure the lease
+is still its own, renewing it (conditional on the token) once half of it
+has passed, and the final offset update is conditional on the token too.
+A writer that stalled past its lease and was taken over stops with a 409
+without touching the file again. A writer paused for a whole lease between
+that check and its write could still change the file; the final SHA-256
+check catches that.
+"""
+import base64
+import binascii
+import datetime
+import hashlib
+import os
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+DEFAULT_AUDIO_UPLOADS = {
+    # Directory in MEDIA_ROOT, followed by year and month
+    'DIRECTORY': 'audio',
+    'EXTENSIONS': ['.mp3', '.wav', '.ogg', '.oga', '.m4a', '.aac', '.flac'],
+    'MAX_SIZE': 2 * 1024 ** 3,
+    # Bytes read from the request and written at a time
+    'READ_SIZE': 1024 * 1024,
+    # Seconds a writer holds an upload without renewing its lease
+    'LEASE_SECONDS': 60,
+    # Hours after which unfinished uploads are deleted by prune_uploads
+    'EXPIRE_HOURS': 24,
+}
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+
+
+def upload_settings():
+    return {**DEFAULT_AUDIO_UPLOADS, **getattr(settings, 'AUDIO_UPLOADS', {})}
+
+
+class UploadError(Exception):
+    """A chunk that can't be accepted, with the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def upload_name(upload):
+    """The file's path in storage: audio/<year>/<month>/<upload id><extension>"""
+    _, extension = os.path.splitext(upload.filename)
+    created = upload.created_at or timezone.now()
+    return f"{upload_settings()['DIRECTORY']}/{created:%Y/%m}/{upload.pk}{extension.lower()}"
+
+
+def create_file(upload):
+    """Create the upload's empty file at its final path"""
+    upload.file.name = upload_name(upload)
+    path = default_storage.path(upload.file.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'xb').close()
+
+
+def parse_checksum(header):
+    """Parse ``Upload-Checksum: sha256 <base64 digest>`` into the digest bytes"""
+    try:
+        algorithm, encoded = header.split()
+        digest = base64.b64decode(encoded, validate=True)
+    except (ValueError, binascii.Error):
+        raise UploadError("Upload-Checksum must be 'sha256 <base64 digest>'")
+    if algorithm.lower() != 'sha256' or len(digest) != hashlib.sha256().digest_size:
+        raise UploadError("Only sha256 chunk checksums are supported")
+    return digest
+
+
+def file_hasher(path, offset, read_size):
+    """The SHA-256 of the first ``offset`` bytes of a file, read a block at a time"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        remaining = offset
+        while remaining:
+            block = file.read(min(read_size, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+# --- Receiving chunks ---
+
+class Lease:
+    """A writer's lease on an upload, taken by claim()"""
+
+    def __init__(self, upload, token, renewed):
+        from .models import AudioUpload
+
+        self.upload = upload
+        self.leased = AudioUpload.objects.filter(pk=upload.pk, lease_token=token)
+        self.seconds = upload_settings()['LEASE_SECONDS']
+        self.renewed = renewed
+
+    def hold(self):
+        """
+        Make sure the lease is still this writer's before it touches the file.
+        A lease renewed less than half its length ago can't have run out, so
+        only then is it renewed, conditional on the token.
+        """
+        if time.monotonic() - self.renewed < self.seconds / 2:
+            return
+        renewed = time.monotonic()
+        if not self.leased.update(locked_until=timezone.now() + datetime.timedelta(seconds=self.seconds)):
+            # The file is the new writer's now: leave it alone
+            raise lease_lost(self.upload)
+        self.renewed = renewed
+
+    def release(self, offset):
+        """Store the writer's offset and give up the lease; False if it was taken over"""
+        return bool(self.leased.update(offset=offset, locked_until=None, lease_token=None))
+
+
+def claim(upload, offset):
+    """Take the writer lease on an upload whose stored offset is ``offset``"""
+    from .models import AudioUpload
+
+    renewed = time.monotonic()
+    now = timezone.now()
+    token = uuid.uuid4()
+    claimed = AudioUpload.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        pk=upload.pk, offset=offset, status=AudioUpload.Status.UPLOADING,
+    ).update(
+        locked_until=now + datetime.timedelta(seconds=upload_settings()['LEASE_SECONDS']),
+        lease_token=token,
+    )
+    if not claimed:
+        raise UploadError("Upload-Offset doesn't match the upload, or another chunk is being written", status=409)
+    return Lease(upload, token, renewed)
+
+
+def lease_lost(upload):
+    """The error of a writer whose lease was taken over, with the new writer's offset"""
+    from .models import AudioUpload
+
+    upload.offset = AudioUpload.objects.values_list('offset', flat=True).get(pk=upload.pk)
+    return UploadError("Another request took over the upload while this chunk was written", status=409)
+
+
+def receive_chunk(upload, stream, offset, length, checksum=None):
+    """
+    Stream a chunk of ``length`` bytes starting at ``offset`` into the
+    upload's file, and complete the upload if it was the last one.
+    Returns the new offset.
+    """
+    from .models import AudioUpload
+
+    options = upload_settings()
+    if upload.status != AudioUpload.Status.UPLOADING:
+        raise UploadError("The upload is finished", status=409)
+    if offset != upload.offset:
+        raise UploadError(f"Upload-Offset must be {upload.offset}", status=409)
+    if offset + length > upload.size:
+        raise UploadError(f"The chunk ends past the upload's size of {upload.size} bytes", status=413)
+
+    lease = claim(upload, offset)
+    path = default_storage.path(upload.file.name)
+    received = 0
+    try:
+        chunk = hashlib.sha256() if checksum is not None else None
+        with open(path, 'r+b') as file:
+            # Anything past the offset is left over from a chunk that wasn't kept
+            file.truncate(offset)
+            file.seek(offset)
+            while received < length:
+                try:
+                    block = stream.read(min(options['READ_SIZE'], length - received))
+                except (UnreadablePostError, OSError):
+                    block = b''
+                if not block:
+                    # The client went away: keep what arrived, unless it can't be checked
+                    break
+                # Reading may have taken longer than the lease
+                lease.hold()
+                file.write(block)
+                if chunk is not None:
+                    chunk.update(block)
+                received += len(block)
+
+            if chunk is not None and (received < length or chunk.digest() != checksum):
+                lease.hold()
+                file.truncate(offset)
+                received = 0
+                chunk = None
+            file.flush()
+            os.fsync(file.fileno())
+    finally:
+        kept = lease.release(offset + received)
+
+    if not kept:
+        raise lease_lost(upload)
+    upload.offset = offset + received
+    if checksum is not None and chunk is None:
+        raise UploadError("The chunk doesn't match its Upload-Checksum")
+    if upload.offset == upload.size:
+        complete(upload, path)
+    return upload.offset
+
+
+def complete(upload, path):
+    """Check the file on disk against its SHA-256 and finish the upload"""
+    from .models import AudioUpload
+
+    if file_hasher(path, upload.size, upload_settings()['READ_SIZE']).hexdigest() == upload.sha256:
+        upload.status = AudioUpload.Status.COMPLETE
+        upload.completed_at = timezone.now()
+        upload.save(update_fields=['status', 'completed_at', 'updated_at'])
+        return
+    upload.file.delete(save=False)
+    upload.status = AudioUpload.Status.FAILED
+    upload.save(update_fields=['file', 'status', 'updated_at'])
+    raise UploadError("The uploaded file doesn't match its SHA-256", status=422)
@@ -0,0 +1,15 @@
+# newsroom/urls.py
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from . import views
+
+router = DefaultRouter()
+router.register(r'stories', views.StoryViewSet)
+router.register(r'audio', views.AudioUploadViewSet)
+
+app_name = 'newsroom'
+
+urlpatterns = [
+    path('', include(router.urls)),
+]
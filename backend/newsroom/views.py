@@ -1,3 +1,152 @@
-from django.shortcuts import render
+# newsroom/views.py
+from django.db.models.functions import Length
+from django.http import Http404
+from django.urls import reverse
+from rest_framework import mixins, permissions, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
 
-# Create your views here.
+from accounts.models import CustomUser
+
+from .models import AudioUpload, Story
+from .rendering import refresh_rendering
+from .revisions import diff_revisions, revision_body
+from .serializers import AudioUploadSerializer, RevisionBodySerializer, StoryRevisionSerializer, StorySerializer
+from .uploads import CHUNK_CONTENT_TYPE, UploadError, parse_checksum, receive_chunk
+
+
+class NewsroomPermission(permissions.BasePermission):
+    """Permission class to check if user is newsroom staff"""
+
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.user_type == CustomUser.UserType.STAFF
+
+
+class StoryViewSet(viewsets.ModelViewSet):
+    """ViewSet for newsroom stories and their revision history"""
+    query_budget = {'list': 3, 'retrieve': 2, 'revisions': 4, 'revision': 4, 'diff': 5, '*': 8}
+    queryset = Story.objects.all()
+    serializer_class = StorySerializer
+    permission_classes = [NewsroomPermission]
+
+    def get_object(self):
+        return refresh_rendering([super().get_object()])[0]
+
+    def paginate_queryset(self, queryset):
+        # Stories rendered by an older renderer are re-rendered as they're read
+        page = super().paginate_queryset(queryset)
+        return refresh_rendering(page) if self.action == 'list' and page is not None else page
+
+    def perform_create(self, serializer):
+        serializer.save(author=self.request.user, editor=self.request.user)
+
+    def perform_update(self, serializer):
+        serializer.save(editor=self.request.user)
+
+    def story_id(self):
+        """The story's id, checking it exists without loading it"""
+        lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            story_id = self.get_queryset().filter(pk=lookup).values_list('pk', flat=True).first()
+        except (TypeError, ValueError):
+            story_id = None
+        if story_id is None:
+            raise Http404
+        return story_id
+
+    @action(detail=True, methods=['get'])
+    def revisions(self, request, pk=None):
+        """List a story's revisions, newest first, without their contents"""
+        revisions = (
+            self.get_object().revisions.defer('data').annotate(stored_bytes=Length('data')).order_by('-number')
+        )
+        page = self.paginate_queryset(revisions)
+        serializer = StoryRevisionSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'], url_path='revisions/(?P<number>[0-9]+)')
+    def revision(self, request, pk=None, number=None):
+        """Get one revision of a story, rebuilt from its snapshot and deltas"""
+        revision = revision_body(self.story_id(), int(number))
+        if revision is None:
+            raise Http404
+        return Response(RevisionBodySerializer(revision).data)
+
+    @action(detail=True, methods=['get'])
+    def diff(self, request, pk=None):
+        """
+        Diff two revisions: ``?from=<number>&to=<number>``. ``to`` defaults to
+        the latest revision and ``from`` to the one before ``to``.
+        """
+        story = self.get_object()
+        try:
+            second = int(request.query_params.get('to', story.revision_number))
+            first = int(request.query_params.get('from', second - 1))
+        except ValueError:
+            return Response({'error': 'Revision numbers must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+        diff = diff_revisions(story.pk, first, second)
+        if diff is None:
+            raise Http404
+        return Response(diff)
+
+
+class AudioUploadViewSet(
+    mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Chunked, resumable audio uploads (see newsroom/uploads.py). POST
+    creates an upload, PATCH sends a chunk, HEAD or GET tell where to
+    resume and DELETE abandons the upload.
+    """
+    query_budget = {'list': 3, 'retrieve': 2, 'create': 2, 'partial_update': 6, 'destroy': 3, '*': 8}
+    queryset = AudioUpload.objects.all()
+    serializer_class = AudioUploadSerializer
+    permission_classes = [NewsroomPermission]
+
+    def perform_create(self, serializer):
+        serializer.save(uploader=self.request.user)
+
+    def get_success_headers(self, data):
+        return {
+            'Location': self.request.build_absolute_uri(reverse('newsroom:audioupload-detail', args=[data['id']])),
+            'Upload-Offset': '0',
+        }
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Upload-Offset'] = str(response.data['offset'])
+        response['Upload-Length'] = str(response.data['size'])
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def partial_update(self, request, pk=None):
+        """Stream one chunk of the file, starting at the Upload-Offset header"""
+        if request.content_type.split(';')[0].strip() != CHUNK_CONTENT_TYPE:
+            return Response(
+                {'error': f'Chunks must be sent as {CHUNK_CONTENT_TYPE}'}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            )
+        try:
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Content-Length is required'}, status=status.HTTP_411_LENGTH_REQUIRED)
+
+        upload = self.get_object()
+        try:
+            try:
+                offset = int(request.headers['Upload-Offset'])
+            except (KeyError, ValueError):
+                raise UploadError('Upload-Offset must be a number of bytes')
+            if length <= 0:
+                raise UploadError('The chunk is empty')
+            checksum = request.headers.get('Upload-Checksum')
+            checksum = parse_checksum(checksum) if checksum else None
+            offset = receive_chunk(upload, request.stream, offset, length, checksum)
+        except UploadError as error:
+            return Response({'error': str(error)}, status=error.status, headers={'Upload-Offset': str(upload.offset)})
+        return Response(status=status.HTTP_204_NO_CONTENT, headers={'Upload-Offset': str(offset)})
+
+    def perform_destroy(self, instance):
+        instance.file.delete(save=False)
+        instance.delete()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RadioZoneConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'radio_zone'
+
+    def ready(self):
+        import radio_zone.signals
@@ -0,0 +1,138 @@
+# radio_zone/fanout.py
+"""
+Publish-time fan-out of newsroom stories to station feeds.
+
+Rather than filtering every story against a station's entitlements each
+time the station polls, publishing a story writes one FeedEntry per
+station entitled to it. The stations are resolved in one query on the
+entitlement mask index (RadioStation.objects.eligible_for) and the
+entries bulk inserted in batches, so reading a feed is a range scan of
+the station's entries.
+
+Feeds are kept in step incrementally, touching only the entries that
+differ:
+
+- publishing, unpublishing or changing the language, category or
+  religion of a story re-fans out that story (fan_out_story);
+- creating a station or changing its access flags or is_active re-fans
+  out to that station (fan_out_stations), filling in the stories
+  published in the last BACKFILL_DAYS.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.entitlements import entitled_values
+
+DEFAULT_STATION_FEEDS = {
+    # Rows per INSERT
+    'BATCH_SIZE': 500,
+    # How far back the feed of a newly entitled station is filled; None for every story
+    'BACKFILL_DAYS': 30,
+}
+
+# Story fields copied into feed entries or deciding who gets them
+FEED_FIELDS = ('status', 'published_at', 'language', 'category', 'religion')
+
+
+def feed_settings():
+    return {**DEFAULT_STATION_FEEDS, **getattr(settings, 'STATION_FEEDS', {})}
+
+
+def insert_entries(entries, batch_size=None):
+    """Bulk insert a list of FeedEntry rows in batches, returning how many were written"""
+    from .models import FeedEntry
+
+    batch_size = batch_size or feed_settings()['BATCH_SIZE']
+    for start in range(0, len(entries), batch_size):
+        # An entry written meanwhile by a concurrent fan-out is already right
+        FeedEntry.objects.bulk_create(entries[start:start + batch_size], ignore_conflicts=True)
+    return len(entries)
+
+
+def fan_out_story(story):
+    """
+    Make the story's feed entries match its status and descriptor.
+    Returns (entries added, entries removed).
+    """
+    from accounts.models import RadioStation
+    from newsroom.models import Story
+
+    from .models import FeedEntry
+
+    entries = FeedEntry.objects.filter(story=story)
+    if story.status != Story.Status.PUBLISHED:
+        return 0, entries.delete()[0]
+
+    stations = RadioStation.objects.eligible_for(
+        language=story.language, category=story.category, religion=story.religion,
+    )
+    with transaction.atomic():
+        removed = entries.exclude(station__in=stations).delete()[0]
+        copied = {field: getattr(story, field) for field in FEED_FIELDS if field != 'status'}
+        entries.exclude(**copied).update(**copied)
+        station_ids = list(stations.exclude(feed_entries__story=story).values_list('pk', flat=True))
+        added = insert_entries([FeedEntry(station_id=pk, story=story, **copied) for pk in station_ids])
+    return added, removed
+
+
+def fan_out_stations(station_ids):
+    """
+    Make the feeds of these stations match their entitlements.
+    Returns (entries added, entries removed).
+    """
+    from accounts.models import RadioStation
+
+    added = removed = 0
+    stations = RadioStation.objects.filter(pk__in=station_ids).values_list('pk', 'is_active', 'entitlement_mask')
+    for station_id, is_active, mask in stations:
+        station_added, station_removed = fan_out_station(station_id, is_active, mask)
+        added += station_added
+        removed += station_removed
+    return added, removed
+
+
+def fan_out_station(station_id, is_active, mask):
+    """Make one station's feed match its entitlement mask. Returns (entries added, entries removed)."""
+    from newsroom.models import Story
+
+    from .models import FeedEntry
+
+    entries = FeedEntry.objects.filter(station_id=station_id)
+    if not is_active:
+        return 0, entries.delete()[0]
+
+    languages, categories, religions = entitled_values(mask)
+    entitled = {'language__in': languages, 'category__in': categories, 'religion__in': religions}
+    stories = Story.objects.filter(status=Story.Status.PUBLISHED, **entitled)
+    backfill_days = feed_settings()['BACKFILL_DAYS']
+    if backfill_days is not None:
+        stories = stories.filter(published_at__gte=timezone.now() - datetime.timedelta(days=backfill_days))
+    with transaction.atomic():
+        removed = entries.exclude(**entitled).delete()[0]
+        missing = (
+            stories.exclude(feed_entries__station_id=station_id).order_by()
+            .values_list('pk', 'published_at', 'language', 'category', 'religion')
+        )
+        added = insert_entries([
+            FeedEntry(
+                station_id=station_id, story_id=pk, published_at=published_at,
+                language=language, category=category, religion=religion,
+            )
+            for pk, published_at, language, category, religion in missing
+        ])
+    return added, removed
+
+
+def rebuild_feeds():
+    """Fan every published story out to every station again. Returns (entries added, entries removed)."""
+    from accounts.models import RadioStation
+    from newsroom.models import Story
+
+    from .models import FeedEntry
+
+    removed = FeedEntry.objects.exclude(story__status=Story.Status.PUBLISHED).delete()[0]
+    added, unentitled = fan_out_stations(RadioStation.objects.values_list('pk', flat=True))
+    return added, removed + unentitled
@@ -0,0 +1,12 @@
+# radio_zone/management/commands/rebuild_feeds.py
+from django.core.management.base import BaseCommand
+
+from radio_zone.fanout import rebuild_feeds
+
+
+class Command(BaseCommand):
+    help = "Fan published stories out to the feeds of every station again, fixing any drift"
+
+    def handle(self, *args, **options):
+        added, removed = rebuild_feeds()
+        self.stdout.write(self.style.SUCCESS(f"Added {added} and removed {removed} feed entries."))
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('accounts', '0012_activityevent'),
+        ('newsroom', '0003_story_publishing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_at', models.DateTimeField()),
+                ('language', models.CharField(choices=[('ENGLISH', 'English'), ('AFRIKAANS', 'Afrikaans'), ('XHOSA', 'Xhosa')], max_length=20)),
+                ('category', models.CharField(choices=[('NEWS_STORIES', 'News Stories'), ('NEWS_BULLETINS', 'News Bulletins'), ('SPORT', 'Sport'), ('FINANCE', 'Finance'), ('SPECIALTY', 'Specialty')], max_length=20)),
+                ('religion', models.CharField(choices=[('GENERAL', 'General'), ('CHRISTIAN', 'Christian'), ('MUSLIM', 'Muslim')], max_length=20)),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='accounts.radiostation')),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='newsroom.story')),
+            ],
+            options={
+                'verbose_name_plural': 'feed entries',
+                'ordering': ['-published_at', '-story_id'],
+                'indexes': [models.Index(fields=['station', '-published_at', '-story'], name='feed_station_published_idx')],
+                'constraints': [models.UniqueConstraint(fields=('station', 'story'), name='feed_entry_station_story_unique')],
+            },
+        ),
+    ]
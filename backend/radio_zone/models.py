@@ -1,3 +1,34 @@
+# radio_zone/models.py
 from django.db import models
 
-# Create your models here.
+from accounts.entitlements import Category, Language, Religion
+from accounts.models import RadioStation
+from newsroom.models import Story
+
+
+class FeedEntry(models.Model):
+    """
+    A published story in one station's feed, written when the story is
+    published (see radio_zone/fanout.py). The story's publish time and
+    descriptor are copied in, so a station's feed is read from this table
+    alone, along one index.
+    """
+    station = models.ForeignKey(RadioStation, on_delete=models.CASCADE, related_name='feed_entries')
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='feed_entries')
+    published_at = models.DateTimeField()
+    language = models.CharField(max_length=20, choices=Language.choices)
+    category = models.CharField(max_length=20, choices=Category.choices)
+    religion = models.CharField(max_length=20, choices=Religion.choices)
+
+    class Meta:
+        verbose_name_plural = 'feed entries'
+        ordering = ['-published_at', '-story_id']
+        constraints = [
+            models.UniqueConstraint(fields=['station', 'story'], name='feed_entry_station_story_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['station', '-published_at', '-story'], name='feed_station_published_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.story_id} for {self.station_id}'
@@ -0,0 +1,28 @@
+# radio_zone/serializers.py
+from rest_framework import serializers
+
+from .models import FeedEntry
+
+
+class FeedEntrySerializer(serializers.ModelSerializer):
+    """A story in a station's feed. ``fields`` limits the output to the named fields."""
+    id = serializers.UUIDField(source='story_id', read_only=True)
+    title = serializers.CharField(source='story.title', read_only=True)
+    word_count = serializers.IntegerField(source='story.word_count', read_only=True)
+    read_seconds = serializers.IntegerField(source='story.read_seconds', read_only=True)
+    plain_text = serializers.CharField(source='story.plain_text', read_only=True)
+    rendered_html = serializers.CharField(source='story.rendered_html', read_only=True)
+    updated_at = serializers.DateTimeField(source='story.updated_at', read_only=True)
+
+    class Meta:
+        model = FeedEntry
+        fields = [
+            'id', 'title', 'published_at', 'updated_at', 'language', 'category', 'religion',
+            'word_count', 'read_seconds', 'plain_text', 'rendered_html',
+        ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
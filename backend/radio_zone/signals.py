@@ -0,0 +1,35 @@
+# radio_zone/signals.py
+"""Keep station feeds in step with stories and station entitlements"""
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from accounts.entitlements import entitlements_changed
+from accounts.models import RadioStation
+from newsroom.models import Story
+
+from .fanout import FEED_FIELDS, fan_out_station, fan_out_stations, fan_out_story
+
+
+@receiver(pre_save, sender=Story)
+def note_feed_changes(sender, instance, raw=False, **kwargs):
+    """Remember whether the save changes which feeds the story is in, or how"""
+    if instance._state.adding:
+        instance._fan_out = instance.status == Story.Status.PUBLISHED
+    else:
+        instance._fan_out = instance.has_changed(*FEED_FIELDS)
+
+
+@receiver(post_save, sender=Story)
+def story_saved(sender, instance, raw=False, **kwargs):
+    if not raw and getattr(instance, '_fan_out', False):
+        fan_out_story(instance)
+
+
+@receiver(entitlements_changed, sender=RadioStation)
+def station_entitlements_changed(sender, station_ids, stations=None, **kwargs):
+    if stations is None:
+        fan_out_stations(station_ids)
+        return
+    # Saved instances carry their new entitlements already
+    for station in stations:
+        fan_out_station(station.pk, station.is_active, station.entitlement_mask)
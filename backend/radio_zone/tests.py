@@ -1,3 +1,210 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from accounts.entitlements import Category, Language, Religion
+from accounts.models import CustomUser, RadioStation
+from newsroom.models import Story
+
+from .fanout import rebuild_feeds
+from .models import FeedEntry
+
+
+def feed(station):
+    return set(FeedEntry.objects.filter(station=station).values_list('story__title', flat=True))
+
+
+@override_settings(STATION_FEEDS={'BATCH_SIZE': 7, 'BACKFILL_DAYS': 30})
+class FanOutTests(TestCase):
+    """Publishing writes feed entries for the entitled stations, and only them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.english = RadioStation.objects.create(name='English FM', access_news_stories=True)
+        cls.afrikaans = RadioStation.objects.create(
+            name='Afrikaans FM', access_english=False, access_afrikaans=True, access_news_stories=True,
+        )
+        cls.christian = RadioStation.objects.create(
+            name='Christian FM', access_news_stories=True, access_sport=True, religion_access='GENERAL_PLUS_CHRISTIAN',
+        )
+        cls.sport = RadioStation.objects.create(name='Sport FM', access_sport=True)
+
+    def publish(self, title, **fields):
+        story = Story(title=title, body=f'<p>{title}</p>', status=Story.Status.PUBLISHED, **fields)
+        story.save()
+        return story
+
+    def test_publish_fans_out_to_entitled_stations(self):
+        self.publish('Roads')
+        self.publish('Derby', category=Category.SPORT)
+        self.publish('Sermon', religion=Religion.CHRISTIAN)
+        Story.objects.create(title='Draft')
+
+        self.assertEqual(feed(self.english), {'Roads'})
+        self.assertEqual(feed(self.afrikaans), set())
+        self.assertEqual(feed(self.christian), {'Roads', 'Derby', 'Sermon'})
+        self.assertEqual(feed(self.sport), {'Derby'})
+
+    def test_fan_out_is_set_based(self):
+        RadioStation.objects.bulk_create(
+            RadioStation(name=f'Station {n}', access_news_stories=True) for n in range(40)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            story = self.publish('Roads')
+        inserts = [query for query in queries if 'INTO "radio_zone_feedentry"' in query['sql']]
+        self.assertEqual(len(inserts), 6)
+        self.assertLess(len(queries), 20)
+        self.assertEqual(story.feed_entries.count(), 42)
+
+    def test_story_changes_re_fan_out(self):
+        story = self.publish('Roads')
+        published_at = story.published_at
+
+        story.language = Language.AFRIKAANS
+        story.save()
+        self.assertEqual(feed(self.english), set())
+        self.assertEqual(feed(self.afrikaans), {'Roads'})
+
+        # Edits that don't change who gets the story leave the entries alone
+        story.body = '<p>Roads closed</p>'
+        with CaptureQueriesContext(connection) as queries:
+            story.save()
+        self.assertFalse(any('radio_zone_feedentry' in query['sql'] for query in queries))
+
+        story.status = Story.Status.DRAFT
+        story.save()
+        self.assertFalse(FeedEntry.objects.exists())
+
+        story.status = Story.Status.PUBLISHED
+        story.save()
+        self.assertGreater(FeedEntry.objects.get(station=self.afrikaans).published_at, published_at)
+
+    def test_entitlement_changes_re_fan_out(self):
+        self.publish('Roads')
+        self.publish('Derby', category=Category.SPORT)
+        old = self.publish('Archive')
+        Story.objects.filter(pk=old.pk).update(published_at=timezone.now() - datetime.timedelta(days=60))
+        FeedEntry.objects.filter(story=old).delete()
+
+        self.sport.access_news_stories = True
+        self.sport.save()
+        self.assertEqual(feed(self.sport), {'Roads', 'Derby'})
+
+        RadioStation.objects.filter(pk=self.sport.pk).update(access_sport=False)
+        self.assertEqual(feed(self.sport), {'Roads'})
+
+        RadioStation.objects.filter(pk=self.english.pk).update(is_active=False)
+        self.assertEqual(feed(self.english), set())
+
+        station = RadioStation.objects.create(name='New FM', access_news_stories=True, access_sport=True)
+        self.assertEqual(feed(station), {'Roads', 'Derby'})
+
+    def test_rebuild_fixes_drift(self):
+        roads = self.publish('Roads')
+        self.publish('Derby', category=Category.SPORT)
+        FeedEntry.objects.filter(story=roads).delete()
+        Story.objects.filter(category=Category.SPORT).update(status=Story.Status.DRAFT)
+
+        added, removed = rebuild_feeds()
+        self.assertEqual((added, removed), (2, 2))
+        self.assertEqual(feed(self.christian), {'Roads'})
+        self.assertEqual(feed(self.sport), set())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], QUERY_BUDGET_STRICT=True)
+class StationFeedAPITests(TestCase):
+    """Radio station users page through their station's feed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.station = RadioStation.objects.create(
+            name='Main FM', access_afrikaans=True, access_news_stories=True, access_sport=True,
+        )
+        cls.other = RadioStation.objects.create(name='Other FM', access_news_stories=True)
+        cls.user = CustomUser.objects.create_user(
+            'radio@example.com', 'password', user_type=CustomUser.UserType.RADIO, radio_station=cls.station,
+        )
+        cls.journalist = CustomUser.objects.create_user('journalist@example.com', 'password')
+        start = timezone.now() - datetime.timedelta(hours=1)
+        cls.stories = []
+        for n in range(7):
+            story = Story(
+                title=f'Story {n}', body=f'<p>Story {n} body</p>', status=Story.Status.PUBLISHED,
+                language=Language.AFRIKAANS if n % 3 == 0 else Language.ENGLISH,
+                category=Category.SPORT if n % 2 else Category.NEWS_STORIES,
+            )
+            story.save()
+            cls.stories.append(story)
+        # Publish times a minute apart, two of them equal
+        for n, story in enumerate(cls.stories):
+            minute = min(n, 5)
+            Story.objects.filter(pk=story.pk).update(published_at=start + datetime.timedelta(minutes=minute))
+            FeedEntry.objects.filter(story=story).update(published_at=start + datetime.timedelta(minutes=minute))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+        self.url = reverse('radio_zone:feed')
+
+    def test_pages_through_the_feed(self):
+        titles = []
+        url = self.url + '?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            titles += [entry['title'] for entry in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(len(titles), 7)
+        self.assertEqual(set(titles[:2]), {'Story 5', 'Story 6'})
+        self.assertEqual(titles[2:], ['Story 4', 'Story 3', 'Story 2', 'Story 1', 'Story 0'])
+        self.assertIsNone(response.data['total_count'])
+
+    def test_sparse_fields_and_filters(self):
+        response = self.client.get(self.url, {'fields': 'id,title', 'language': 'afrikaans', 'category': 'sport'})
+        self.assertEqual(response.data['results'], [{'id': str(self.stories[3].pk), 'title': 'Story 3'}])
+
+        response = self.client.get(self.url, {'fields': 'id,plain_text', 'language': 'english,afrikaans'})
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertEqual(response.data['results'][-1]['plain_text'], 'Story 0 body')
+
+        self.assertEqual(self.client.get(self.url, {'fields': 'body'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'category': 'weather'}).status_code, 400)
+
+    def test_only_requested_story_columns_are_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'fields': 'id,title'})
+        sql = queries[-1]['sql']
+        self.assertIn('"newsroom_story"."title"', sql)
+        self.assertNotIn('"newsroom_story"."rendered_html"', sql)
+        self.assertNotIn('"newsroom_story"."body"', sql)
+
+    def test_if_none_match(self):
+        first = self.client.get(self.url, {'page_size': 3})
+        etag = first['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'page_size': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        # Only the page's keys and timestamps were read
+        feed_queries = [query['sql'] for query in queries if 'radio_zone_feedentry' in query['sql']]
+        self.assertEqual(len(feed_queries), 1)
+        self.assertNotIn('"newsroom_story"."title"', feed_queries[0])
+
+        story = Story.objects.get(pk=self.stories[6].pk)
+        story.body = '<p>Updated</p>'
+        story.save()
+        response = self.client.get(self.url, {'page_size': 3}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_radio_users_only(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.journalist).access_token}')
+        self.assertEqual(client.get(self.url).status_code, 403)
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
@@ -0,0 +1,9 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'radio_zone'
+
+urlpatterns = [
+    path('feed/', views.StationFeedView.as_view(), name='feed'),
+]
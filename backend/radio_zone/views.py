@@ -1,3 +1,137 @@
-from django.shortcuts import render
+# radio_zone/views.py
+import hashlib
 
-# Create your views here.
+from django.utils.cache import get_conditional_response
+from rest_framework import generics, permissions
+from rest_framework.exceptions import ValidationError
+
+from accounts.conditional import with_validators
+from accounts.entitlements import CATEGORY_FIELDS, LANGUAGE_FIELDS
+from accounts.models import CustomUser
+from accounts.pagination import COUNT_NONE, KeysetPagination
+
+from .models import FeedEntry
+from .serializers import FeedEntrySerializer
+
+# Filter values are the access field names without "access_", e.g. ?language=xhosa
+LANGUAGE_FILTERS = {field.removeprefix('access_'): language for language, field in LANGUAGE_FIELDS.items()}
+CATEGORY_FILTERS = {field.removeprefix('access_'): category for category, field in CATEGORY_FIELDS.items()}
+
+# Story columns each feed field reads; the rest stay on disk
+STORY_COLUMNS = {
+    'title': 'story__title',
+    'word_count': 'story__word_count',
+    'read_seconds': 'story__read_seconds',
+    'plain_text': 'story__plain_text',
+    'rendered_html': 'story__rendered_html',
+}
+
+
+class RadioStationPermission(permissions.BasePermission):
+    """Permission class to check if user is radio station staff"""
+
+    def has_permission(self, request, view):
+        return (
+            request.user.is_authenticated and
+            request.user.user_type == CustomUser.UserType.RADIO and
+            request.user.radio_station_id is not None
+        )
+
+
+class FeedPagination(KeysetPagination):
+    """Newest published first. Feeds don't count their entries unless asked to."""
+    ordering = ('-published_at', '-story_id')
+    default_count_mode = COUNT_NONE
+
+
+class StationFeedView(generics.ListAPIView):
+    """
+    The feed of the requesting user's radio station, newest first.
+
+    - ``?fields=id,title,published_at`` returns only the named fields.
+    - ``?language=english,afrikaans`` and ``?category=sport`` filter on the
+      station's access fields (without the ``access_`` prefix).
+    - Pages are keyset paginated: follow ``next`` to go back in time.
+    - Responses carry an ETag; a poll with a matching ``If-None-Match``
+      gets an empty 304. The ETag comes from a narrow query of the page's
+      keys and timestamps, and the entries are only loaded when it changed.
+    """
+    query_budget = 3
+    serializer_class = FeedEntrySerializer
+    pagination_class = FeedPagination
+    permission_classes = [RadioStationPermission]
+
+    def requested_fields(self):
+        value = self.request.query_params.get('fields')
+        if not value:
+            return None
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = sorted(set(fields) - set(FeedEntrySerializer.Meta.fields))
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}"})
+        return fields
+
+    def choices(self, param, filters):
+        value = self.request.query_params.get(param)
+        if not value:
+            return None
+        names = [name.strip().lower() for name in value.split(',') if name.strip()]
+        unknown = sorted(set(names) - set(filters))
+        if unknown:
+            raise ValidationError({param: f"Unknown values: {', '.join(unknown)}. Choose from: {', '.join(filters)}"})
+        return [filters[name] for name in names]
+
+    def feed_entries(self):
+        """The station's entries, filtered by the query parameters"""
+        queryset = FeedEntry.objects.filter(station_id=self.request.user.radio_station_id)
+        languages = self.choices('language', LANGUAGE_FILTERS)
+        if languages is not None:
+            queryset = queryset.filter(language__in=languages)
+        categories = self.choices('category', CATEGORY_FILTERS)
+        if categories is not None:
+            queryset = queryset.filter(category__in=categories)
+        return queryset
+
+    def get_queryset(self):
+        fields = self.requested_fields()
+        columns = [
+            column for name, column in STORY_COLUMNS.items() if fields is None or name in fields
+        ]
+        return (
+            self.feed_entries()
+            .select_related('story')
+            .only('published_at', 'language', 'category', 'religion', 'story__updated_at', *columns)
+        )
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def feed_etag(self, keys):
+        """Identify the page by what's on it, so any change to it changes the ETag"""
+        digest = hashlib.md5(f'{self.request.user.radio_station_id}:{self.request.get_full_path()}'.encode('utf-8'))
+        for key in keys:
+            stamps = f'{key.published_at.timestamp()}:{key.story__updated_at.timestamp()}'
+            digest.update(f'|{key.story_id}:{stamps}'.encode('utf-8'))
+        digest.update(f'|{self.paginator.has_next}:{self.paginator.has_previous}'.encode('utf-8'))
+        return f'"feed-{digest.hexdigest()}"'
+
+    def list(self, request, *args, **kwargs):
+        # Polls mostly end in a 304, which only needs the page's keys and timestamps
+        keys = self.paginate_queryset(
+            self.filter_queryset(self.feed_entries())
+            .values_list('story_id', 'published_at', 'story__updated_at', named=True)
+        )
+        etag = self.feed_etag(keys)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return with_validators(not_modified, etag, None)
+
+        entries = {
+            entry.story_id: entry
+            for entry in self.get_queryset().filter(story_id__in=[key.story_id for key in keys])
+        }
+        # An entry removed since the keys were read is left out
+        page = [entries[key.story_id] for key in keys if key.story_id in entries]
+        serializer = self.get_serializer(page, many=True)
+        return with_validators(self.get_paginated_response(serializer.data), etag, None)